@@ -0,0 +1,228 @@
+"""Population analytics served from rollup tables (migration 10).
+
+Triggers keep analytics_counts current as records are inserted; reads never
+touch medical_records. Archiving a record doesn't change the counts, so
+rebuild() recomputes everything from the hot table and the archive
+partitions, in bounded batches:
+
+    python analytics.py rebuild --database database.db --archive-dir archive
+"""
+import argparse
+import logging
+import threading
+from datetime import date, timedelta
+
+import archive
+from database import connect
+
+log = logging.getLogger(__name__)
+
+def week_start(day):
+    return day - timedelta(days=day.weekday())
+
+def summary(db, today=None, top=10, weeks=8):
+    """Everything /admin/analytics shows; each part is one index lookup."""
+    monday = week_start(today or date.today()).isoformat()
+    total = db.execute(
+        "SELECT count FROM analytics_counts WHERE metric='records' AND key=''"
+    ).fetchone()
+    blood = db.execute(
+        "SELECT key, count FROM analytics_counts WHERE metric='blood_group' AND count > 0 ORDER BY key"
+    ).fetchall()
+    diagnoses = db.execute("""
+        SELECT key, count FROM analytics_counts
+        WHERE metric='diagnosis' AND count > 0
+        ORDER BY count DESC
+        LIMIT ?
+    """, (top,)).fetchall()
+    visits = db.execute("""
+        SELECT key, count FROM analytics_counts
+        WHERE metric='visit_week' AND key >= ? AND count > 0
+        ORDER BY key
+        LIMIT ?
+    """, (monday, weeks)).fetchall()
+    rebuilding = db.execute("SELECT 1 FROM analytics_state WHERE key='rebuild_upto'").fetchone()
+    return {
+        "records": total["count"] if total else 0,
+        "blood_groups": {row["key"]: row["count"] for row in blood},
+        "top_diagnoses": [{"diagnosis": row["key"], "count": row["count"]} for row in diagnoses],
+        "upcoming_visits": [{"week": row["key"], "count": row["count"]} for row in visits],
+        "rebuilding": rebuilding is not None,
+    }
+
+def merge(summaries, top=10, weeks=8):
+    """Add up summary() results of several shards.
+
+    Each shard must be summarised with top=-1 (all diagnoses) for the
+    combined top list to be exact; ``weeks`` may be passed through as is.
+    """
+    blood, diagnoses, visits = {}, {}, {}
+    for part in summaries:
+        for key, count in part["blood_groups"].items():
+            blood[key] = blood.get(key, 0) + count
+        for row in part["top_diagnoses"]:
+            diagnoses[row["diagnosis"]] = diagnoses.get(row["diagnosis"], 0) + row["count"]
+        for row in part["upcoming_visits"]:
+            visits[row["week"]] = visits.get(row["week"], 0) + row["count"]
+    ranked = sorted(diagnoses.items(), key=lambda item: (-item[1], item[0]))
+    return {
+        "records": sum(part["records"] for part in summaries),
+        "blood_groups": dict(sorted(blood.items())),
+        "top_diagnoses": [{"diagnosis": k, "count": n} for k, n in (ranked if top < 0 else ranked[:top])],
+        "upcoming_visits": [{"week": k, "count": visits[k]} for k in sorted(visits)[:weeks]],
+        "rebuilding": any(part["rebuilding"] for part in summaries),
+    }
+
+def compact(db, today=None):
+    """Drop empty counters and weeks that are no longer upcoming. Returns rows removed."""
+    monday = week_start(today or date.today()).isoformat()
+    removed = db.execute("""
+        DELETE FROM analytics_counts
+        WHERE count <= 0 OR (metric='visit_week' AND key < ?)
+    """, (monday,)).rowcount
+    db.commit()
+    return removed
+
+# -------------------- REBUILD --------------------
+
+def _accumulate(db, table, low, high, monday):
+    # Counts for ids in (low, high] are added on top of whatever the triggers
+    # wrote for rows inserted since the rebuild started.
+    db.execute(f"""
+        INSERT INTO analytics_counts (metric, key, count)
+        SELECT * FROM (
+            SELECT 'records', '', COUNT(*) FROM {table} WHERE id > :low AND id <= :high
+            UNION ALL
+            SELECT 'diagnosis', lower(trim(diagnosis)) AS k, COUNT(*) FROM {table}
+            WHERE id > :low AND id <= :high AND k != '' GROUP BY k
+            UNION ALL
+            SELECT 'visit_week', date(next_visit, 'weekday 0', '-6 days') AS k, COUNT(*) FROM {table}
+            WHERE id > :low AND id <= :high AND k >= :monday GROUP BY k
+        ) WHERE true
+        ON CONFLICT (metric, key) DO UPDATE SET count = count + excluded.count
+    """, {"low": low, "high": high, "monday": monday})
+    # Never let an older record overwrite a newer blood group
+    db.execute(f"""
+        INSERT INTO analytics_worker_blood (health_uuid, blood_group, record_id)
+        SELECT health_uuid, upper(trim(blood_group)), id FROM {table}
+        WHERE id > ? AND id <= ? AND upper(trim(blood_group)) != ''
+        ORDER BY id
+        ON CONFLICT (health_uuid) DO UPDATE SET blood_group = excluded.blood_group, record_id = excluded.record_id
+        WHERE excluded.record_id > analytics_worker_blood.record_id
+    """, (low, high))
+
+def _scan(db, table, high, batch_size, monday):
+    low = scanned = 0
+    while low < high:
+        upper, count = db.execute(f"""
+            SELECT MAX(id), COUNT(*) FROM (
+                SELECT id FROM {table} WHERE id > ? AND id <= ? ORDER BY id LIMIT ?
+            )
+        """, (low, high, batch_size)).fetchone()
+        if not count:
+            break
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            _accumulate(db, table, low, upper, monday)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        low, scanned = upper, scanned + count
+    return scanned
+
+def rebuild(db, batch_size=10000, today=None, archive_dir=None):
+    """Recompute every rollup from medical_records and the archives in ``archive_dir``.
+
+    Returns the records scanned. Each batch is its own short transaction over
+    an id range, so memory stays bounded by ``batch_size`` and writers are only
+    blocked one batch at a time. Don't run archive.py at the same time: a
+    record moving mid-rebuild may be counted twice or not at all.
+    """
+    monday = week_start(today or date.today()).isoformat()
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        db.execute("DELETE FROM analytics_counts")
+        db.execute("DELETE FROM analytics_worker_blood")
+        high = db.execute("SELECT COALESCE(MAX(id), 0) FROM medical_records").fetchone()[0]
+        db.execute("INSERT OR REPLACE INTO analytics_state (key, value) VALUES ('rebuild_upto', ?)", (high,))
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    scanned = 0
+    for schema in archive.partitions(db, archive_dir) if archive_dir else ():
+        table = f"{schema}.medical_records"
+        top = db.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}").fetchone()[0]
+        scanned += _scan(db, table, top, batch_size, monday)
+    scanned += _scan(db, "main.medical_records", high, batch_size, monday)
+
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        db.execute("DELETE FROM analytics_counts WHERE metric='blood_group'")
+        db.execute("""
+            INSERT INTO analytics_counts (metric, key, count)
+            SELECT 'blood_group', blood_group, COUNT(*) FROM analytics_worker_blood GROUP BY blood_group
+        """)
+        db.execute("DELETE FROM analytics_state WHERE key='rebuild_upto'")
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return scanned
+
+# -------------------- COMPACTION --------------------
+
+class Compactor:
+    def __init__(self, path, interval=3600.0):
+        self.path = path
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def run_once(self, today=None):
+        db = connect(self.path)
+        try:
+            return compact(db, today)
+        finally:
+            db.close()
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception:
+                log.exception("analytics compaction failed")
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, name="analytics-compactor", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["rebuild", "compact"])
+    parser.add_argument("--database", default="database.db")
+    parser.add_argument("--archive-dir", default="archive", help="ARCHIVE_DIR of the app")
+    parser.add_argument("--batch-size", type=int, default=10000)
+    args = parser.parse_args(argv)
+
+    db = connect(args.database)
+    try:
+        if args.command == "rebuild":
+            print(f"rebuilt analytics from {rebuild(db, args.batch_size, archive_dir=args.archive_dir)} records")
+        else:
+            print(f"removed {compact(db)} stale counters")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
@@ -1,91 +1,299 @@
-from flask import Flask, request, jsonify, session, abort
+from flask import Flask, Response, request, jsonify, session, abort, g, stream_with_context
 from flask_cors import CORS
-import sqlite3
+import hashlib
+import itertools
+import json
+import os
+import threading
+import time
 import uuid
-import qrcode
 from datetime import datetime, date
 
-app = Flask(__name__, static_url_path="", static_folder="frontend")
+import analytics
+import archive
+import assets
+import bulk
+import cache
+import database
+import export
+import i18n
+import limits
+import metrics
+import migrations
+import outbox
+import pagination
+import qr
+import reminders
+import responses
+import search
+import shards
+import sync
+from database import connect, get_db
+
+# Static files are served from the fingerprinted build, see assets.py
+app = Flask(__name__, static_folder=None)
 app.secret_key = "hackathon-secret-key"
 CORS(app)
+database.init_app(app)
+shards.init_app(app)
+app.config.setdefault("FRONTEND_DIR", os.path.join(app.root_path, "frontend"))
+app.config.setdefault("CLIENT_DIST_DIR", os.path.join(app.root_path, "client", "dist"))
+app.config.setdefault("ASSET_BUILD_DIR", os.path.join(app.root_path, "static_build"))
+app.config.setdefault("LOCALES_DIR", os.path.join(app.root_path, "locales"))
+app.config.setdefault("DEFAULT_LANGUAGE", "en")
+app.config.setdefault("BULK_BATCH_SIZE", 500)
+app.config.setdefault("QR_CACHE_DIR", "qr_cache")
+app.config.setdefault("QR_CACHE_SIZE", 1024)
+app.config.setdefault("QR_SHEET_WORKERS", 4)
+app.config.setdefault("QR_SHEET_MAX", 1000)
+
+app.config.setdefault("PATIENT_CACHE_SIZE", 2048)
+app.config.setdefault("PATIENT_CACHE_TTL", 300)
+app.config.setdefault("HISTORY_PAGE_SIZE", 10)
+app.config.setdefault("HISTORY_PAGE_MAX", 100)
+app.config.setdefault("BATCH_LOOKUP_MAX", 200)
+app.config.setdefault("BATCH_RECORDS_MAX", 500)
+app.config.setdefault("NOTIFICATION_PAGE_SIZE", 50)
+app.config.setdefault("NOTIFICATION_PAGE_MAX", 200)
+app.config.setdefault("SEARCH_PAGE_SIZE", 20)
+app.config.setdefault("SEARCH_PAGE_MAX", 100)
+app.config.setdefault("SYNC_PAGE_SIZE", 500)
+app.config.setdefault("SYNC_PAGE_MAX", 2000)
+app.config.setdefault("OUTBOX_BATCH_SIZE", 100)
+app.config.setdefault("OUTBOX_INTERVAL", 1.0)
+app.config.setdefault("REMINDER_INTERVAL", 3600.0)
+app.config.setdefault("REMINDER_OFFSETS", reminders.OFFSETS)
+app.config.setdefault("ANALYTICS_COMPACT_INTERVAL", 3600.0)
+app.config.setdefault("EXPORT_CHUNK_SIZE", 5000)
+app.config.setdefault("ARCHIVE_DIR", "archive")
+app.config.setdefault("SLOW_QUERY_SECONDS", 0.1)
+# Profiling is opt-in: when enabled, a request sent with "X-Profile: 1" is
+# sampled and, if slower than PROFILE_MIN_SECONDS, dumped as collapsed stacks.
+app.config.setdefault("PROFILE_ENABLED", False)
+app.config.setdefault("PROFILE_DIR", "profiles")
+app.config.setdefault("PROFILE_MIN_SECONDS", 0.0)
+app.config.setdefault("PROFILE_INTERVAL", 0.005)
+# Admission control, see limits.py. Rules are (scope, per_second, burst)
+# where scope is "session" (the user, or the address when logged out), "ip",
+# "role" or "phone" (the number a login or signup is for). Rules keyed by
+# address are opt-in: behind a proxy, make sure remote_addr is the client's
+# (werkzeug's ProxyFix) before enabling them.
+app.config.setdefault("RATE_LIMIT_ENABLED", True)
+app.config.setdefault("RATE_LIMIT_BY_ADDRESS", False)
+app.config.setdefault("RATE_LIMITS", {
+    "login": [("phone", 0.1, 10), ("ip", 1.0, 10)],
+    "signup": [("phone", 0.1, 5), ("ip", 0.1, 5)],
+    # Far above what a person types; these stop runaway clients and retry loops
+    "add_record": [("session", 20.0, 200), ("role", 200.0, 1000)],
+    "add_records": [("session", 2.0, 20)],
+})
+# Writes beyond WRITE_GATE_LIMIT at once, or while a writer has
+# WRITE_QUEUE_MAX transactions queued, are turned away with a 503.
+app.config.setdefault("WRITE_GATE_ENDPOINTS", ("signup", "register_worker", "add_record", "add_records"))
+app.config.setdefault("WRITE_GATE_LIMIT", 32)
+app.config.setdefault("WRITE_GATE_TIMEOUT", 0.05)
+app.config.setdefault("WRITE_QUEUE_MAX", 64)
+app.config.setdefault("RETRY_AFTER", 1)
 
-DB = "database.db"
+qr_cache = qr.QRCache(app.config["QR_CACHE_DIR"], app.config["QR_CACHE_SIZE"])
+# Per process; run more than one worker only with a shared cache.CacheBackend here
+patient_cache = cache.LocalCache(app.config["PATIENT_CACHE_SIZE"], app.config["PATIENT_CACHE_TTL"])
+# Delivers queued notifications off the request path; see start_background_jobs()
+dispatcher = outbox.Dispatcher(app.config["DATABASE"],
+                               batch_size=app.config["OUTBOX_BATCH_SIZE"],
+                               interval=app.config["OUTBOX_INTERVAL"])
+analytics_compactor = analytics.Compactor(app.config["DATABASE"],
+                                          interval=app.config["ANALYTICS_COMPACT_INTERVAL"])
+# The same three jobs for every other shard, built by create_app()
+shard_jobs = []
+# Any limits.LimiterBackend can be swapped in here (e.g. limits.SharedLimiter
+# over a store all worker processes share)
+rate_limiter = limits.LocalLimiter()
+write_gate = limits.Gate(app.config["WRITE_GATE_LIMIT"], app.config["WRITE_GATE_TIMEOUT"])
 
 # -------------------- DATABASE --------------------
 
-def get_db():
-    conn = sqlite3.connect(DB)
-    conn.row_factory = sqlite3.Row
-    return conn
+# Importing this module never touches the database. The schema is brought up
+# to date by create_app(), `flask --app app init-db`, or at the latest by the
+# first request a process serves; once current it costs one PRAGMA read.
+
+_migrated = set()
+_migrate_lock = threading.Lock()
 
 def init_db():
-    db = get_db()
-    db.executescript("""
-    CREATE TABLE IF NOT EXISTS users (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        name TEXT,
-        role TEXT,
-        phone TEXT,
-        language TEXT
-    );
-
-    CREATE TABLE IF NOT EXISTS health_ids (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER,
-        health_uuid TEXT UNIQUE
-    );
-
-    CREATE TABLE IF NOT EXISTS medical_records (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        health_uuid TEXT,
-        diagnosis TEXT,
-        prescription TEXT,
-        blood_group TEXT,
-        blood_summary TEXT,
-        injuries TEXT,
-        allergies TEXT,
-        remarks TEXT,
-        next_visit DATE,
-        doctor_id INTEGER,
-        created_at TEXT
-    );
-
-    CREATE TABLE IF NOT EXISTS notifications (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER,
-        message TEXT,
-        language TEXT,
-        is_read INTEGER DEFAULT 0
-    );
-    """)
-    db.commit()
-
-def migrate_db():
-    db = get_db()
-    # Attempt to add columns if they don't exist (SQLite doesn't support IF NOT EXISTS for ADD COLUMN directly, so we use try/except block equivalent or just ignore error)
-    cols = ["blood_group", "blood_summary", "injuries", "allergies", "remarks"]
-    for col in cols:
-        try:
-            db.execute(f"ALTER TABLE medical_records ADD COLUMN {col} TEXT")
-        except sqlite3.OperationalError:
-            pass # Column likely exists
-    db.commit()
+    db = connect(app.config["DATABASE"])
+    try:
+        migrations.migrate(db)
+    finally:
+        db.close()
+    shards.migrate_shards(app.config["DATABASE"])
+    _migrated.add(app.config["DATABASE"])
+
+# Kept for callers that migrated explicitly before the versioned runner existed.
+migrate_db = init_db
+
+def ensure_schema():
+    if app.config["DATABASE"] not in _migrated:
+        with _migrate_lock:
+            if app.config["DATABASE"] not in _migrated:
+                init_db()
+
+@app.before_request
+def prepare_database():
+    ensure_schema()
+
+@app.errorhandler(database.WriteTimeout)
+def write_timed_out(exc):
+    res = jsonify({"error": "Server busy, retry later"})
+    res.status_code = 503
+    res.headers["Retry-After"] = str(app.config["RETRY_AFTER"])
+    return res
+
+@app.cli.command("init-db")
+def init_db_command():
+    """Apply pending schema migrations."""
+    init_db()
+    print(f"schema at version {migrations.SCHEMA_VERSION}")
+
+metrics.SLOW_QUERY_SECONDS = app.config["SLOW_QUERY_SECONDS"]
 
-init_db()
-migrate_db()
+# -------------------- INSTRUMENTATION --------------------
+
+@app.before_request
+def start_timer():
+    g.request_started = time.perf_counter()
+    if app.config["PROFILE_ENABLED"] and request.headers.get("X-Profile") == "1":
+        g.sampler = metrics.StackSampler(threading.get_ident(), app.config["PROFILE_INTERVAL"]).start()
+
+@app.after_request
+def record_request(response):
+    started = g.pop("request_started", None)
+    if started is None:
+        return response
+    elapsed = time.perf_counter() - started
+    endpoint = request.url_rule.rule if request.url_rule else "<unmatched>"
+    metrics.request_seconds.observe(elapsed, endpoint, request.method, response.status_code)
+
+    sampler = g.pop("sampler", None)
+    if sampler is not None:
+        sampler.stop()
+        if elapsed >= app.config["PROFILE_MIN_SECONDS"]:
+            os.makedirs(app.config["PROFILE_DIR"], exist_ok=True)
+            name = f"{int(time.time() * 1000)}-{request.endpoint or 'unmatched'}.folded"
+            path = sampler.dump(os.path.join(app.config["PROFILE_DIR"], name))
+            response.headers["X-Profile-File"] = os.path.basename(path)
+    return response
+
+# Registered after record_request so that its time includes encoding
+responses.init_app(app)
+
+@app.route("/metrics")
+def metrics_endpoint():
+    extra = []
+    for key, value in patient_cache.stats().items():
+        extra.append(f'patient_cache{{stat="{key}"}} {value}')
+    extra.append(f'write_gate{{stat="active"}} {write_gate.active}')
+    extra.append(f'write_gate{{stat="limit"}} {write_gate.limit}')
+    extra.append(f'write_queue{{stat="pending"}} {write_backlog()}')
+    return Response(metrics.expose(extra), mimetype="text/plain; version=0.0.4")
+
+# -------------------- ADMISSION --------------------
+
+def write_backlog():
+    return max(database.get_writer(path).pending() for path in shards.get_map().paths.values())
+
+def reject(endpoint, outcome, status, retry_after):
+    metrics.admissions.inc(1, endpoint, outcome)
+    res = jsonify({"error": "Too many requests" if status == 429 else "Server busy, retry later"})
+    res.status_code = status
+    res.headers["Retry-After"] = str(retry_after)
+    return res
+
+@app.before_request
+def admit():
+    endpoint = request.endpoint
+    rules = app.config["RATE_LIMITS"].get(endpoint) if app.config["RATE_LIMIT_ENABLED"] else None
+    gated = endpoint in app.config["WRITE_GATE_ENDPOINTS"]
+    if rules:
+        body = request.get_json(silent=True)
+        phone = body.get("phone") if isinstance(body, dict) else None
+        wait = limits.check(rate_limiter, rules, endpoint, session, request.remote_addr,
+                            app.config["RATE_LIMIT_BY_ADDRESS"], phone)
+        if wait is not None:
+            return reject(endpoint, "rate_limited", 429, wait)
+    if gated:
+        # A deep queue means the writer is already behind; more work only adds latency
+        if write_backlog() >= app.config["WRITE_QUEUE_MAX"] or not write_gate.enter():
+            return reject(endpoint, "overloaded", 503, app.config["RETRY_AFTER"])
+        g.write_gate = write_gate
+    if rules or gated:
+        metrics.admissions.inc(1, endpoint, "admitted")
+
+@app.teardown_request
+def leave_write_gate(exc=None):
+    gate = g.pop("write_gate", None)
+    if gate is not None:
+        gate.leave()
 
 # -------------------- LANGUAGE --------------------
 
-MESSAGES = {
-    "en": "Your next doctor visit is on {date}",
-    "ta": "உங்கள் அடுத்த மருத்துவர் சந்திப்பு {date}",
-    "hi": "आपकी अगली डॉक्टर की मुलाकात {date} को है"
-}
+# Loaded and precompiled once; see locales/<lang>.json
+catalog = i18n.Catalog(app.config["LOCALES_DIR"], app.config["DEFAULT_LANGUAGE"])
 
 def get_message(lang, date):
-    if lang not in MESSAGES:
-        lang = "en"
-    return MESSAGES[lang].format(date=date)
+    return catalog.message(lang, "next_visit", date=catalog.format_date(lang, date))
+
+def get_reminder_message(lang, date, days_left):
+    return catalog.message(lang, "visit_reminder", count=days_left,
+                           date=catalog.format_date(lang, date))
+
+reminder_scheduler = reminders.ReminderScheduler(app.config["DATABASE"], get_reminder_message,
+                                                 interval=app.config["REMINDER_INTERVAL"],
+                                                 offsets=app.config["REMINDER_OFFSETS"])
+
+# -------------------- STATIC ASSETS --------------------
+
+# Built on first use (or by create_app / `flask --app app build-assets`)
+_assets = None
+_assets_lock = threading.Lock()
+
+def build_assets():
+    global _assets
+    _assets = assets.build(assets.default_sources(app.config["FRONTEND_DIR"], app.config["CLIENT_DIST_DIR"]),
+                           app.config["ASSET_BUILD_DIR"])
+    return _assets
+
+def get_assets():
+    if _assets is None:
+        with _assets_lock:
+            if _assets is None:
+                build_assets()
+    return _assets
+
+@app.cli.command("build-assets")
+def build_assets_command():
+    """Fingerprint and precompress the static files."""
+    built = build_assets()
+    print(f"{len(built)} static URLs in {app.config['ASSET_BUILD_DIR']}")
+
+@app.route("/<path:filename>")
+def static_file(filename):
+    asset = get_assets().get("/" + filename)
+    if asset is None:
+        abort(404)
+    return assets.serve(asset, request.accept_encodings)
+
+@app.route("/app/")
+@app.route("/app/<path:filename>")
+def client_app(filename="index.html"):
+    built = get_assets()
+    asset = built.get("/app/" + filename)
+    if asset is None and "." not in filename.rsplit("/", 1)[-1]:
+        # Client-side routes (/app/doctor, ...) all load the single page
+        asset = built.get("/app/index.html")
+    if asset is None:
+        abort(404)
+    return assets.serve(asset, request.accept_encodings)
 
 # -------------------- AUTH HELPERS --------------------
 
@@ -105,7 +313,7 @@ def login_required(role=None):
 
 @app.route("/")
 def index():
-    return app.send_static_file("login.html")
+    return static_file("login.html")
 
 @app.route("/login", methods=["POST"])
 def login():
@@ -126,30 +334,29 @@ def signup():
     language = data.get("language", "en")
     role = data.get("role", "worker") # Default to worker, but allow doctor for demo
 
-    db = get_db()
-    
-    # Check if user already exists
-    existing = db.execute("SELECT * FROM users WHERE phone=?", (phone,)).fetchone()
-    if existing:
-        return jsonify({"error": "User already exists"}), 400
-
-    db.execute(
-        "INSERT INTO users (name, role, phone, language) VALUES (?, ?, ?, ?)",
-        (name, role, phone, language)
-    )
-    user_id = db.execute("SELECT last_insert_rowid()").fetchone()[0]
+    def create(db):
+        # Check if user already exists
+        if db.execute("SELECT 1 FROM users WHERE phone=?", (phone,)).fetchone():
+            return None, None
 
-    if role == "worker":
-        health_uuid = "HID-" + str(uuid.uuid4())
-        db.execute(
-            "INSERT INTO health_ids (user_id, health_uuid) VALUES (?, ?)",
-            (user_id, health_uuid)
+        cur = db.execute(
+            "INSERT INTO users (name, role, phone, language) VALUES (?, ?, ?, ?)",
+            (name, role, phone, language)
         )
-        health_id = health_uuid
-    else:
         health_id = None
+        if role == "worker":
+            health_id = "HID-" + str(uuid.uuid4())
+            db.execute(
+                "INSERT INTO health_ids (user_id, health_uuid) VALUES (?, ?)",
+                (cur.lastrowid, health_id)
+            )
+        return cur.lastrowid, health_id
 
-    db.commit()
+    user_id, health_id = database.write(create)
+    if user_id is None:
+        return jsonify({"error": "User already exists"}), 400
+    if health_id:
+        shards.place_workers(get_db(), [health_id])
     
     # Auto-login
     session["user_id"] = user_id
@@ -167,33 +374,208 @@ def register_worker():
     phone = data["phone"]
     lang = data.get("language", "en")
 
+    def register(db):
+        # Re-registering a known phone returns the worker's existing Health ID
+        existing = db.execute("""
+            SELECT users.role, health_ids.health_uuid FROM users
+            LEFT JOIN health_ids ON users.id = health_ids.user_id
+            WHERE users.phone=?
+        """, (phone,)).fetchone()
+        if existing:
+            if existing["role"] != "worker" or not existing["health_uuid"]:
+                return None
+            return existing["health_uuid"]
+
+        cur = db.execute(
+            "INSERT INTO users (name, role, phone, language) VALUES (?, 'worker', ?, ?)",
+            (name, phone, lang)
+        )
+        health_uuid = "HID-" + str(uuid.uuid4())
+        db.execute(
+            "INSERT INTO health_ids (user_id, health_uuid) VALUES (?, ?)",
+            (cur.lastrowid, health_uuid)
+        )
+        return health_uuid
+
+    health_uuid = database.write(register)
+    if health_uuid is None:
+        return jsonify({"error": "User already exists"}), 400
+    shards.place_workers(get_db(), [health_uuid])
+    return jsonify({"health_id": health_uuid})
+
+@app.route("/admin/register_workers/bulk", methods=["POST"])
+@login_required("admin")
+def register_workers_bulk():
+    # Upload is read and answered incrementally as JSON lines, one per input row
+    fmt = request.args.get("format")
+    if not fmt:
+        fmt = "jsonl" if "json" in (request.mimetype or "") else "csv"
+    if fmt not in ("csv", "jsonl"):
+        abort(400)
+
+    rows = bulk.iter_rows(request.stream, fmt)
+    batch_size = app.config["BULK_BATCH_SIZE"]
+
+    def generate():
+        db = get_db()
+        created = failed = 0
+        placing = []
+        # Each batch is one transaction on the writer, check and insert included
+        for result in bulk.register_workers(database.write, rows, batch_size):
+            if "health_id" in result:
+                created += 1
+                placing.append(result["health_id"])
+                if len(placing) == batch_size:
+                    shards.place_workers(db, placing)
+                    placing = []
+            else:
+                failed += 1
+            yield json.dumps(result) + "\n"
+        shards.place_workers(db, placing)
+        yield json.dumps({"summary": {"created": created, "failed": failed}}) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+@app.route("/admin/qr_sheet", methods=["POST"])
+@login_required("admin")
+def qr_sheet():
+    health_ids = request.json.get("health_ids") or []
+    if (not isinstance(health_ids, list) or len(health_ids) > app.config["QR_SHEET_MAX"]
+            or not all(isinstance(h, str) for h in health_ids)):
+        abort(400)
+    health_ids = list(dict.fromkeys(health_ids))
+    if not health_ids:
+        abort(400)
+
     db = get_db()
-    db.execute(
-        "INSERT INTO users (name, role, phone, language) VALUES (?, 'worker', ?, ?)",
-        (name, phone, lang)
-    )
-    user_id = db.execute("SELECT last_insert_rowid()").fetchone()[0]
+    placeholders = ",".join("?" * len(health_ids))
+    known = {r[0] for r in db.execute(
+        f"SELECT health_uuid FROM health_ids WHERE health_uuid IN ({placeholders})", health_ids
+    )}
+    unknown = [hid for hid in health_ids if hid not in known]
+    if unknown:
+        return jsonify({"error": "Unknown health IDs", "health_ids": unknown}), 404
 
-    health_uuid = "HID-" + str(uuid.uuid4())
-    db.execute(
-        "INSERT INTO health_ids (user_id, health_uuid) VALUES (?, ?)",
-        (user_id, health_uuid)
-    )
+    executor = qr.get_executor(app.config["QR_SHEET_WORKERS"])
+    pngs = qr_cache.get_many(health_ids, executor)
+    pdf = qr.render_sheet(health_ids, pngs)
+    return Response(pdf, mimetype="application/pdf", headers={
+        "Content-Disposition": "attachment; filename=health_ids.pdf"
+    })
 
-    img = qrcode.make(health_uuid)
-    # img.save(f"{health_uuid}.png") # Disable saving image to disk to avoid clutter
+@app.route("/admin/cache_stats")
+@login_required("admin")
+def cache_stats():
+    return jsonify({"patient": patient_cache.stats()})
 
-    db.commit()
-    return jsonify({"health_id": health_uuid})
+@app.route("/admin/analytics")
+@login_required("admin")
+def admin_analytics():
+    top = min(request.args.get("top", 10, type=int), 100)
+    weeks = min(request.args.get("weeks", 8, type=int), 52)
+    top, weeks = max(top, 1), max(weeks, 1)
+    if len(shards.get_map()) == 1:
+        return jsonify(analytics.summary(get_db(), top=top, weeks=weeks))
+    parts = shards.scatter(lambda name, db: analytics.summary(db, top=-1, weeks=weeks))
+    return jsonify(analytics.merge([part for _, part in parts], top, weeks))
 
-# -------------------- DOCTOR --------------------
+@app.route("/admin/export")
+@login_required("admin")
+def admin_export():
+    fmt = request.args.get("format", "csv")
+    if fmt not in export.FORMATS:
+        abort(400)
+    try:
+        start, end = (request.args.get(k) or None for k in ("from", "to"))
+        for value in (start, end):
+            if value:
+                date.fromisoformat(value)
+    except ValueError:
+        abort(400)
+    compress = request.args.get("gzip") in ("1", "true")
+
+    mimetype, extension = export.FORMATS[fmt]
+    chunk_size = app.config["EXPORT_CHUNK_SIZE"]
+    smap = shards.get_map()
+    archive_dir = app.config["ARCHIVE_DIR"]
+
+    def generate():
+        # Own connections: a long export shouldn't pin pooled ones
+        dbs = []
+        try:
+            streams = []
+            for name in smap.names:
+                db = connect(smap.paths[name])
+                dbs.append(db)
+                # Archives hold the oldest years, so reading them first keeps created_at order
+                schemas = itertools.chain(archive.partitions(db, shards.archive_dir(archive_dir, name)), ["main"])
+                streams.append(export.iter_chunks(db, start, end, chunk_size, schemas))
+            chunks = streams[0] if len(streams) == 1 else export.merge_chunks(streams, chunk_size)
+            parts = export.ENCODERS[fmt](chunks)
+            yield from export.gzip_stream(parts) if compress else parts
+        finally:
+            for db in dbs:
+                db.close()
+
+    filename = f"records.{extension}" + (".gz" if compress else "")
+    return Response(generate(), mimetype="application/gzip" if compress else mimetype, headers={
+        "Content-Disposition": f"attachment; filename={filename}",
+        "Cache-Control": "no-store",
+    })
+
+# -------------------- QR CODES --------------------
+
+@app.route("/health_id/<health_uuid>/qr.<fmt>")
+@login_required()
+def health_id_qr(health_uuid, fmt):
+    if fmt not in qr.FORMATS:
+        abort(404)
 
-@app.route("/doctor/get_patient", methods=["POST"])
-@login_required("doctor")
-def get_patient():
-    health_uuid = request.json.get("health_id")
     db = get_db()
-    
+    owner = db.execute(
+        "SELECT user_id FROM health_ids WHERE health_uuid=?", (health_uuid,)
+    ).fetchone()
+    if not owner:
+        abort(404)
+    # Workers may only fetch their own code
+    if session.get("role") == "worker" and owner["user_id"] != session["user_id"]:
+        abort(403)
+
+    tag = qr.etag_for(health_uuid, fmt)
+    if request.if_none_match.contains_weak(tag):
+        res = Response(status=304)
+    else:
+        res = Response(qr_cache.get(health_uuid, fmt), mimetype=qr.FORMATS[fmt])
+    res.set_etag(tag)
+    res.headers["Cache-Control"] = "private, max-age=31536000, immutable"
+    return res
+
+# -------------------- DOCTOR --------------------
+
+def shard_archive(health_uuid):
+    return shards.archive_dir(app.config["ARCHIVE_DIR"], shards.get_map().shard_for(health_uuid))
+
+def load_history(db, health_uuid, limit, cursor=None):
+    # Keyset pagination on (created_at, id), newest first
+    after = pagination.decode_cursor("history", cursor, 2) if cursor else None
+    rows = db.execute(f"""
+        SELECT id, diagnosis, prescription, blood_group, blood_summary, injuries, allergies, remarks, next_visit, created_at 
+        FROM medical_records 
+        WHERE health_uuid = ? {"AND (created_at, id) < (?, ?)" if after else ""}
+        ORDER BY created_at DESC, id DESC 
+        LIMIT ?
+    """, (health_uuid, *(after or ()), limit + 1)).fetchall()
+    if len(rows) <= limit:
+        # The hot table ran out; older pages continue in the archive partitions,
+        # which are only opened if the patient's archive index lists any
+        last = (rows[-1]["created_at"], rows[-1]["id"]) if rows else after
+        rows += archive.history(db, shard_archive(health_uuid), health_uuid, limit + 1 - len(rows), last)
+    rows, next_cursor = pagination.split_page(
+        rows, limit, "history", lambda r: (r["created_at"], r["id"])
+    )
+    return rows, next_cursor # rows serialize as objects, see responses.py
+
+def load_patient(db, health_uuid, limit, cursor=None):
     # Get User Details
     user = db.execute("""
         SELECT users.name, users.phone, users.language 
@@ -203,23 +585,124 @@ def get_patient():
     """, (health_uuid,)).fetchone()
     
     if not user:
-        abort(404)
+        return None
         
     # Get Medical History
-    history = db.execute("""
-        SELECT diagnosis, prescription, blood_group, blood_summary, injuries, allergies, remarks, next_visit, created_at 
-        FROM medical_records 
-        WHERE health_uuid = ? 
-        ORDER BY created_at DESC 
-        LIMIT 10
-    """, (health_uuid,)).fetchall()
+    history, next_cursor = load_history(db, health_uuid, limit, cursor)
     
-    return jsonify({
+    return {
         "name": user["name"],
         "phone": user["phone"],
         "language": user["language"],
-        "history": [dict(row) for row in history]
-    })
+        "history": history,
+        "next_cursor": next_cursor
+    }
+
+def load_patients(db, health_uuids, limit, shard=shards.MAIN):
+    """Resolve many patients of one shard in two queries, whatever the batch size."""
+    marks = ",".join("?" * len(health_uuids))
+    patients = {}
+    for user in db.execute(f"""
+        SELECT health_ids.health_uuid, users.name, users.phone, users.language 
+        FROM health_ids 
+        JOIN users ON users.id = health_ids.user_id 
+        WHERE health_ids.health_uuid IN ({marks})
+    """, health_uuids):
+        patients[user["health_uuid"]] = {
+            "name": user["name"],
+            "phone": user["phone"],
+            "language": user["language"],
+            "history": []
+        }
+    if not patients:
+        return patients
+
+    # Latest limit + 1 records per patient; the extra row only decides next_cursor
+    found = list(patients)
+    rows = db.execute(f"""
+        SELECT * FROM (
+            SELECT health_uuid, id, diagnosis, prescription, blood_group, blood_summary, injuries, allergies, remarks, next_visit, created_at,
+                   ROW_NUMBER() OVER (PARTITION BY health_uuid ORDER BY created_at DESC, id DESC) AS rn
+            FROM medical_records 
+            WHERE health_uuid IN ({",".join("?" * len(found))})
+        )
+        WHERE rn <= ?
+        ORDER BY health_uuid, rn
+    """, (*found, limit + 1)).fetchall()
+    history = {}
+    for row in rows:
+        history.setdefault(row["health_uuid"], []).append(row)
+    # Patients whose hot history doesn't fill a page continue into the archives
+    short = [h for h in found if len(history.get(h, ())) <= limit]
+    archive_dir = shards.archive_dir(app.config["ARCHIVE_DIR"], shard)
+    for health_uuid, older in archive.histories(db, archive_dir, short, limit + 1).items():
+        hot = history.setdefault(health_uuid, [])
+        hot += older[:limit + 1 - len(hot)]
+    for health_uuid, patient in patients.items():
+        page, patient["next_cursor"] = pagination.split_page(
+            history.get(health_uuid, []), limit, "history", lambda r: (r["created_at"], r["id"])
+        )
+        patient["history"] = [
+            {k: row[k] for k in row.keys() if k not in ("health_uuid", "rn")} for row in page
+        ]
+    return patients
+
+def cacheable(patient):
+    # Shared cache backends pickle what they store, and sqlite3.Row can't be
+    if patient:
+        patient["history"] = [dict(row) for row in patient["history"]]
+    return patient
+
+@app.route("/doctor/get_patient", methods=["POST"])
+@login_required("doctor")
+def get_patient():
+    health_uuid = request.json.get("health_id")
+    cursor = request.json.get("cursor")
+    default = app.config["HISTORY_PAGE_SIZE"]
+    try:
+        limit = pagination.page_size(request.json.get("limit"), default, app.config["HISTORY_PAGE_MAX"])
+        # Only the default first page is what clinics rescan, so only that is cached
+        if cursor or limit != default:
+            patient = load_patient(shards.db_for(health_uuid), health_uuid, limit, cursor)
+        else:
+            patient = patient_cache.get_or_load(
+                health_uuid, lambda: cacheable(load_patient(shards.db_for(health_uuid), health_uuid, limit))
+            )
+    except pagination.InvalidCursor:
+        abort(400)
+    if not patient:
+        abort(404)
+    return jsonify(patient)
+
+@app.route("/doctor/get_patients", methods=["POST"])
+@login_required("doctor")
+def get_patients():
+    health_uuids = request.json.get("health_ids")
+    if not isinstance(health_uuids, list) or not all(isinstance(h, str) for h in health_uuids):
+        return jsonify({"error": "health_ids must be a list of strings"}), 400
+    health_uuids = list(dict.fromkeys(health_uuids))
+    if len(health_uuids) > app.config["BATCH_LOOKUP_MAX"]:
+        return jsonify({"error": f"at most {app.config['BATCH_LOOKUP_MAX']} health_ids per request"}), 400
+    default = app.config["HISTORY_PAGE_SIZE"]
+    try:
+        limit = pagination.page_size(request.json.get("limit"), default, app.config["HISTORY_PAGE_MAX"])
+    except pagination.InvalidCursor:
+        abort(400)
+
+    # Default pages already cached by get_patient are served as-is
+    patients = {}
+    if limit == default:
+        for health_uuid in health_uuids:
+            cached = patient_cache.get(health_uuid)
+            if cached is not None:
+                patients[health_uuid] = cached
+    missing = [h for h in health_uuids if h not in patients]
+    for name, group in shards.get_map().group(missing).items():
+        patients.update(load_patients(shards.get_shard_db(name), group, limit, name))
+
+    return jsonify({"patients": {
+        h: patients.get(h) or {"error": "not found"} for h in health_uuids
+    }})
 
 @app.route("/doctor/add_record", methods=["POST"])
 @login_required("doctor")
@@ -240,61 +723,241 @@ def add_record():
         except ValueError:
             next_visit = None # If invalid format, treat as None or handle error. Assuming simple optionality here.
 
-    db = get_db()
-    record = db.execute(
-        "SELECT * FROM health_ids WHERE health_uuid=?", (health_uuid,)
-    ).fetchone()
-
-    if not record:
-        abort(404)
-
-    db.execute("""
-        INSERT INTO medical_records
-        (health_uuid, diagnosis, prescription, blood_group, blood_summary, injuries, allergies, remarks, next_visit, doctor_id, created_at)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    """, (
-        health_uuid,
-        data.get("diagnosis", ""),
-        data.get("prescription", ""),
-        data.get("blood_group", ""),
-        data.get("blood_summary", ""),
-        data.get("injuries", ""),
-        data.get("allergies", ""),
-        data.get("remarks", ""),
-        next_visit,
-        session["user_id"],
-        datetime.now().isoformat()
-    ))
+    doctor_id = session["user_id"]
 
-    if next_visit:
+    def insert(db):
+        # Existence check and the worker details for the notification in one lookup
         worker = db.execute("""
-            SELECT users.id, users.language FROM users
-            JOIN health_ids ON users.id = health_ids.user_id
+            SELECT users.id, users.phone, users.language FROM health_ids
+            JOIN users ON users.id = health_ids.user_id
             WHERE health_ids.health_uuid=?
         """, (health_uuid,)).fetchone()
+        if not worker:
+            return False
 
-        msg = get_message(worker["language"], next_visit)
-        db.execute(
-            "INSERT INTO notifications (user_id, message, language) VALUES (?, ?, ?)",
-            (worker["id"], msg, worker["language"])
-        )
+        db.execute("""
+            INSERT INTO medical_records
+            (health_uuid, diagnosis, prescription, blood_group, blood_summary, injuries, allergies, remarks, next_visit, doctor_id, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, (
+            health_uuid,
+            data.get("diagnosis", ""),
+            data.get("prescription", ""),
+            data.get("blood_group", ""),
+            data.get("blood_summary", ""),
+            data.get("injuries", ""),
+            data.get("allergies", ""),
+            data.get("remarks", ""),
+            next_visit,
+            doctor_id,
+            datetime.now().isoformat()
+        ))
+
+        if next_visit:
+            msg = get_message(worker["language"], next_visit)
+            cur = db.execute(
+                "INSERT INTO notifications (user_id, message, language) VALUES (?, ?, ?)",
+                (worker["id"], msg, worker["language"])
+            )
+            # Delivery (SMS etc.) happens on the dispatcher thread, not here
+            outbox.enqueue(db, cur.lastrowid, worker["id"], worker["phone"], msg)
+        return True
 
-    db.commit()
+    # Written on the patient's shard, which also holds the worker's rows
+    if not shards.write_for(health_uuid, insert):
+        abort(404)
+    patient_cache.delete(health_uuid)
     return jsonify({"status": "record added"})
 
+RECORD_FIELDS = ["diagnosis", "prescription", "blood_group", "blood_summary", "injuries", "allergies", "remarks"]
+
+def check_record(item):
+    """Validate one submitted record. Returns (error, next_visit)."""
+    if not isinstance(item, dict):
+        return "record must be an object", None
+    health_uuid = item.get("health_id")
+    if not isinstance(health_uuid, str) or not health_uuid.startswith("HID-"):
+        return "invalid health_id", None
+    key = item.get("idempotency_key")
+    if key is not None and (not isinstance(key, str) or not key or len(key) > 128):
+        return "invalid idempotency_key", None
+    next_visit = item.get("next_visit")
+    if next_visit:
+        try:
+            if datetime.strptime(next_visit, "%Y-%m-%d").date() < date.today():
+                return "next_visit is in the past", None
+        except (TypeError, ValueError):
+            next_visit = None # same leniency as add_record
+    return None, next_visit or None
+
+@app.route("/doctor/add_records", methods=["POST"])
+@login_required("doctor")
+def add_records():
+    items = request.json.get("records")
+    if not isinstance(items, list):
+        return jsonify({"error": "records must be a list"}), 400
+    if len(items) > app.config["BATCH_RECORDS_MAX"]:
+        return jsonify({"error": f"at most {app.config['BATCH_RECORDS_MAX']} records per request"}), 400
+
+    doctor_id = session["user_id"]
+    results = [None] * len(items)
+    valid = []
+    for i, item in enumerate(items):
+        error, next_visit = check_record(item)
+        if error:
+            results[i] = {"status": "error", "error": error}
+        else:
+            valid.append((i, item, next_visit))
+
+    # The writer holds the write lock for the lookups too, so a concurrent
+    # retry of the same sync can't slip a key in between the check and the insert.
+    def insert_all(db, valid):
+        hids = list({item["health_id"] for _, item, _ in valid})
+        workers = {}
+        if hids:
+            workers = {row["health_uuid"]: row for row in db.execute(f"""
+                SELECT health_ids.health_uuid, users.id, users.phone, users.language FROM health_ids
+                JOIN users ON users.id = health_ids.user_id
+                WHERE health_ids.health_uuid IN ({",".join("?" * len(hids))})
+            """, hids)}
+        keys = list({item["idempotency_key"] for _, item, _ in valid if item.get("idempotency_key")})
+        seen = {}
+        if keys:
+            seen = dict(db.execute(f"""
+                SELECT idempotency_key, id FROM medical_records
+                WHERE doctor_id = ? AND idempotency_key IN ({",".join("?" * len(keys))})
+            """, (doctor_id, *keys)).fetchall())
+
+        rows, inserted, repeats = [], [], []
+        pending = {}
+        created_at = datetime.now().isoformat()
+        for i, item, next_visit in valid:
+            worker = workers.get(item["health_id"])
+            key = item.get("idempotency_key")
+            if worker is None:
+                results[i] = {"status": "error", "error": "health_id not found"}
+            elif key in seen:
+                results[i] = {"status": "duplicate", "record_id": seen[key]}
+            elif key in pending:
+                repeats.append((i, pending[key])) # repeated within this batch
+            else:
+                if key:
+                    pending[key] = len(rows)
+                rows.append((item["health_id"], *(item.get(f, "") for f in RECORD_FIELDS),
+                             next_visit, doctor_id, created_at, key))
+                inserted.append((i, worker, next_visit))
+
+        if rows:
+            db.executemany("""
+                INSERT INTO medical_records
+                (health_uuid, diagnosis, prescription, blood_group, blood_summary, injuries, allergies, remarks, next_visit, doctor_id, created_at, idempotency_key)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, rows)
+            # AUTOINCREMENT ids are consecutive while we hold the write lock
+            first = db.execute("SELECT last_insert_rowid()").fetchone()[0] - len(rows) + 1
+            for n, (i, _, _) in enumerate(inserted):
+                results[i] = {"status": "created", "record_id": first + n}
+            for i, n in repeats:
+                results[i] = {"status": "duplicate", "record_id": first + n}
+
+            texts = {}
+            notes = []
+            for i, worker, next_visit in inserted:
+                if next_visit:
+                    key = (worker["language"], next_visit)
+                    if key not in texts:
+                        texts[key] = get_message(*key)
+                    notes.append((worker, texts[key]))
+            if notes:
+                db.executemany(
+                    "INSERT INTO notifications (user_id, message, language) VALUES (?, ?, ?)",
+                    [(w["id"], msg, w["language"]) for w, msg in notes]
+                )
+                first = db.execute("SELECT last_insert_rowid()").fetchone()[0] - len(notes) + 1
+                outbox.enqueue_many(db, [
+                    (first + n, w["id"], w["phone"], msg) for n, (w, msg) in enumerate(notes)
+                ])
+        return inserted
+
+    # One transaction per shard the batch touches
+    groups = {}
+    smap = shards.get_map()
+    for entry in valid:
+        groups.setdefault(smap.shard_for(entry[1]["health_id"]), []).append(entry)
+    inserted = []
+    for name, group in groups.items():
+        inserted += shards.write(name, lambda db, group=group: insert_all(db, group))
+    for i, _, _ in inserted:
+        patient_cache.delete(items[i]["health_id"])
+    return jsonify({"results": results})
+
+@app.route("/doctor/search")
+@login_required()
+def search_records():
+    if session.get("role") not in ("doctor", "admin"):
+        abort(403)
+    try:
+        limit = pagination.page_size(request.args.get("limit"),
+                                     app.config["SEARCH_PAGE_SIZE"],
+                                     app.config["SEARCH_PAGE_MAX"])
+        cursor = request.args.get("cursor")
+        # Ranked results can't be keyset-paged; the cursor carries the offset
+        offset = pagination.decode_cursor("search", cursor, 1)[0] if cursor else 0
+        if not isinstance(offset, int) or offset < 0:
+            raise pagination.InvalidCursor(cursor)
+    except pagination.InvalidCursor:
+        abort(400)
+
+    text = request.args.get("q", "")
+    if len(shards.get_map()) == 1:
+        results, more = search.search(get_db(), text, limit, offset)
+    else:
+        # Every shard's best offset + limit + 1, merged by rank
+        pages = shards.scatter(lambda name, db: search.ranked(db, text, offset + limit + 1))
+        results, more = search.merge([page for _, page in pages], limit, offset)
+    return jsonify({
+        "results": results,
+        "next_cursor": pagination.encode_cursor("search", (offset + limit,)) if more else None
+    })
+
 # -------------------- WORKER --------------------
 
 @app.route("/worker/dashboard")
 @login_required("worker")
 def worker_dashboard():
     db = get_db()
-    
-    # 1. Get Health ID
-    hid_row = db.execute(
-        "SELECT health_uuid FROM health_ids WHERE user_id=?", 
-        (session["user_id"],)
-    ).fetchone()
-    health_id = hid_row["health_uuid"] if hid_row else None
+
+    # Validate paging before touching the data
+    try:
+        limit = pagination.page_size(request.args.get("limit"),
+                                     app.config["NOTIFICATION_PAGE_SIZE"],
+                                     app.config["NOTIFICATION_PAGE_MAX"])
+        cursor = request.args.get("cursor")
+        before = pagination.decode_cursor("notifications", cursor, 1) if cursor else None
+    except pagination.InvalidCursor:
+        abort(400)
+
+    # 1. Get Health ID (from the directory) plus a version token. Records and
+    # notifications are append-only, so their max ids change exactly when the
+    # dashboard does. Both live on the worker's shard.
+    row = db.execute("SELECT health_uuid FROM health_ids WHERE user_id=?", (session["user_id"],)).fetchone()
+    health_id = row["health_uuid"] if row else None
+    if health_id:
+        db = shards.db_for(health_id)
+    version = db.execute("""
+        SELECT (SELECT MAX(id) FROM medical_records WHERE health_uuid = :hid) AS record_id,
+               (SELECT MAX(id) FROM notifications WHERE user_id = :user) AS notification_id
+    """, {"hid": health_id, "user": session["user_id"]}).fetchone()
+
+    etag = hashlib.sha1(repr((
+        session["user_id"], health_id, version["record_id"], version["notification_id"], limit, cursor
+    )).encode()).hexdigest()
+    # Weak comparison: compressed responses carry the tag as W/"..."
+    if request.if_none_match.contains_weak(etag):
+        res = Response(status=304)
+        res.set_etag(etag)
+        res.headers["Cache-Control"] = "private, no-cache"
+        return res
 
     # 2. Get Latest Medical Record (if HID exists)
     latest_record = None
@@ -303,39 +966,178 @@ def worker_dashboard():
             SELECT diagnosis, prescription, blood_group, blood_summary, injuries, allergies, remarks, created_at, next_visit 
             FROM medical_records 
             WHERE health_uuid=? 
-            ORDER BY created_at DESC 
+            ORDER BY created_at DESC, id DESC 
             LIMIT 1
         """, (health_id,)).fetchone()
+        if rec_row is None:
+            # Only workers not seen for a long time have nothing in the hot table
+            rec_row = next(iter(archive.history(db, shard_archive(health_id), health_id, 1)), None)
         if rec_row:
-            latest_record = dict(rec_row)
+            latest_record = {k: rec_row[k] for k in (
+                "diagnosis", "prescription", "blood_group", "blood_summary", "injuries",
+                "allergies", "remarks", "created_at", "next_visit")}
 
-    # 3. Get Notifications
-    notes = db.execute(
-        "SELECT message, is_read FROM notifications WHERE user_id=?",
-        (session["user_id"],)
-    ).fetchall()
+    # 3. Get Notifications, newest first, one page at a time
+    notes = db.execute(f"""
+        SELECT id, message, is_read FROM notifications
+        WHERE user_id=? {"AND id < ?" if before else ""}
+        ORDER BY id DESC
+        LIMIT ?
+    """, (session["user_id"], *(before or ()), limit + 1)).fetchall()
+    notes, next_cursor = pagination.split_page(notes, limit, "notifications", lambda n: (n["id"],))
 
-    return jsonify({
+    res = jsonify({
         "health_id": health_id,
         "medical_record": latest_record,
-        "notifications": [dict(n) for n in notes]
+        "notifications": notes,
+        "next_cursor": next_cursor
     })
+    res.set_etag(etag)
+    res.headers["Cache-Control"] = "private, no-cache"
+    return res
+
+# -------------------- SYNC --------------------
+
+@app.route("/sync")
+@login_required()
+def delta_sync():
+    try:
+        since = sync.decode_token(request.args.get("since"))
+        limit = pagination.page_size(request.args.get("limit"),
+                                     app.config["SYNC_PAGE_SIZE"],
+                                     app.config["SYNC_PAGE_MAX"])
+    except pagination.InvalidCursor:
+        abort(400)
+
+    db = get_db()
+    user_id = session["user_id"]
+    health_id = None
+    if session.get("role") == "worker":
+        row = db.execute("SELECT health_uuid FROM health_ids WHERE user_id=?", (user_id,)).fetchone()
+        health_id = row["health_uuid"] if row else None
+        scopes = {"notifications": ("user_id", user_id)}
+        if health_id:
+            scopes["records"] = ("health_uuid", health_id)
+    elif session.get("role") == "doctor":
+        scopes = {"records": ("doctor_id", user_id)}
+    else:
+        abort(403)
+
+    if health_id:
+        # Everything a worker sees lives on their shard
+        name = shards.get_map().shard_for(health_id)
+        parts = {name: sync.changes(shards.get_shard_db(name), scopes, since.get(name, 0), limit)}
+    else:
+        # At most ``limit`` changes per shard
+        parts = dict(shards.scatter(lambda name, db: sync.changes(db, scopes, since.get(name, 0), limit)))
+    result = sync.merge(parts, since)
+    if health_id:
+        result["health_id"] = health_id
+    res = jsonify(result)
+    res.headers["Cache-Control"] = "private, no-store"
+    return res
+
+# -------------------- LOCALIZATION --------------------
+
+def catalog_url(lang, digest):
+    return f"/i18n/{lang}.{digest}.json"
+
+@app.route("/i18n/manifest.json")
+def i18n_manifest():
+    # Small and revalidated every time; it points at the immutable bundles
+    res = jsonify(catalog.manifest(catalog_url))
+    res.add_etag()
+    res.headers["Cache-Control"] = "public, no-cache"
+    return res.make_conditional(request)
+
+@app.route("/i18n/<name>.json")
+def i18n_bundle(name):
+    lang, _, digest = name.partition(".")
+    if lang not in catalog.bundles:
+        abort(404)
+    body, current = catalog.bundles[lang]
+    if digest and digest != current:
+        abort(404)
+    res = Response(body, mimetype="application/json")
+    res.set_etag(current)
+    if digest:
+        res.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+    else:
+        res.headers["Cache-Control"] = "public, no-cache"
+    return res.make_conditional(request)
 
 # -------------------- SEED USERS --------------------
 
 @app.route("/seed")
 def seed():
-    db = get_db()
-    # Check if admin already exists
-    if not db.execute("SELECT * FROM users WHERE role='admin'").fetchone():
-        db.execute("INSERT INTO users (name, role, phone, language) VALUES ('Admin', 'admin', '111', 'en')")
-    # Check if doctor already exists
-    if not db.execute("SELECT * FROM users WHERE role='doctor'").fetchone():
-        db.execute("INSERT INTO users (name, role, phone, language) VALUES ('Doctor', 'doctor', '222', 'en')")
-    db.commit()
+    def create(db):
+        # Check if admin already exists
+        if not db.execute("SELECT * FROM users WHERE role='admin'").fetchone():
+            db.execute("INSERT INTO users (name, role, phone, language) VALUES ('Admin', 'admin', '111', 'en')")
+        # Check if doctor already exists
+        if not db.execute("SELECT * FROM users WHERE role='doctor'").fetchone():
+            db.execute("INSERT INTO users (name, role, phone, language) VALUES ('Doctor', 'doctor', '222', 'en')")
+
+    database.write(create)
     return "Seeded admin & doctor"
 
 # --------------------
 
+def create_app(config=None):
+    """Configure the app for serving: apply overrides, rebind the background
+    jobs to the configured database and bring its schema up to date.
+
+    Routes are registered on the module-level ``app``, which is returned.
+    Call before start_background_jobs().
+    """
+    global dispatcher, reminder_scheduler, analytics_compactor, shard_jobs, write_gate, qr_cache, _assets
+    if config:
+        app.config.update(config)
+    path = app.config["DATABASE"]
+    dispatcher = outbox.Dispatcher(path, dispatcher.sink,
+                                   batch_size=app.config["OUTBOX_BATCH_SIZE"],
+                                   interval=app.config["OUTBOX_INTERVAL"])
+    reminder_scheduler = reminders.ReminderScheduler(path, get_reminder_message,
+                                                     interval=app.config["REMINDER_INTERVAL"],
+                                                     offsets=app.config["REMINDER_OFFSETS"])
+    analytics_compactor = analytics.Compactor(path, interval=app.config["ANALYTICS_COMPACT_INTERVAL"])
+    write_gate = limits.Gate(app.config["WRITE_GATE_LIMIT"], app.config["WRITE_GATE_TIMEOUT"])
+    qr_cache = qr.QRCache(app.config["QR_CACHE_DIR"], app.config["QR_CACHE_SIZE"])
+    metrics.SLOW_QUERY_SECONDS = app.config["SLOW_QUERY_SECONDS"]
+    ensure_schema()
+    shard_jobs = []
+    for name, shard_path in shards.get_map(path).paths.items():
+        if name != shards.MAIN:
+            shard_jobs += [
+                outbox.Dispatcher(shard_path, dispatcher.sink, batch_size=app.config["OUTBOX_BATCH_SIZE"],
+                                  interval=app.config["OUTBOX_INTERVAL"]),
+                reminders.ReminderScheduler(shard_path, get_reminder_message,
+                                            interval=app.config["REMINDER_INTERVAL"],
+                                            offsets=app.config["REMINDER_OFFSETS"]),
+                analytics.Compactor(shard_path, interval=app.config["ANALYTICS_COMPACT_INTERVAL"]),
+            ]
+    # Static files are fingerprinted on first use (or by `flask build-assets`)
+    _assets = None
+    return app
+
+def start_background_jobs():
+    # Call once per serving process, after any sink has been configured
+    dispatcher.start()
+    reminder_scheduler.start()
+    analytics_compactor.start()
+    for job in shard_jobs:
+        job.start()
+
+def stop_background_jobs():
+    for job in shard_jobs:
+        job.stop()
+    analytics_compactor.stop()
+    reminder_scheduler.stop()
+    dispatcher.stop()
+    for shard_path in shards.get_map(app.config["DATABASE"]).paths.values():
+        database.get_writer(shard_path).close()
+
 if __name__ == "__main__":
+    create_app()
+    start_background_jobs()
     app.run(debug=True)
@@ -0,0 +1,244 @@
+"""Time-based archival of medical_records into per-year SQLite files.
+
+    python archive.py --days 730            # move records older than two years
+    python archive.py --before 2024-01-01 --vacuum
+
+Records created before the cutoff move to <ARCHIVE_DIR>/records_<year>.db in
+batches. Everything in an archive is older than everything left in the hot
+table. The hot database's archived_patients table (migration 14) lists which
+years hold each patient's records; reads fall through to the archives only
+once the hot table runs out of rows, and then ATTACH only the years the index
+names, as archive_<year>. Patients with nothing archived never touch them.
+/sync only serves the hot table, so a client syncing from scratch doesn't
+receive archived records. Analytics rollups keep counting them;
+``analytics.py rebuild --archive-dir`` rescans the partitions too.
+Archives written before migration 14 need a one-off index:
+
+    python archive.py --reindex
+
+SQLite allows 10 attached databases by default, so a connection keeps at
+most MAX_ATTACHED partitions attached and drops them all before attaching
+another; any number of years can be archived.
+"""
+import argparse
+import glob
+import os
+import re
+import threading
+import time
+from datetime import date, timedelta
+
+from database import connect
+
+HISTORY_COLUMNS = ("id, diagnosis, prescription, blood_group, blood_summary, injuries, allergies, "
+                   "remarks, next_visit, created_at")
+
+# SQLite's default SQLITE_MAX_ATTACHED is 10; leave room for other attachments
+MAX_ATTACHED = 8
+
+_file = re.compile(r"records_(\d{4})\.db$")
+_listing = {}
+_listing_lock = threading.Lock()
+
+def path_for(directory, year):
+    return os.path.join(directory, f"records_{year}.db")
+
+def years(directory):
+    """Archived years, oldest first. Re-listed only when the directory changes."""
+    try:
+        stamp = os.stat(directory).st_mtime_ns
+    except FileNotFoundError:
+        return []
+    with _listing_lock:
+        cached = _listing.get(directory)
+        if cached and cached[0] == stamp:
+            return cached[1]
+    found = sorted(m.group(1) for m in map(_file.search, glob.glob(path_for(directory, "*"))) if m)
+    with _listing_lock:
+        _listing[directory] = (stamp, found)
+    return found
+
+def _attach(db, directory, year):
+    schema = f"archive_{year}"
+    attached = [row[1] for row in db.execute("PRAGMA database_list") if row[1].startswith("archive_")]
+    if schema in attached:
+        return schema
+    if len(attached) >= MAX_ATTACHED:
+        for name in attached:
+            db.execute(f"DETACH DATABASE {name}")
+    db.execute(f"ATTACH DATABASE ? AS {schema}", (path_for(directory, year),))
+    return schema
+
+def partitions(db, directory):
+    """Attach the archives one at a time, oldest first, yielding each schema name.
+
+    For reads that stream every year: finish with a schema before asking
+    for the next, which may detach it.
+    """
+    for year in years(directory):
+        yield _attach(db, directory, year)
+
+# -------------------- READS --------------------
+
+def indexed(db, directory, health_uuids, before=None):
+    """(health_uuid, year) pairs with archived records, newest year first.
+
+    Looked up in the hot database; nothing is attached. ``before`` (a
+    created_at) skips years that only hold later records.
+    """
+    on_disk = years(directory)
+    if not on_disk or not health_uuids:
+        return []
+    marks = ",".join("?" * len(health_uuids))
+    rows = db.execute(f"""
+        SELECT health_uuid, year FROM archived_patients
+        WHERE health_uuid IN ({marks}) {"AND year <= ?" if before else ""}
+        ORDER BY year DESC
+    """, (*health_uuids, *([before[:4]] if before else []))).fetchall()
+    return [(row[0], row[1]) for row in rows if row[1] in on_disk]
+
+def history(db, directory, health_uuid, limit, after=None):
+    """Newest-first archived records for one patient, continuing after a (created_at, id) key."""
+    rows = []
+    if limit <= 0:
+        return rows
+    keyset = "AND (created_at, id) < (?, ?)" if after else ""
+    for _, year in indexed(db, directory, [health_uuid], after[0] if after else None):
+        schema = _attach(db, directory, year)
+        rows += db.execute(f"""
+            SELECT {HISTORY_COLUMNS} FROM {schema}.medical_records
+            WHERE health_uuid = ? {keyset}
+            ORDER BY created_at DESC, id DESC
+            LIMIT ?
+        """, (health_uuid, *(after or ()), limit - len(rows))).fetchall()
+        # Years don't overlap, so newer years' rows all come first
+        if len(rows) >= limit:
+            break
+    return rows
+
+def histories(db, directory, health_uuids, limit):
+    """Latest ``limit`` archived records for each of several patients, one query per year."""
+    by_year = {}
+    for health_uuid, year in indexed(db, directory, health_uuids):
+        by_year.setdefault(year, []).append(health_uuid)
+    found = {}
+    for year, wanted in by_year.items():
+        wanted = [h for h in wanted if len(found.get(h, ())) < limit]
+        if not wanted:
+            continue
+        schema = _attach(db, directory, year)
+        rows = db.execute(f"""
+            SELECT * FROM (
+                SELECT health_uuid, {HISTORY_COLUMNS},
+                       ROW_NUMBER() OVER (PARTITION BY health_uuid ORDER BY created_at DESC, id DESC) AS rn
+                FROM {schema}.medical_records
+                WHERE health_uuid IN ({",".join("?" * len(wanted))})
+            )
+            WHERE rn <= ?
+            ORDER BY health_uuid, rn
+        """, (*wanted, limit)).fetchall()
+        for row in rows:
+            page = found.setdefault(row["health_uuid"], [])
+            if len(page) < limit:
+                page.append(row)
+    return found
+
+# -------------------- ARCHIVAL --------------------
+
+def _create_partition(db, schema):
+    columns = [(row["name"], row["type"]) for row in db.execute("PRAGMA main.table_info(medical_records)")]
+    defs = ", ".join("id INTEGER PRIMARY KEY" if name == "id" else f"{name} {type}" for name, type in columns)
+    db.execute(f"PRAGMA {schema}.journal_mode=WAL")
+    db.execute(f"CREATE TABLE IF NOT EXISTS {schema}.medical_records ({defs})")
+    db.execute(f"""
+        CREATE INDEX IF NOT EXISTS {schema}.idx_records_hid_created_id
+        ON medical_records (health_uuid, created_at DESC, id DESC)
+    """)
+    db.execute(f"CREATE INDEX IF NOT EXISTS {schema}.idx_records_created_id ON medical_records (created_at, id)")
+    return [name for name, _ in columns]
+
+def archive(db, directory, cutoff, batch_size=5000):
+    """Move records created before ``cutoff`` (ISO date) out of the hot table. Returns rows moved.
+
+    Copies use INSERT OR IGNORE on the record id, so if a run dies between
+    the copy and the delete (WAL makes them atomic per file, not across
+    files) the next run simply finishes the move.
+    """
+    os.makedirs(directory, exist_ok=True)
+    moved = 0
+    while True:
+        oldest = db.execute("""
+            SELECT created_at FROM medical_records WHERE created_at < ?
+            ORDER BY created_at, id LIMIT 1
+        """, (cutoff,)).fetchone()
+        if oldest is None:
+            return moved
+        year = oldest["created_at"][:4]
+        schema = _attach(db, directory, year)
+        columns = ", ".join(_create_partition(db, schema))
+        bound = min(cutoff, str(int(year) + 1))
+        batch = """
+            SELECT id FROM main.medical_records WHERE created_at < ?
+            ORDER BY created_at, id LIMIT ?
+        """
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            db.execute("INSERT INTO archive_in_progress (started_at) VALUES (?)", (time.time(),))
+            db.execute(f"""
+                INSERT OR IGNORE INTO {schema}.medical_records ({columns})
+                SELECT {columns} FROM main.medical_records WHERE id IN ({batch})
+            """, (bound, batch_size))
+            db.execute(f"""
+                INSERT OR IGNORE INTO archived_patients (health_uuid, year)
+                SELECT DISTINCT health_uuid, ? FROM main.medical_records WHERE id IN ({batch})
+            """, (year, bound, batch_size))
+            moved += db.execute(f"DELETE FROM main.medical_records WHERE id IN ({batch})",
+                                (bound, batch_size)).rowcount
+            db.execute("DELETE FROM archive_in_progress")
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+
+def reindex(db, directory):
+    """Fill archived_patients from the partition files. Returns the (patient, year) pairs added."""
+    added = 0
+    for year in years(directory):
+        schema = _attach(db, directory, year)
+        try:
+            added += db.execute(f"""
+                INSERT OR IGNORE INTO archived_patients (health_uuid, year)
+                SELECT DISTINCT health_uuid, ? FROM {schema}.medical_records
+            """, (year,)).rowcount
+            db.commit()
+        finally:
+            db.execute(f"DETACH DATABASE {schema}")
+    return added
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database", default="database.db")
+    parser.add_argument("--archive-dir", default="archive")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--days", type=int, default=730, help="archive records older than this")
+    group.add_argument("--before", help="archive records created before this ISO date")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--vacuum", action="store_true", help="reclaim the freed space afterwards")
+    parser.add_argument("--reindex", action="store_true", help="only rebuild the index of archived patients")
+    args = parser.parse_args(argv)
+
+    cutoff = args.before or (date.today() - timedelta(days=args.days)).isoformat()
+    db = connect(args.database)
+    try:
+        if args.reindex:
+            print(f"indexed {reindex(db, args.archive_dir)} archived patient-years")
+            return
+        moved = archive(db, args.archive_dir, cutoff, args.batch_size)
+        print(f"archived {moved} records created before {cutoff}")
+        if args.vacuum and moved:
+            db.execute("VACUUM")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""ASGI entry point for production serving.
+
+    uvicorn asgi:application --host 0.0.0.0 --port 8000
+
+One worker process: the patient cache and rate-limit buckets are per process
+(see the readme before adding --workers).
+
+Connections are owned by the event loop, so thousands of idle or slow mobile
+clients cost a coroutine each rather than a thread. A request body is read in
+full before the Flask app sees it, and the response is written back as the app
+produces it. Only the Flask call itself, and with it every database access,
+runs on a bounded thread pool sized to the connection pool. Writes from those
+threads are serialized by database.Writer. Static files are handed to the
+server by path when it supports the ASGI pathsend extension.
+"""
+import asyncio
+import io
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.wsgi import FileWrapper
+
+_END = object()
+
+class FileBody(FileWrapper):
+    """wsgi.file_wrapper: lets send_file() responses be recognised as whole files."""
+
+    def __init__(self, file, buffer_size=64 * 1024):
+        super().__init__(file, buffer_size)
+
+    def path(self):
+        # Only an untouched, named file can be sent by path (Range responses
+        # wrap this object instead of returning it)
+        name = getattr(self.file, "name", None)
+        if isinstance(name, str) and self.tell() == 0:
+            return os.path.abspath(name)
+        return None
+
+class ASGIApp:
+    def __init__(self, wsgi_app, workers=8, max_body=32 * 1024 * 1024,
+                 on_startup=(), on_shutdown=()):
+        self.wsgi_app = wsgi_app
+        self.workers = workers
+        self.max_body = max_body
+        self.on_startup = list(on_startup)
+        self.on_shutdown = list(on_shutdown)
+        self.executor = ThreadPoolExecutor(workers, thread_name_prefix="asgi-db")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+        elif scope["type"] == "http":
+            await self._http(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        loop = asyncio.get_running_loop()
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                for hook in self.on_startup:
+                    await loop.run_in_executor(self.executor, hook)
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                for hook in self.on_shutdown:
+                    await loop.run_in_executor(self.executor, hook)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _http(self, scope, receive, send):
+        body = bytearray()
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            body += message.get("body", b"")
+            if len(body) > self.max_body:
+                await _plain(send, 413, b"Request body too large")
+                return
+            if not message.get("more_body"):
+                break
+
+        loop = asyncio.get_running_loop()
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            started["status"] = int(status.split(" ", 1)[0])
+            started["headers"] = [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in headers]
+
+        environ = build_environ(scope, bytes(body))
+        result = await loop.run_in_executor(self.executor, self.wsgi_app, environ, start_response)
+        try:
+            path = result.path() if isinstance(result, FileBody) else None
+            if path and "http.response.pathsend" in scope.get("extensions", {}):
+                await send({"type": "http.response.start", "status": started["status"],
+                            "headers": started["headers"]})
+                await send({"type": "http.response.pathsend", "path": path})
+                return
+            chunks = iter(result)
+            # Pull chunks on the pool so streamed responses (exports, bulk
+            # results) never block the loop; send each as soon as it exists.
+            chunk = await loop.run_in_executor(self.executor, next, chunks, _END)
+            await send({"type": "http.response.start", "status": started["status"],
+                        "headers": started["headers"]})
+            while chunk is not _END:
+                if chunk:
+                    await send({"type": "http.response.body", "body": chunk, "more_body": True})
+                chunk = await loop.run_in_executor(self.executor, next, chunks, _END)
+            await send({"type": "http.response.body", "body": b""})
+        finally:
+            close = getattr(result, "close", None)
+            if close is not None:
+                await loop.run_in_executor(self.executor, close)
+
+def build_environ(scope, body):
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+        "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": str(server[0]),
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": client[0],
+        "CONTENT_LENGTH": str(len(body)),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+        "wsgi.file_wrapper": FileBody,
+    }
+    for name, value in scope.get("headers", []):
+        name = name.decode("latin-1").upper().replace("-", "_")
+        value = value.decode("latin-1")
+        if name == "CONTENT_TYPE":
+            environ["CONTENT_TYPE"] = value
+        elif name != "CONTENT_LENGTH":
+            key = f"HTTP_{name}"
+            if key in environ:
+                value = environ[key] + ("; " if name == "COOKIE" else ",") + value
+            environ[key] = value
+    return environ
+
+async def _plain(send, status, text):
+    await send({"type": "http.response.start", "status": status,
+                "headers": [(b"content-type", b"text/plain"), (b"content-length", str(len(text)).encode())]})
+    await send({"type": "http.response.body", "body": text})
+
+def create_application():
+    from app import create_app, start_background_jobs, stop_background_jobs
+    app = create_app()
+    # No more request threads than pooled connections, so none waits on the pool
+    return ASGIApp(app, workers=app.config["DB_POOL_SIZE"],
+                   on_startup=[start_background_jobs], on_shutdown=[stop_background_jobs])
+
+application = create_application()
@@ -0,0 +1,155 @@
+"""Fingerprinted, precompressed static files.
+
+    python assets.py                      # build into the default directory
+    flask --app app build-assets
+
+Every file of a source directory is copied into a build directory as
+<name>.<hash>.<ext>, next to .gz/.br variants of anything compressible, and
+HTML/CSS references to other files are rewritten to the hashed names. Hashed
+URLs never change content, so they are served as immutable; the original
+URLs keep working but are revalidated (pages have to keep theirs anyway).
+"""
+import argparse
+import gzip
+import hashlib
+import mimetypes
+import os
+import posixpath
+import re
+from collections import namedtuple
+
+from flask import send_file
+
+import responses
+
+# Below this, a compressed copy saves less than its headers cost
+MIN_COMPRESS_SIZE = 256
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "public, no-cache"
+
+Asset = namedtuple("Asset", "path mimetype etag immutable encodings")
+
+# -------------------- BUILD --------------------
+
+_html_refs = re.compile(r"""(\b(?:src|href)\s*=\s*["'])([^"'#?]+)(["'])""", re.I)
+_css_refs = re.compile(r"""(url\(\s*["']?)([^"')#?]+)(["']?\s*\))""", re.I)
+REWRITERS = {".html": _html_refs, ".css": _css_refs}
+# Pages are hashed last so they see the final name of everything they load
+ORDER = {".css": 1, ".html": 2}
+
+def _resolve(prefix, rel, target):
+    if "://" in target or target.startswith(("//", "data:", "mailto:")):
+        return None
+    if target.startswith("/"):
+        return posixpath.normpath(target)
+    return posixpath.normpath(posixpath.join(prefix + posixpath.dirname(rel), target))
+
+def rewrite(data, pattern, prefix, rel, hashed):
+    """Point references to already-built files at their hashed URLs."""
+    def replace(match):
+        url = _resolve(prefix, rel, match.group(2).strip())
+        return match.group(1) + hashed.get(url, match.group(2)) + match.group(3)
+    return pattern.sub(replace, data.decode("utf-8")).encode("utf-8")
+
+def _write(path, data):
+    # Content-addressed outputs rarely change; skip rewriting identical bytes
+    try:
+        with open(path, "rb") as f:
+            if f.read() == data:
+                return path
+    except FileNotFoundError:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+    return path
+
+def precompress(path, data, mimetype):
+    """Write .br/.gz siblings where they help. Returns {encoding: path}, best first."""
+    encodings = {}
+    if mimetype not in responses.COMPRESSIBLE or len(data) < MIN_COMPRESS_SIZE:
+        return encodings
+    if responses.brotli is not None:
+        packed = responses.brotli.compress(data, quality=11)
+        if len(packed) < len(data):
+            encodings["br"] = _write(path + ".br", packed)
+    packed = gzip.compress(data, 9, mtime=0)
+    if len(packed) < len(data):
+        encodings["gzip"] = _write(path + ".gz", packed)
+    return encodings
+
+def default_sources(frontend_dir, client_dir):
+    # The Vite client is built with base '/app/', see client/vite.config.js
+    return [("/", frontend_dir, ()), ("/app/", client_dir, ("assets",))]
+
+def build(sources, out_dir):
+    """Build every (url_prefix, directory, prehashed_dirs) source; returns {url: Asset}.
+
+    Files under ``prehashed_dirs`` (e.g. Vite's assets/) already carry a
+    content hash in their name and keep it.
+    """
+    out_dir = os.path.abspath(out_dir)
+    assets = {}
+    for prefix, directory, prehashed in sources:
+        if not os.path.isdir(directory):
+            continue
+        files = []
+        for root, _, names in os.walk(directory):
+            for name in names:
+                files.append(os.path.relpath(os.path.join(root, name), directory).replace(os.sep, "/"))
+        files.sort(key=lambda rel: (ORDER.get(os.path.splitext(rel)[1], 0), rel))
+
+        hashed = {}
+        for rel in files:
+            with open(os.path.join(directory, rel), "rb") as f:
+                data = f.read()
+            base, ext = os.path.splitext(rel)
+            if ext in REWRITERS:
+                data = rewrite(data, REWRITERS[ext], prefix, rel, hashed)
+            digest = hashlib.sha256(data).hexdigest()[:12]
+            mimetype = mimetypes.guess_type(rel)[0] or "application/octet-stream"
+            fixed = rel.split("/", 1)[0] in prehashed
+            built = rel if fixed or ext == ".html" else f"{base}.{digest}{ext}"
+
+            path = _write(os.path.join(out_dir, prefix.strip("/"), built), data)
+            asset = Asset(path, mimetype, digest, fixed or built != rel, precompress(path, data, mimetype))
+            assets[prefix + built] = asset
+            if built != rel:
+                hashed[prefix + rel] = prefix + built
+                assets[prefix + rel] = asset._replace(immutable=False)
+    return assets
+
+# -------------------- SERVING --------------------
+
+def serve(asset, accept_encodings):
+    """Send a built asset, picking a precompressed variant the client accepts."""
+    encoding = accept_encodings.best_match(list(asset.encodings)) if asset.encodings else None
+    path = asset.encodings[encoding] if encoding else asset.path
+    # sendfile where the server supports it (wsgi.file_wrapper / X-Sendfile)
+    res = send_file(path, mimetype=asset.mimetype, conditional=True,
+                    etag=f"{asset.etag}-{encoding}" if encoding else asset.etag)
+    # send_file names the (possibly .gz) file on disk; the URL already says it
+    del res.headers["Content-Disposition"]
+    if encoding:
+        res.headers["Content-Encoding"] = encoding
+    if asset.encodings:
+        res.vary.add("Accept-Encoding")
+    res.headers["Cache-Control"] = IMMUTABLE if asset.immutable else REVALIDATE
+    return res
+
+# -------------------- CLI --------------------
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--frontend", default="frontend")
+    parser.add_argument("--client", default=os.path.join("client", "dist"), help="Vite build output")
+    parser.add_argument("--out", default="static_build")
+    args = parser.parse_args(argv)
+    assets = build(default_sources(args.frontend, args.client), args.out)
+    hashed = sum(a.immutable for a in assets.values())
+    print(f"{len(assets)} URLs ({hashed} immutable) in {args.out}")
+    return assets
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,379 @@
+"""Load and latency benchmark for the hot routes.
+
+    python benchmark.py --records 100000 --requests 2000 --concurrency 16
+    python benchmark.py --mode server --output baseline.json
+    python benchmark.py --compare baseline.json
+    python benchmark.py --startup
+    python benchmark.py --payload
+
+Seeds a synthetic dataset into its own database file (never database.db),
+drives /login, /doctor/get_patient, /doctor/add_record and /worker/dashboard
+from several threads, and reports p50/p95/p99 latency and requests/sec per
+route. --output writes the numbers as JSON; --compare diffs against one.
+--startup instead times fresh interpreters importing the app, running
+create_app() and serving a first request; --payload reports bytes on the wire and CPU per response for
+each JSON encoder and content encoding.
+"""
+import argparse
+import http.cookiejar
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+
+import migrations
+from database import connect
+
+DOCTOR_PHONE = "bench-doctor"
+ROUTES = ["login", "get_patient", "add_record", "dashboard"]
+
+# -------------------- SEEDING --------------------
+
+def seed(path, records, records_per_worker=10, batch=50000, rng=None):
+    """Create (or top up) a synthetic dataset. Returns the number of workers."""
+    rng = rng or random.Random(42)
+    db = connect(path)
+    migrations.migrate(db)
+    db.execute("PRAGMA synchronous=OFF")
+    workers = max(1, records // records_per_worker)
+
+    have = db.execute("SELECT COUNT(*) FROM health_ids").fetchone()[0]
+    if not db.execute("SELECT 1 FROM users WHERE phone=?", (DOCTOR_PHONE,)).fetchone():
+        db.execute("INSERT INTO users (name, role, phone, language) VALUES ('Bench Doctor', 'doctor', ?, 'en')",
+                   (DOCTOR_PHONE,))
+    langs = ["en", "ta", "hi"]
+    for start in range(have, workers, batch):
+        end = min(start + batch, workers)
+        db.executemany(
+            "INSERT INTO users (name, role, phone, language) VALUES (?, 'worker', ?, ?)",
+            [(f"Worker {i}", f"bench-{i}", langs[i % 3]) for i in range(start, end)]
+        )
+        db.execute("""
+            INSERT INTO health_ids (user_id, health_uuid)
+            SELECT id, 'HID-bench-' || substr(phone, 7) FROM users
+            WHERE role = 'worker' AND phone >= 'bench-' AND phone < 'bench.'
+              AND id NOT IN (SELECT user_id FROM health_ids)
+        """)
+        db.commit()
+
+    have = db.execute("SELECT COUNT(*) FROM medical_records").fetchone()[0]
+    base = datetime(2020, 1, 1)
+    for start in range(have, records, batch):
+        end = min(start + batch, records)
+        rows = []
+        notes = []
+        for i in range(start, end):
+            w = rng.randrange(workers)
+            created = base + timedelta(minutes=i)
+            visit = (date(2030, 1, 1) + timedelta(days=i % 365)).isoformat() if i % 2 else ""
+            rows.append((f"HID-bench-{w}", "Fever", "Paracetamol", "O+", "Hb:13", "", "", "",
+                         visit, 1, created.isoformat()))
+            if visit:
+                notes.append((w, f"Your next doctor visit is on {visit}", langs[w % 3]))
+        db.executemany("""
+            INSERT INTO medical_records
+            (health_uuid, diagnosis, prescription, blood_group, blood_summary, injuries, allergies, remarks, next_visit, doctor_id, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, rows)
+        # Notification user_id is resolved from the worker number via the phone index
+        db.executemany("""
+            INSERT INTO notifications (user_id, message, language)
+            SELECT id, ?, ? FROM users WHERE phone = 'bench-' || ?
+        """, [(msg, lang, w) for w, msg, lang in notes])
+        db.commit()
+    db.execute("ANALYZE")
+    db.close()
+    return workers
+
+# -------------------- CLIENTS --------------------
+
+class TestClientDriver:
+    """In-process requests through Flask's test client (no socket overhead)."""
+
+    def __init__(self, app):
+        self.app = app
+        self.local = threading.local()
+
+    def _client(self, role_phone):
+        clients = getattr(self.local, "clients", None)
+        if clients is None:
+            clients = self.local.clients = {}
+        if role_phone not in clients:
+            c = self.app.test_client()
+            if role_phone is not None:
+                c.post("/login", json={"phone": role_phone})
+            clients[role_phone] = c
+        return clients[role_phone]
+
+    def session(self, phone):
+        self._client(phone)
+
+    def request(self, method, path, phone, body=None):
+        res = self._client(phone).open(path, method=method, json=body)
+        res.close()
+        return res.status_code
+
+
+class HTTPDriver:
+    """Real HTTP against a threaded WSGI server on localhost."""
+
+    def __init__(self, app, host="127.0.0.1", port=0):
+        from werkzeug.serving import make_server, WSGIRequestHandler
+
+        class QuietHandler(WSGIRequestHandler):
+            def log_request(self, *args, **kwargs):
+                pass
+
+        self.server = make_server(host, port, app, threaded=True, request_handler=QuietHandler)
+        self.base = f"http://{host}:{self.server.server_port}"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.local = threading.local()
+
+    def _opener(self, phone):
+        openers = getattr(self.local, "openers", None)
+        if openers is None:
+            openers = self.local.openers = {}
+        if phone not in openers:
+            opener = urllib.request.build_opener(
+                urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+            if phone is not None:
+                self._send(opener, "POST", "/login", {"phone": phone})
+            openers[phone] = opener
+        return openers[phone]
+
+    def _send(self, opener, method, path, body):
+        data = json.dumps(body).encode() if body is not None else None
+        req = urllib.request.Request(self.base + path, data=data, method=method,
+                                     headers={"Content-Type": "application/json"})
+        try:
+            with opener.open(req) as res:
+                res.read()
+                return res.status
+        except urllib.error.HTTPError as e:
+            return e.code
+
+    def session(self, phone):
+        self._opener(phone)
+
+    def request(self, method, path, phone, body=None):
+        return self._send(self._opener(phone), method, path, body)
+
+    def close(self):
+        self.server.shutdown()
+
+# -------------------- DRIVING --------------------
+
+def make_call(route, workers, rng, me):
+    """One request for ``route``; ``me`` is the calling thread's own worker."""
+    w = rng.randrange(workers)
+    if route == "login":
+        return "POST", "/login", None, {"phone": f"bench-{w}"}
+    if route == "get_patient":
+        return "POST", "/doctor/get_patient", DOCTOR_PHONE, {"health_id": f"HID-bench-{w}"}
+    if route == "add_record":
+        return "POST", "/doctor/add_record", DOCTOR_PHONE, {
+            "health_id": f"HID-bench-{w}", "diagnosis": "Bench", "next_visit": "2031-01-01"
+        }
+    return "GET", "/worker/dashboard", f"bench-{me}", None
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * p / 100
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+def run_route(driver, route, workers, requests, concurrency, seed_value=0):
+    def worker(n):
+        rng = random.Random(seed_value * 1000 + n)
+        me = rng.randrange(workers)
+        # Log in outside the timed section
+        if route in ("get_patient", "add_record"):
+            driver.session(DOCTOR_PHONE)
+        elif route == "dashboard":
+            driver.session(f"bench-{me}")
+        latencies, errors = [], 0
+        for _ in range(requests // concurrency + (n < requests % concurrency)):
+            method, path, phone, body = make_call(route, workers, rng, me)
+            started = time.perf_counter()
+            status = driver.request(method, path, phone, body)
+            latencies.append(time.perf_counter() - started)
+            errors += status >= 400
+        return latencies, errors
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        results = list(pool.map(worker, range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(l for ls, _ in results for l in ls)
+    ms = lambda p: round(percentile(latencies, p) * 1000, 3)
+    return {
+        "requests": len(latencies),
+        "errors": sum(e for _, e in results),
+        "rps": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": ms(50),
+        "p95_ms": ms(95),
+        "p99_ms": ms(99),
+    }
+
+def run(args, out=sys.stdout):
+    from app import create_app
+    path = args.database
+    workers = seed(path, args.records)
+    # Every add_record comes from one doctor; measure the server, not their rate limit
+    app = create_app({"DATABASE": path, "RATE_LIMIT_ENABLED": False})
+
+    driver = HTTPDriver(app) if args.mode == "server" else TestClientDriver(app)
+    try:
+        results = {}
+        for route in args.routes:
+            results[route] = run_route(driver, route, workers, args.requests, args.concurrency)
+            print(f"{route:12} {results[route]}", file=out)
+    finally:
+        if args.mode == "server":
+            driver.close()
+
+    return {
+        "meta": {
+            "mode": args.mode,
+            "records": args.records,
+            "workers": workers,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "python": platform.python_version(),
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+        },
+        "routes": results,
+    }
+
+# -------------------- PAYLOADS --------------------
+
+PAYLOAD_ROUTES = ["get_patient", "dashboard"]
+PAYLOAD_WARMUP = 50
+
+def payloads(args, out=sys.stdout):
+    """Mean response size and process CPU per response, per encoder and encoding."""
+    import responses
+    from app import create_app
+    workers = seed(args.database, args.records)
+    app = create_app({"DATABASE": args.database})
+    driver = TestClientDriver(app)
+    original = app.json.encoder
+    results = {}
+    try:
+        for encoder in responses.ENCODERS:
+            app.json.use(encoder)
+            for route in PAYLOAD_ROUTES:
+                for encoding in ["identity"] + responses.available_encodings():
+                    # Same seed per variant, so every variant serves the same responses
+                    rng = random.Random(7)
+                    me = 0
+                    driver.session(DOCTOR_PHONE if route == "get_patient" else f"bench-{me}")
+                    headers = {"Accept-Encoding": encoding}
+                    size = 0
+                    for n in range(PAYLOAD_WARMUP + args.requests):
+                        if n == PAYLOAD_WARMUP:
+                            size, started = 0, time.process_time()
+                        method, path, phone, body = make_call(route, workers, rng, me)
+                        res = driver._client(phone).open(path, method=method, json=body, headers=headers)
+                        size += len(res.get_data())
+                        res.close()
+                    cpu = time.process_time() - started
+                    key = f"{encoder}/{route}/{encoding}"
+                    results[key] = {
+                        "bytes": round(size / args.requests),
+                        "cpu_ms": round(cpu / args.requests * 1000, 3),
+                    }
+                    print(f"{key:32} {results[key]}", file=out)
+    finally:
+        app.json.use(original)
+    return {"meta": {"records": args.records, "requests": args.requests,
+                     "python": platform.python_version()}, "payloads": results}
+
+# -------------------- STARTUP --------------------
+
+STARTUP_STEPS = {
+    "interpreter": "pass",
+    "import": "import app",
+    "create_app": "import app; app.create_app({{'DATABASE': {database!r}}})",
+    # The first request pays for the lazy schema check on the benchmark database
+    "first_request": "import app; app.app.config['DATABASE'] = {database!r}; "
+                     "app.app.test_client().get('/i18n/manifest.json')",
+}
+
+def startup(database, runs=15, out=sys.stdout):
+    """Median wall time (ms) of fresh interpreters running each startup step."""
+    db = connect(database)
+    migrations.migrate(db)
+    db.close()
+    here = os.path.dirname(os.path.abspath(__file__))
+    results = {}
+    for step, snippet in STARTUP_STEPS.items():
+        snippet = snippet.format(database=database)
+        times = []
+        for _ in range(runs):
+            started = time.perf_counter()
+            subprocess.run([sys.executable, "-c", snippet], cwd=here, check=True, capture_output=True)
+            times.append(time.perf_counter() - started)
+        results[step] = round(statistics.median(times) * 1000, 1)
+        print(f"{step:14} {results[step]} ms", file=out)
+    return {"meta": {"runs": runs, "python": platform.python_version()}, "startup": results}
+
+def compare(current, baseline, out=sys.stdout):
+    """Print per-route deltas; positive latency deltas are regressions."""
+    for route, now in current["routes"].items():
+        before = baseline.get("routes", {}).get(route)
+        if not before:
+            continue
+        parts = []
+        for key in ("rps", "p50_ms", "p95_ms", "p99_ms"):
+            if before.get(key):
+                parts.append(f"{key} {before[key]} -> {now[key]} ({(now[key] - before[key]) / before[key]:+.1%})")
+        print(f"{route:12} " + ", ".join(parts), file=out)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database", default="bench.db")
+    parser.add_argument("--records", type=int, default=10000)
+    parser.add_argument("--requests", type=int, default=1000, help="requests per route")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--mode", choices=["client", "server"], default="client")
+    parser.add_argument("--routes", nargs="+", choices=ROUTES, default=ROUTES)
+    parser.add_argument("--output", help="write results as JSON")
+    parser.add_argument("--compare", help="baseline JSON to diff against")
+    parser.add_argument("--startup", action="store_true", help="time process startup instead")
+    parser.add_argument("--runs", type=int, default=15, help="interpreters per startup step")
+    parser.add_argument("--payload", action="store_true", help="measure response size and CPU instead")
+    args = parser.parse_args(argv)
+    for name in ("requests", "concurrency", "runs"):
+        if getattr(args, name) < 1:
+            parser.error(f"--{name} must be at least 1")
+
+    if args.startup or args.payload:
+        results = startup(args.database, args.runs) if args.startup else payloads(args)
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(results, f, indent=2)
+        return results
+    results = run(args)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+    return results
+
+if __name__ == "__main__":
+    main()
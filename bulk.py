@@ -0,0 +1,121 @@
+import csv
+import json
+import uuid
+from itertools import islice
+
+# -------------------- PARSING --------------------
+
+# Stands in for the row that couldn't be decoded; nothing is read after it
+INVALID_ENCODING = object()
+
+class _InvalidEncoding(ValueError):
+    def __init__(self, line):
+        super().__init__(line)
+        self.line = line
+
+def _decode(stream):
+    # Line by line, so a bad byte is pinned to its line and everything before it is kept
+    for n, line in enumerate(stream, start=1):
+        try:
+            yield line.decode("utf-8-sig" if n == 1 else "utf-8")
+        except UnicodeDecodeError:
+            raise _InvalidEncoding(n) from None
+
+def iter_rows(stream, fmt):
+    """Yield (row_number, dict) pairs from a CSV or JSONL byte stream, one line at a time.
+
+    Input that isn't UTF-8 ends with a (line_number, INVALID_ENCODING) pair.
+    """
+    lines = _decode(stream)
+    try:
+        if fmt == "jsonl":
+            for n, line in enumerate(lines, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    row = None
+                yield n, row if isinstance(row, dict) else None
+        else:
+            # Row 1 is the header
+            for n, row in enumerate(csv.DictReader(lines), start=2):
+                yield n, row
+    except _InvalidEncoding as e:
+        yield e.line, INVALID_ENCODING
+
+def validate_worker(row):
+    """Return (name, phone, language) or an error string."""
+    if row is INVALID_ENCODING:
+        return "invalid encoding"
+    if row is None:
+        return "malformed row"
+    name = str(row.get("name") or "").strip()
+    phone = str(row.get("phone") or "").strip()
+    language = str(row.get("language") or "en").strip() or "en"
+    if not name:
+        return "name is required"
+    if not phone:
+        return "phone is required"
+    return name, phone, language
+
+# -------------------- INGEST --------------------
+
+def register_workers(write, rows, batch_size=500):
+    """Insert workers from (row_number, dict) pairs in batched transactions.
+
+    ``write(fn)`` runs ``fn(db)`` as one transaction and returns its result
+    (database.write in the app). Yields one result dict per input row, in input order, after each batch
+    commits. Phones already registered (or repeated in the upload) are
+    reported as duplicates and skipped.
+    """
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            return
+        yield from write(lambda db: _register_batch(db, batch))
+
+def _register_batch(db, batch):
+    results = []
+    pending = {}
+    for n, row in batch:
+        checked = validate_worker(row)
+        if isinstance(checked, str):
+            results.append({"row": n, "error": checked})
+        elif checked[1] in pending:
+            results.append({"row": n, "phone": checked[1], "error": "duplicate phone"})
+        else:
+            pending[checked[1]] = (n, checked)
+            results.append(n)  # resolved after the insert below
+
+    by_row = {}
+    if pending:
+        placeholders = ",".join("?" * len(pending))
+        taken = {r[0] for r in db.execute(
+            f"SELECT phone FROM users WHERE phone IN ({placeholders})", list(pending)
+        )}
+        # OR IGNORE: a phone registered since the check above (another process
+        # or connection) is reported as a duplicate instead of failing the batch
+        health = {}
+        for phone, (n, (name, _, lang)) in pending.items():
+            if phone in taken:
+                continue
+            cur = db.execute(
+                "INSERT OR IGNORE INTO users (name, role, phone, language) VALUES (?, 'worker', ?, ?)",
+                (name, phone, lang)
+            )
+            if cur.rowcount:
+                health[phone] = ("HID-" + str(uuid.uuid4()), cur.lastrowid)
+        db.executemany(
+            "INSERT INTO health_ids (user_id, health_uuid) VALUES (?, ?)",
+            [(user_id, hid) for hid, user_id in health.values()]
+        )
+
+        for phone, (n, _) in pending.items():
+            if phone in health:
+                by_row[n] = {"row": n, "phone": phone, "health_id": health[phone][0]}
+            else:
+                by_row[n] = {"row": n, "phone": phone, "error": "duplicate phone"}
+
+    return [by_row[r] if isinstance(r, int) else r for r in results]
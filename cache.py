@@ -0,0 +1,126 @@
+import threading
+import time
+from collections import OrderedDict
+
+# -------------------- BACKENDS --------------------
+
+class CacheBackend:
+    """Interface for patient payload caches.
+
+    Implementations must be safe to call from several threads. ``delete``
+    must be precise: after it returns, ``get`` never serves the old value.
+    """
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def set(self, key, value):
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def stats(self):
+        return {}
+
+    def get_or_load(self, key, loader):
+        value = self.get(key)
+        if value is None:
+            value = loader()
+            if value is not None:
+                self.set(key, value)
+        return value
+
+
+class _Load:
+    stale = False
+
+
+class LocalCache(CacheBackend):
+    """In-process cache with a per-entry TTL and LRU eviction."""
+
+    def __init__(self, max_entries=2048, ttl=300, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self._entries = OrderedDict()
+        # In-flight loads per key; delete() marks them stale so a load that
+        # raced an invalidation never stores its (old) result.
+        self._loading = {}
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.expirations = self.invalidations = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, expires = entry
+            if expires <= self.clock():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._store(key, value)
+
+    def _store(self, key, value):
+        self._entries[key] = (value, self.clock() + self.ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            for load in self._loading.get(key, ()):
+                load.stale = True
+            if self._entries.pop(key, None) is not None:
+                self.invalidations += 1
+
+    def get_or_load(self, key, loader):
+        value = self.get(key)
+        if value is not None:
+            return value
+        load = _Load()
+        with self._lock:
+            self._loading.setdefault(key, []).append(load)
+        try:
+            value = loader()
+        except Exception:
+            with self._lock:
+                self._finish(key, load)
+            raise
+        with self._lock:
+            self._finish(key, load)
+            if value is not None and not load.stale:
+                self._store(key, value)
+        return value
+
+    def _finish(self, key, load):
+        loads = self._loading[key]
+        loads.remove(load)
+        if not loads:
+            del self._loading[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
@@ -20,7 +20,7 @@ const App = () => {
   return (
     <LanguageProvider>
       <AuthProvider>
-        <Router>
+        <Router basename={import.meta.env.BASE_URL}>
           <Routes>
             <Route path="/" element={<Login />} />
             <Route path="/doctor" element={
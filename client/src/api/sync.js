@@ -0,0 +1,46 @@
+import api from './api';
+
+// Offline-first store for /sync. Rows are kept in localStorage keyed by id and
+// only the changes after the saved token are fetched on each pull.
+
+const KEY = 'syncState';
+
+const load = () => {
+    try {
+        return JSON.parse(localStorage.getItem(KEY)) || { token: null, tables: {} };
+    } catch {
+        return { token: null, tables: {} };
+    }
+};
+
+const apply = (state, payload) => {
+    for (const [tbl, { cols, rows }] of Object.entries(payload)) {
+        if (!cols) continue;
+        const table = (state.tables[tbl] = state.tables[tbl] || {});
+        for (const row of rows) {
+            const obj = Object.fromEntries(cols.map((c, i) => [c, row[i]]));
+            table[obj.id] = obj;
+        }
+    }
+    for (const [tbl, ids] of Object.entries(payload.deleted || {})) {
+        for (const id of ids) delete (state.tables[tbl] || {})[id];
+    }
+};
+
+export const pull = async () => {
+    const state = load();
+    let more = true;
+    while (more) {
+        const res = await api.get('/sync', { params: state.token ? { since: state.token } : {} });
+        apply(state, res.data);
+        state.token = res.data.token;
+        if (res.data.health_id) state.health_id = res.data.health_id;
+        more = res.data.more;
+    }
+    localStorage.setItem(KEY, JSON.stringify(state));
+    return state;
+};
+
+export const rows = (state, tbl) => Object.values(state.tables[tbl] || {});
+
+export const reset = () => localStorage.removeItem(KEY);
@@ -4,7 +4,7 @@ import { useLanguage } from '../context/LanguageContext';
 import { Globe } from 'lucide-react';
 
 const LanguageSelector = () => {
-    const { language, setLanguage, t } = useLanguage();
+    const { language, setLanguage, languages } = useLanguage();
 
     return (
         <div className="flex items-center gap-2">
@@ -14,9 +14,9 @@ const LanguageSelector = () => {
                 onChange={(e) => setLanguage(e.target.value)}
                 className="bg-transparent text-sm font-medium text-gray-700 outline-none cursor-pointer"
             >
-                <option value="en">English</option>
-                <option value="ta">தமிழ்</option>
-                <option value="hi">हिंदी</option>
+                {languages.map(({ code, name }) => (
+                    <option key={code} value={code}>{name}</option>
+                ))}
             </select>
         </div>
     );
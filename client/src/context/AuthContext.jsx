@@ -1,6 +1,7 @@
 
 import React, { createContext, useContext, useState, useEffect } from 'react';
 import api from '../api/api';
+import { reset as resetSync } from '../api/sync';
 
 const AuthContext = createContext();
 
@@ -23,6 +24,7 @@ export const AuthProvider = ({ children }) => {
     const login = async (phone) => {
         try {
             const res = await api.post('/login', { phone });
+            resetSync(); // synced rows belong to whoever was logged in before
             setUser({ role: res.data.role });
             localStorage.setItem('userRole', res.data.role);
             return { success: true, role: res.data.role };
@@ -36,6 +38,7 @@ export const AuthProvider = ({ children }) => {
             const res = await api.post('/signup', userData);
             if (res.data.health_id) {
                 // Worker auto-login
+                resetSync();
                 setUser({ role: 'worker' });
                 localStorage.setItem('userRole', 'worker');
             }
@@ -49,8 +52,9 @@ export const AuthProvider = ({ children }) => {
     const logout = () => {
         setUser(null);
         localStorage.removeItem('userRole');
+        resetSync();
         // Optional: call backend logout if exists (not in current app.py)
-        window.location.href = '/';
+        window.location.href = import.meta.env.BASE_URL;
     };
 
     return (
@@ -6,21 +6,46 @@ const LanguageContext = createContext();
 
 export const LanguageProvider = ({ children }) => {
     const [language, setLanguageState] = useState(localStorage.getItem('userLang') || 'en');
+    const [manifest, setManifest] = useState(null);
+    const [catalog, setCatalog] = useState({});
 
     useEffect(() => {
         localStorage.setItem('userLang', language);
     }, [language]);
 
+    // Bundled strings are the offline fallback; the server catalog wins.
+    // Bundle URLs are content-hashed, so the browser only downloads a
+    // language again when its strings change.
+    useEffect(() => {
+        fetch('/i18n/manifest.json')
+            .then((res) => res.json())
+            .then(setManifest)
+            .catch(() => {});
+    }, []);
+
+    useEffect(() => {
+        const info = manifest?.languages[language];
+        if (!info || catalog[language]) return;
+        fetch(info.url)
+            .then((res) => res.json())
+            .then((bundle) => setCatalog((prev) => ({ ...prev, [language]: bundle.ui })))
+            .catch(() => {});
+    }, [manifest, language, catalog]);
+
     const t = (key) => {
-        return translations[language][key] || key;
+        return catalog[language]?.[key] || translations[language]?.[key] || key;
     };
 
+    const languages = manifest
+        ? Object.entries(manifest.languages).map(([code, info]) => ({ code, name: info.name }))
+        : [{ code: 'en', name: 'English' }, { code: 'ta', name: 'தமிழ்' }, { code: 'hi', name: 'हिंदी' }];
+
     const setLanguage = (lang) => {
         setLanguageState(lang);
     };
 
     return (
-        <LanguageContext.Provider value={{ language, setLanguage, t }}>
+        <LanguageContext.Provider value={{ language, setLanguage, t, languages }}>
             {children}
         </LanguageContext.Provider>
     );
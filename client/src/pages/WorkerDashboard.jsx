@@ -3,6 +3,7 @@ import React, { useEffect, useState } from 'react';
 import Navbar from '../components/Navbar';
 import { useLanguage } from '../context/LanguageContext';
 import api from '../api/api';
+import { pull, rows } from '../api/sync';
 import { Card } from '../components/UI';
 import { Fingerprint, Bell, FileText } from 'lucide-react';
 
@@ -14,8 +15,21 @@ const WorkerDashboard = () => {
     useEffect(() => {
         const load = async () => {
             try {
-                const res = await api.get('/worker/dashboard'); // Backend route
-                setData(res.data);
+                // Only changes since the last visit come over the wire
+                const state = await pull();
+                const records = rows(state, 'records').sort((a, b) =>
+                    b.created_at.localeCompare(a.created_at) || b.id - a.id);
+                let latest = records[0] || null;
+                if (!latest && state.health_id) {
+                    // Sync only carries the hot table; archived records come from the dashboard
+                    const res = await api.get('/worker/dashboard', { params: { limit: 1 } });
+                    latest = res.data.medical_record;
+                }
+                setData({
+                    health_id: state.health_id,
+                    medical_record: latest,
+                    notifications: rows(state, 'notifications').sort((a, b) => b.id - a.id),
+                });
             } catch (error) {
                 console.error(error);
             }
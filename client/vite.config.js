@@ -3,7 +3,9 @@ import { defineConfig } from 'vite';
 import react from '@vitejs/plugin-react';
 import path from 'path';
 
-export default defineConfig({
+export default defineConfig(({ command }) => ({
+  // The production build is served by Flask under /app/ (see assets.py)
+  base: command === 'build' ? '/app/' : '/',
   plugins: [react()],
   resolve: {
     alias: {
@@ -24,6 +26,8 @@ export default defineConfig({
       '/doctor': 'http://127.0.0.1:5000',
       '/worker': 'http://127.0.0.1:5000',
       '/admin': 'http://127.0.0.1:5000',
+      '/i18n': 'http://127.0.0.1:5000',
+      '/sync': 'http://127.0.0.1:5000',
     }
   }
-});
+}));
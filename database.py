@@ -0,0 +1,236 @@
+import os
+import queue
+import sqlite3
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+from flask import g, has_app_context, current_app
+
+import metrics
+
+DB = "database.db"
+
+# Applied to every new connection. journal_mode=WAL is persistent in the file,
+# the rest are per-connection.
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA cache_size=-16000",      # ~16 MB page cache
+    "PRAGMA mmap_size=268435456",    # 256 MB memory-mapped reads
+    "PRAGMA temp_store=MEMORY",
+)
+
+# -------------------- CONNECTIONS --------------------
+
+def connect(path=None):
+    """Open a tuned connection. Callers outside a request must close it."""
+    conn = sqlite3.connect(path or DB, timeout=5, check_same_thread=False,
+                           factory=metrics.InstrumentedConnection)
+    conn.row_factory = sqlite3.Row
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+class ConnectionPool:
+    """Bounded pool of sqlite connections shared by the threads of one process."""
+
+    def __init__(self, path, max_size=8, timeout=10.0):
+        self.path = path
+        self.max_size = max_size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+
+    def acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.max_size:
+                self._created += 1
+                try:
+                    return connect(self.path)
+                except Exception:
+                    self._created -= 1
+                    raise
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise RuntimeError("database pool exhausted") from None
+
+    def release(self, conn):
+        # Never hand out a connection with a half-finished transaction.
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle.put(conn)
+
+    def close(self):
+        # Only idle connections are closed; checked-out ones still count
+        # against max_size and come back through release() as usual.
+        with self._lock:
+            while True:
+                try:
+                    self._idle.get_nowait().close()
+                except queue.Empty:
+                    break
+                self._created -= 1
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(path=None, max_size=8):
+    # Pools are keyed by pid so a forked worker never reuses its parent's handles.
+    key = (os.getpid(), path or DB)
+    pool = _pools.get(key)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(key)
+            if pool is None:
+                pool = _pools[key] = ConnectionPool(key[1], max_size=max_size)
+    return pool
+
+
+# -------------------- WRITER --------------------
+
+# Request-path writes all go through write() below. The exceptions are the
+# background jobs (outbox dispatch, reminder sweeps, analytics compaction)
+# and the offline tools (archive.py, analytics rebuild, shards.py): they write
+# on their own connections in short BEGIN IMMEDIATE batches, never on a
+# request thread, and busy_timeout makes them wait for the lock, not fail.
+
+class WriteTimeout(RuntimeError):
+    """The writer didn't finish a transaction in time; it may still commit later."""
+
+class Writer:
+    """Runs write transactions one at a time on a dedicated connection.
+
+    Request threads hand over a function and wait for its result instead of
+    racing each other for SQLite's write lock, so in-process writers never
+    see "database is locked" and never deadlock upgrading a read transaction.
+    """
+
+    def __init__(self, path, max_queue=10000):
+        self.path = path
+        self._queue = queue.Queue(max_queue)
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def submit(self, fn):
+        """Queue ``fn(db)``; it runs inside BEGIN IMMEDIATE and is committed if it returns."""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._loop, name="db-writer", daemon=True)
+                self._thread.start()
+        future = Future()
+        self._queue.put((fn, future))
+        return future
+
+    def run(self, fn, timeout=None):
+        future = self.submit(fn)
+        try:
+            return future.result(timeout)
+        except FutureTimeout:
+            if future.done():
+                raise # fn itself raised it
+            # Still queued: it will never run. Already running: it may yet commit.
+            future.cancel()
+            raise WriteTimeout(f"write to {self.path} took longer than {timeout}s") from None
+
+    def pending(self):
+        """Transactions queued behind the one running."""
+        return self._queue.qsize()
+
+    def _loop(self):
+        db = connect(self.path)
+        try:
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    return
+                fn, future = item
+                if not future.set_running_or_notify_cancel():
+                    continue
+                try:
+                    db.execute("BEGIN IMMEDIATE")
+                    result = fn(db)
+                    db.commit()
+                except BaseException as exc:
+                    if db.in_transaction:
+                        db.rollback()
+                    future.set_exception(exc)
+                else:
+                    future.set_result(result)
+        finally:
+            db.close()
+
+    def close(self, timeout=5.0):
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(None)
+            thread.join(timeout)
+
+
+_writers = {}
+
+
+def get_writer(path=None):
+    key = (os.getpid(), path or DB)
+    writer = _writers.get(key)
+    if writer is None:
+        with _pools_lock:
+            writer = _writers.get(key)
+            if writer is None:
+                writer = _writers[key] = Writer(key[1])
+    return writer
+
+
+def write(fn, path=None):
+    """Run ``fn(db)`` as one transaction on the writer of ``path`` (the app's database).
+
+    Raises WriteTimeout after DB_WRITE_TIMEOUT seconds rather than hang the request.
+    """
+    timeout = None
+    if has_app_context():
+        path = path or current_app.config.get("DATABASE", DB)
+        timeout = current_app.config.get("DB_WRITE_TIMEOUT")
+    return get_writer(path).run(fn, timeout)
+
+# -------------------- FLASK --------------------
+
+def _app_pool():
+    return get_pool(current_app.config.get("DATABASE", DB),
+                    current_app.config.get("DB_POOL_SIZE", 8))
+
+
+def get_db():
+    """Return the connection bound to the current app context.
+
+    Outside an app context a fresh connection is returned which the caller
+    owns and must close.
+    """
+    if not has_app_context():
+        return connect()
+    if "db" not in g:
+        g.db = _app_pool().acquire()
+    return g.db
+
+
+def close_db(exc=None):
+    conn = g.pop("db", None)
+    if conn is not None:
+        _app_pool().release(conn)
+
+
+def init_app(app):
+    # Next to the app, not wherever the server was started from
+    app.config.setdefault("DATABASE", os.path.join(app.root_path, DB))
+    app.config.setdefault("DB_POOL_SIZE", 8)
+    app.config.setdefault("DB_WRITE_TIMEOUT", 30.0)
+    app.teardown_appcontext(close_db)
@@ -0,0 +1,97 @@
+import csv
+import heapq
+import io
+import json
+import zlib
+
+# Record exports are generated chunk by chunk from a single SELECT, so memory
+# stays at one chunk whatever the table size. Each schema is read by one
+# SELECT, so each is a consistent snapshot on its own; when archive partitions
+# are chained in front of the hot table, an archive run that lands mid-export
+# can move rows between schemas, so such an export is not one snapshot.
+
+COLUMNS = ["id", "health_uuid", "diagnosis", "prescription", "blood_group", "blood_summary",
+           "injuries", "allergies", "remarks", "next_visit", "doctor_id", "created_at"]
+
+FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "jsonl": ("application/x-ndjson", "jsonl"),
+    # One JSON header line, then one line per chunk holding a list per column
+    "columnar": ("application/x-ndjson", "columns.jsonl"),
+}
+
+def iter_chunks(db, start=None, end=None, chunk_size=5000, schemas=("main",)):
+    """Yield lists of row tuples ordered by (created_at, id); start/end are ISO dates.
+
+    ``schemas`` are read one after the other, so list them oldest first.
+    """
+    for schema in schemas:
+        yield from _iter_schema(db, schema, start, end, chunk_size)
+
+def _iter_schema(db, schema, start, end, chunk_size):
+    where, params = [], []
+    if start:
+        where.append("created_at >= ?")
+        params.append(start)
+    if end:
+        # Inclusive end date; created_at carries a time component
+        where.append("created_at < date(?, '+1 day')")
+        params.append(end)
+    cur = db.execute(f"""
+        SELECT {", ".join(COLUMNS)} FROM {schema}.medical_records
+        {"WHERE " + " AND ".join(where) if where else ""}
+        ORDER BY created_at, id
+    """, params)
+    while True:
+        rows = cur.fetchmany(chunk_size)
+        if not rows:
+            return
+        yield [tuple(row) for row in rows]
+
+def merge_chunks(streams, chunk_size=5000):
+    """Interleave several iter_chunks() streams (one per shard) into one (created_at, id) order."""
+    created, ident = COLUMNS.index("created_at"), COLUMNS.index("id")
+    rows = heapq.merge(*((row for rows in stream for row in rows) for stream in streams),
+                       key=lambda row: (row[created], row[ident]))
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def encode_csv(chunks):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(COLUMNS)
+    for rows in chunks:
+        writer.writerows(rows)
+        yield buf.getvalue().encode()
+        buf.seek(0)
+        buf.truncate()
+    if buf.tell():
+        yield buf.getvalue().encode()
+
+def encode_jsonl(chunks):
+    for rows in chunks:
+        yield "".join(
+            json.dumps(dict(zip(COLUMNS, row)), ensure_ascii=False) + "\n" for row in rows
+        ).encode()
+
+def encode_columnar(chunks):
+    yield (json.dumps({"format": "columnar", "version": 1, "columns": COLUMNS}) + "\n").encode()
+    for rows in chunks:
+        block = {"rows": len(rows), "data": [list(col) for col in zip(*rows)]}
+        yield (json.dumps(block, ensure_ascii=False, separators=(",", ":")) + "\n").encode()
+
+ENCODERS = {"csv": encode_csv, "jsonl": encode_jsonl, "columnar": encode_columnar}
+
+def gzip_stream(parts, level=6):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31) # 31 = gzip container
+    for part in parts:
+        out = compressor.compress(part)
+        if out:
+            yield out
+    yield compressor.flush()
@@ -158,6 +158,7 @@ const translations = {
 function setLanguage(lang) {
     localStorage.setItem('userLang', lang);
     applyLanguage();
+    loadCatalog();
 }
 
 function applyLanguage() {
@@ -181,3 +182,26 @@ function applyLanguage() {
         document.title = t['app_name'];
     }
 }
+
+// Strings above are the offline fallback. The server catalog is the source of
+// truth: the manifest is tiny and revalidated, while each bundle URL carries a
+// content hash so the browser keeps it until the catalog actually changes.
+let catalogManifest = null;
+
+async function loadCatalog() {
+    const lang = localStorage.getItem('userLang') || 'en';
+    try {
+        if (!catalogManifest) {
+            catalogManifest = await (await fetch('/i18n/manifest.json')).json();
+        }
+        const info = catalogManifest.languages[lang];
+        if (!info) return;
+        const bundle = await (await fetch(info.url)).json();
+        translations[lang] = Object.assign(translations[lang] || {}, bundle.ui);
+        applyLanguage();
+    } catch (e) {
+        // Offline or older server: keep the built-in strings
+    }
+}
+
+document.addEventListener('DOMContentLoaded', loadCatalog);
@@ -0,0 +1,115 @@
+import glob
+import hashlib
+import json
+import os
+import string
+from datetime import date, datetime
+
+# Server-side message catalog. Every locales/<lang>.json is read once, its
+# templates are parsed up front, and the UI strings for each language are
+# serialized (and hashed) once so the endpoint just hands out bytes.
+
+def _plural_one(n):
+    return "one" if n == 1 else "other"
+
+def _plural_zero_one(n):
+    return "one" if n in (0, 1) else "other"
+
+# CLDR cardinal rules for the languages in locales/; anything else uses English's.
+# Add a language's rule alongside its locale file.
+PLURAL_RULES = {
+    "hi": _plural_zero_one,
+    "ta": _plural_one,
+}
+
+_formatter = string.Formatter()
+
+def compile_template(text):
+    """Parse '{field}' placeholders once into (literal, field) pairs."""
+    return tuple((literal, field) for literal, field, _, _ in _formatter.parse(text))
+
+def render(template, fields):
+    return "".join(literal + (str(fields[field]) if field is not None else "")
+                   for literal, field in template)
+
+
+class Catalog:
+    def __init__(self, directory, default="en"):
+        self.directory = directory
+        self.default = default
+        self.locales = {}
+        self.bundles = {}
+        self.load()
+
+    def load(self):
+        locales, bundles = {}, {}
+        for path in sorted(glob.glob(os.path.join(self.directory, "*.json"))):
+            lang = os.path.splitext(os.path.basename(path))[0]
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+            messages = {}
+            for key, value in data.get("messages", {}).items():
+                if isinstance(value, dict):
+                    messages[key] = {cat: compile_template(t) for cat, t in value.items()}
+                else:
+                    messages[key] = compile_template(value)
+            locales[lang] = {
+                "name": data.get("name", lang),
+                "date_format": compile_template(data.get("date_format", "{iso}")),
+                "weekdays": data.get("weekdays"),
+                "months": data.get("months"),
+                "messages": messages,
+            }
+            body = json.dumps({"language": lang, "ui": data.get("ui", {})},
+                              ensure_ascii=False, separators=(",", ":"), sort_keys=True).encode()
+            bundles[lang] = (body, hashlib.sha256(body).hexdigest()[:16])
+        if self.default not in locales:
+            raise ValueError(f"default locale {self.default!r} missing from {self.directory}")
+        self.locales, self.bundles = locales, bundles
+
+    def resolve(self, lang):
+        return lang if lang in self.locales else self.default
+
+    def format_date(self, lang, value):
+        """Render a date (or 'YYYY-MM-DD' string) with the locale's date_format."""
+        if isinstance(value, str):
+            try:
+                value = datetime.strptime(value, "%Y-%m-%d").date()
+            except ValueError:
+                return value
+        if not isinstance(value, date):
+            return value
+        locale = self.locales[self.resolve(lang)]
+        fallback = self.locales[self.default]
+        weekdays = locale["weekdays"] or fallback["weekdays"]
+        months = locale["months"] or fallback["months"]
+        return render(locale["date_format"], {
+            "iso": value.isoformat(),
+            "day": value.day,
+            "month": months[value.month - 1] if months else value.month,
+            "year": value.year,
+            "weekday": weekdays[value.weekday()] if weekdays else "",
+        })
+
+    def message(self, lang, key, count=None, **fields):
+        lang = self.resolve(lang)
+        template = self.locales[lang]["messages"].get(key)
+        if template is None:
+            lang = self.default
+            template = self.locales[lang]["messages"][key]
+        if isinstance(template, dict):
+            category = PLURAL_RULES.get(lang, _plural_one)(count)
+            template = template.get(category) or template["other"]
+        if count is not None:
+            fields["count"] = count
+        return render(template, fields)
+
+    def manifest(self, url_for):
+        return {
+            "default": self.default,
+            "languages": {
+                lang: {"name": self.locales[lang]["name"],
+                       "url": url_for(lang, self.bundles[lang][1])}
+                for lang in self.locales
+            },
+        }
@@ -0,0 +1,177 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+
+# Admission control for the write and login paths. Token buckets cap how fast
+# one client (session, IP, role or the phone number being logged into) may hit
+# a route; the gate caps how many
+# write requests run at once and turns everyone away while the database
+# writer's queue is backed up, so a burst of retries can't stall the readers.
+
+# -------------------- BACKENDS --------------------
+
+class LimiterBackend:
+    """Interface for token-bucket state.
+
+    ``take`` must be atomic per key, also when several threads (or, for a
+    shared backend, processes) take from the same bucket.
+    """
+
+    def take(self, key, rate, burst, cost=1.0):
+        """Remove ``cost`` tokens if available. Returns (allowed, seconds until it would be)."""
+        raise NotImplementedError
+
+    def stats(self):
+        return {}
+
+
+def _refill(tokens, updated, now, rate, burst):
+    return min(burst, tokens + (now - updated) * rate)
+
+def _decide(tokens, rate, cost):
+    if tokens >= cost:
+        return True, tokens - cost, 0.0
+    return False, tokens, (cost - tokens) / rate
+
+
+class LocalLimiter(LimiterBackend):
+    """Buckets in this process's memory, least recently used dropped beyond ``max_keys``.
+
+    A dropped bucket comes back full, which only ever errs towards admitting.
+    """
+
+    def __init__(self, max_keys=10000, clock=time.monotonic):
+        self.max_keys = max_keys
+        self.clock = clock
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, rate, burst, cost=1.0):
+        with self._lock:
+            now = self.clock()
+            tokens, updated = self._buckets.get(key, (burst, now))
+            allowed, tokens, wait = _decide(_refill(tokens, updated, now, rate, burst), rate, cost)
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+            return allowed, wait
+
+    def stats(self):
+        with self._lock:
+            return {"buckets": len(self._buckets), "max_keys": self.max_keys}
+
+
+class SharedLimiter(LimiterBackend):
+    """Buckets in a store shared by several processes.
+
+    The store needs two operations, both easy to map onto e.g. Redis
+    (WATCH/MULTI or a Lua script) or memcached (gets/cas):
+
+        get(key) -> value or None
+        compare_and_set(key, expected, value, ttl) -> bool
+
+    Values are (tokens, updated) pairs on a wall clock all processes share.
+    """
+
+    def __init__(self, store, clock=time.time, retries=8):
+        self.store = store
+        self.clock = clock
+        self.retries = retries
+
+    def take(self, key, rate, burst, cost=1.0):
+        for _ in range(self.retries):
+            now = self.clock()
+            current = self.store.get(key)
+            tokens, updated = current or (burst, now)
+            allowed, tokens, wait = _decide(_refill(tokens, updated, now, rate, burst), rate, cost)
+            # An idle bucket is full again after burst / rate seconds; let the store forget it
+            if self.store.compare_and_set(key, current, (tokens, now), ttl=burst / rate + 1):
+                return allowed, wait
+        # Heavy contention on one key: fail open rather than stall the request
+        return True, 0.0
+
+
+class LocalStore:
+    """In-process stand-in for a SharedLimiter store, for tests and single-process use."""
+
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value, expires = self._values.get(key, (None, 0))
+            return value if expires > self.clock() else None
+
+    def compare_and_set(self, key, expected, value, ttl):
+        with self._lock:
+            current, expires = self._values.get(key, (None, 0))
+            if expires <= self.clock():
+                current = None
+            if current != expected:
+                return False
+            self._values[key] = (value, self.clock() + ttl)
+            return True
+
+# -------------------- RULES --------------------
+
+def normalize_phone(phone):
+    """Digits only, so "+91 98765-43210" and "919876543210" share a bucket."""
+    text = str(phone or "")
+    return "".join(ch for ch in text if ch.isdigit()) or text.strip()
+
+def client_key(scope, session, remote_addr, phone=None):
+    """The identity a rule counts against: a logged-in user, an address, a whole
+    role, or the phone number a login or signup is for."""
+    if scope == "session":
+        user = session.get("user_id")
+        return f"user:{user}" if user is not None else f"ip:{remote_addr}"
+    if scope == "role":
+        return f"role:{session.get('role') or 'anonymous'}"
+    if scope == "phone":
+        return f"phone:{normalize_phone(phone)}"
+    return f"ip:{remote_addr}"
+
+def check(backend, rules, endpoint, session, remote_addr, by_address=True, phone=None):
+    """Apply every (scope, per_second, burst) rule of an endpoint.
+
+    Without ``by_address``, rules that would count against the client's
+    address (``ip`` rules, and ``session`` rules while logged out) are skipped.
+    Returns None if admitted, else the whole seconds to advertise in Retry-After.
+    """
+    wait = None
+    for scope, rate, burst in rules:
+        key = client_key(scope, session, remote_addr, phone)
+        if not by_address and key.startswith("ip:"):
+            continue
+        allowed, retry = backend.take(f"{endpoint}:{key}", rate, burst)
+        if not allowed:
+            wait = max(wait or 0, retry)
+    return None if wait is None else max(1, math.ceil(wait))
+
+# -------------------- GATE --------------------
+
+class Gate:
+    """At most ``limit`` requests inside at once; others wait up to ``timeout`` seconds."""
+
+    def __init__(self, limit, timeout=0.05):
+        self.limit = limit
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(limit)
+        self._lock = threading.Lock()
+        self.active = 0
+
+    def enter(self):
+        if not self._slots.acquire(timeout=self.timeout):
+            return False
+        with self._lock:
+            self.active += 1
+        return True
+
+    def leave(self):
+        with self._lock:
+            self.active -= 1
+        self._slots.release()
@@ -0,0 +1,243 @@
+import bisect
+import functools
+import logging
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from collections import Counter
+
+log = logging.getLogger(__name__)
+
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# -------------------- PRIMITIVES --------------------
+
+class Histogram:
+    def __init__(self, name, help, labels, buckets=BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def count(self, *label_values):
+        series = self._series.get(label_values)
+        return series[2] if series else 0
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = [(k, list(v[0]), v[1], v[2]) for k, v in self._series.items()]
+        for label_values, counts, total, n in sorted(items):
+            labels = _labels(self.labels, label_values)
+            cumulative = 0
+            for bound, c in zip(self.buckets, counts):
+                cumulative += c
+                lines.append(f'{self.name}_bucket{{{labels}{"," if labels else ""}le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{labels}{"," if labels else ""}le="+Inf"}} {n}')
+            lines.append(f"{self.name}_sum{{{labels}}} {total}")
+            lines.append(f"{self.name}_count{{{labels}}} {n}")
+        return lines
+
+
+class CounterMetric:
+    def __init__(self, name, help, labels):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values = Counter()
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, *label_values):
+        with self._lock:
+            self._values[label_values] += amount
+
+    def value(self, *label_values):
+        return self._values.get(label_values, 0)
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for label_values, v in items:
+            lines.append(f"{self.name}{{{_labels(self.labels, label_values)}}} {v}")
+        return lines
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
+
+def _labels(names, values):
+    return ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values))
+
+# -------------------- REGISTRY --------------------
+
+request_seconds = Histogram("http_request_duration_seconds", "Wall time per request.",
+                            ("endpoint", "method", "status"))
+query_seconds = Histogram("db_query_duration_seconds", "Time to execute a statement (first step).",
+                          ("query",))
+fetch_seconds = CounterMetric("db_fetch_seconds_total", "Time spent fetching result rows.", ("query",))
+rows_returned = CounterMetric("db_rows_returned_total", "Rows fetched from SELECTs.", ("query",))
+slow_queries = CounterMetric("db_slow_queries_total", "Statements slower than the slow-query threshold.",
+                             ("query",))
+admissions = CounterMetric("http_admissions_total",
+                           "Requests admitted or rejected by rate limits and the write gate.",
+                           ("endpoint", "outcome"))
+
+METRICS = [request_seconds, query_seconds, fetch_seconds, rows_returned, slow_queries, admissions]
+
+# Statements slower than this (seconds) are logged and counted; None disables.
+SLOW_QUERY_SECONDS = 0.1
+
+def expose(extra=()):
+    """Render every metric (plus any extra preformatted lines) as Prometheus text."""
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.expose())
+    lines.extend(extra)
+    return "\n".join(lines) + "\n"
+
+# -------------------- SQL TIMING --------------------
+
+_literals = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_in_lists = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_spaces = re.compile(r"\s+")
+
+@functools.lru_cache(maxsize=1024)
+def fingerprint(sql):
+    """Normalize a statement so queries differing only in literals group together."""
+    sql = _literals.sub("?", sql)
+    sql = _in_lists.sub("(?)", sql)
+    return _spaces.sub(" ", sql).strip()
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    _query = ""
+
+    def execute(self, sql, parameters=()):
+        self._query = fingerprint(sql)
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            _record(self._query, time.perf_counter() - started)
+
+    def executemany(self, sql, seq_of_parameters):
+        self._query = fingerprint(sql)
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            _record(self._query, time.perf_counter() - started)
+
+    def _fetched(self, started, n):
+        fetch_seconds.inc(time.perf_counter() - started, self._query)
+        if n:
+            rows_returned.inc(n, self._query)
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        self._fetched(started, row is not None)
+        return row
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._fetched(started, len(rows))
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(started, len(rows))
+        return rows
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        started = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._fetched(started, 0)
+            raise
+        self._fetched(started, 1)
+        return row
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Connection whose execute()/executemany() are timed per query fingerprint."""
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+def _record(query, elapsed):
+    query_seconds.observe(elapsed, query)
+    if SLOW_QUERY_SECONDS is not None and elapsed >= SLOW_QUERY_SECONDS:
+        slow_queries.inc(1, query)
+        log.warning("slow query (%.1f ms): %s", elapsed * 1000, query)
+
+# -------------------- PROFILING --------------------
+
+class StackSampler:
+    """Samples one thread's Python stack on a timer, in collapsed-stack format.
+
+    The output of dump() feeds straight into flamegraph.pl or speedscope.
+    """
+
+    def __init__(self, thread_id, interval=0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+                frame = frame.f_back
+            self.stacks[";".join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self
+
+    def dump(self, path):
+        with open(path, "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        return path
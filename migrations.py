@@ -0,0 +1,355 @@
+import logging
+import sqlite3
+
+log = logging.getLogger(__name__)
+
+# Schema changes are applied in order and the highest applied version is
+# stored in PRAGMA user_version, so startup only pays for a single pragma
+# read once the database is current. Append new steps; never edit old ones.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT,
+    role TEXT,
+    phone TEXT,
+    language TEXT
+);
+
+CREATE TABLE IF NOT EXISTS health_ids (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER,
+    health_uuid TEXT UNIQUE
+);
+
+CREATE TABLE IF NOT EXISTS medical_records (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    health_uuid TEXT,
+    diagnosis TEXT,
+    prescription TEXT,
+    blood_group TEXT,
+    blood_summary TEXT,
+    injuries TEXT,
+    allergies TEXT,
+    remarks TEXT,
+    next_visit DATE,
+    doctor_id INTEGER,
+    created_at TEXT
+);
+
+CREATE TABLE IF NOT EXISTS notifications (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER,
+    message TEXT,
+    language TEXT,
+    is_read INTEGER DEFAULT 0
+);
+"""
+
+def _create_tables(db):
+    # executescript() would COMMIT the migration transaction, so run one by one.
+    for stmt in SCHEMA.split(";"):
+        if stmt.strip():
+            db.execute(stmt)
+
+def _add_report_columns(db):
+    existing = {row[1] for row in db.execute("PRAGMA table_info(medical_records)")}
+    for col in ["blood_group", "blood_summary", "injuries", "allergies", "remarks"]:
+        if col not in existing:
+            db.execute(f"ALTER TABLE medical_records ADD COLUMN {col} TEXT")
+
+def _add_lookup_indexes(db):
+    db.execute("""
+        CREATE INDEX IF NOT EXISTS idx_records_hid_created
+        ON medical_records (health_uuid, created_at DESC)
+    """)
+    db.execute("CREATE INDEX IF NOT EXISTS idx_health_ids_user ON health_ids (user_id)")
+    db.execute("""
+        CREATE INDEX IF NOT EXISTS idx_notifications_user_read
+        ON notifications (user_id, is_read)
+    """)
+    try:
+        db.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_users_phone ON users (phone)")
+    except sqlite3.IntegrityError:
+        # Older databases may already hold duplicate phones; keep the lookup
+        # fast without rejecting them. Deduplicate by hand to get the constraint.
+        log.warning("duplicate phones in users; creating non-unique idx_users_phone")
+        db.execute("CREATE INDEX IF NOT EXISTS idx_users_phone ON users (phone)")
+
+def _add_keyset_indexes(db):
+    # Keyset pagination orders by (created_at, id) and by id, so the tie-break
+    # column has to be in the index to avoid a sort per page.
+    db.execute("DROP INDEX IF EXISTS idx_records_hid_created")
+    db.execute("""
+        CREATE INDEX IF NOT EXISTS idx_records_hid_created_id
+        ON medical_records (health_uuid, created_at DESC, id DESC)
+    """)
+    db.execute("CREATE INDEX IF NOT EXISTS idx_notifications_user_id ON notifications (user_id, id)")
+
+def _add_notification_outbox(db):
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS notification_outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            notification_id INTEGER,
+            user_id INTEGER,
+            channel TEXT,
+            recipient TEXT,
+            message TEXT,
+            status TEXT DEFAULT 'pending',
+            attempts INTEGER DEFAULT 0,
+            next_attempt_at REAL,
+            last_error TEXT,
+            created_at REAL,
+            sent_at REAL
+        )
+    """)
+    db.execute("""
+        CREATE INDEX IF NOT EXISTS idx_outbox_due
+        ON notification_outbox (status, next_attempt_at)
+    """)
+
+def _add_visit_reminders(db):
+    db.execute("CREATE INDEX IF NOT EXISTS idx_records_next_visit ON medical_records (next_visit)")
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS visit_reminders (
+            record_id INTEGER,
+            kind TEXT,
+            sent_on TEXT,
+            PRIMARY KEY (record_id, kind)
+        )
+    """)
+
+def _add_idempotency_keys(db):
+    # Offline clinics retry whole syncs; a key per doctor makes a replayed record a no-op.
+    existing = {row[1] for row in db.execute("PRAGMA table_info(medical_records)")}
+    if "idempotency_key" not in existing:
+        db.execute("ALTER TABLE medical_records ADD COLUMN idempotency_key TEXT")
+    db.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_records_idempotency
+        ON medical_records (doctor_id, idempotency_key) WHERE idempotency_key IS NOT NULL
+    """)
+
+def _add_change_log(db):
+    # Every insert/update/delete on a synced table appends one row per scope it
+    # is visible in; /sync reads a (scope, seq) index range past the client's token.
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS change_log (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            tbl TEXT,
+            row_id INTEGER,
+            scope TEXT
+        )
+    """)
+    db.execute("CREATE INDEX IF NOT EXISTS idx_change_log_scope ON change_log (scope, seq)")
+    scopes = {
+        "records": ("medical_records", ["health_uuid", "doctor_id"]),
+        "notifications": ("notifications", ["user_id"]),
+    }
+    for tbl, (table, columns) in scopes.items():
+        for event, ref in (("INSERT", "NEW"), ("UPDATE", "NEW"), ("DELETE", "OLD")):
+            refs = [ref] if event != "UPDATE" else ["OLD", "NEW"]
+            values = ", ".join(
+                f"('{tbl}', {r}.id, '{col}:' || {r}.{col})" for r in refs for col in columns
+            )
+            db.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS trg_{table}_{event.lower()}_log
+                AFTER {event} ON {table} BEGIN
+                    INSERT INTO change_log (tbl, row_id, scope) VALUES {values};
+                END
+            """)
+        for col in columns:
+            db.execute(f"""
+                INSERT INTO change_log (tbl, row_id, scope)
+                SELECT '{tbl}', id, '{col}:' || {col} FROM {table} ORDER BY id
+            """)
+
+def _add_record_search(db):
+    # External-content FTS5 index: the text lives only in medical_records.
+    # unicode61 treats combining marks (Tamil/Devanagari vowel signs, virama)
+    # as separators by default, which shreds Indic words into single letters;
+    # counting M* as token characters keeps them whole.
+    db.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS records_fts USING fts5(
+            diagnosis, prescription, allergies, injuries, remarks,
+            content='medical_records', content_rowid='id',
+            tokenize="unicode61 remove_diacritics 2 categories 'L* N* Co M*'",
+            prefix='2 3'
+        )
+    """)
+    columns = "diagnosis, prescription, allergies, injuries, remarks"
+    new = ", ".join(f"NEW.{c}" for c in columns.split(", "))
+    old = ", ".join(f"OLD.{c}" for c in columns.split(", "))
+    db.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_medical_records_fts_insert AFTER INSERT ON medical_records BEGIN
+            INSERT INTO records_fts (rowid, {columns}) VALUES (NEW.id, {new});
+        END
+    """)
+    db.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_medical_records_fts_delete AFTER DELETE ON medical_records BEGIN
+            INSERT INTO records_fts (records_fts, rowid, {columns}) VALUES ('delete', OLD.id, {old});
+        END
+    """)
+    db.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_medical_records_fts_update AFTER UPDATE ON medical_records BEGIN
+            INSERT INTO records_fts (records_fts, rowid, {columns}) VALUES ('delete', OLD.id, {old});
+            INSERT INTO records_fts (rowid, {columns}) VALUES (NEW.id, {new});
+        END
+    """)
+    # Diagnosis and allergy hits matter more than a word buried in remarks
+    db.execute("INSERT INTO records_fts (records_fts, rank) VALUES ('rank', 'bm25(4.0, 2.0, 3.0, 1.0, 0.5)')")
+    db.execute("INSERT INTO records_fts (records_fts) VALUES ('rebuild')")
+
+def _bump(metric, key_expr, condition, amount="1"):
+    return f"""
+        INSERT INTO analytics_counts (metric, key, count)
+        SELECT '{metric}', k, {amount} FROM (SELECT {key_expr} AS k) WHERE {condition}
+        ON CONFLICT (metric, key) DO UPDATE SET count = count + excluded.count;
+    """
+
+def _add_analytics_rollups(db):
+    # Population counts maintained as records arrive. Records are append-only
+    # (nothing edits or deletes them), so only inserts are tracked;
+    # analytics.rebuild() recomputes everything after manual fixes.
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS analytics_counts (
+            metric TEXT,
+            key TEXT,
+            count INTEGER,
+            PRIMARY KEY (metric, key)
+        ) WITHOUT ROWID
+    """)
+    db.execute("CREATE INDEX IF NOT EXISTS idx_analytics_top ON analytics_counts (metric, count DESC)")
+    # Blood group is a property of the worker, not the visit: keep each
+    # worker's latest one so the distribution counts people.
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS analytics_worker_blood (
+            health_uuid TEXT PRIMARY KEY,
+            blood_group TEXT,
+            record_id INTEGER
+        ) WITHOUT ROWID
+    """)
+    db.execute("CREATE TABLE IF NOT EXISTS analytics_state (key TEXT PRIMARY KEY, value TEXT)")
+
+    db.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_medical_records_analytics AFTER INSERT ON medical_records BEGIN
+            {_bump("records", "''", "1")}
+            {_bump("diagnosis", "lower(trim(NEW.diagnosis))", "k != ''")}
+            {_bump("visit_week", "date(NEW.next_visit, 'weekday 0', '-6 days')", "k IS NOT NULL")}
+            UPDATE analytics_counts SET count = count - 1
+            WHERE metric = 'blood_group' AND upper(trim(NEW.blood_group)) != ''
+              AND key = (SELECT blood_group FROM analytics_worker_blood WHERE health_uuid = NEW.health_uuid);
+            INSERT INTO analytics_worker_blood (health_uuid, blood_group, record_id)
+            SELECT NEW.health_uuid, k, NEW.id FROM (SELECT upper(trim(NEW.blood_group)) AS k) WHERE k != ''
+            ON CONFLICT (health_uuid) DO UPDATE SET blood_group = excluded.blood_group, record_id = excluded.record_id;
+            {_bump("blood_group", "upper(trim(NEW.blood_group))", "k != ''")}
+        END
+    """)
+
+    db.execute("""
+        INSERT INTO analytics_counts (metric, key, count)
+        SELECT 'records', '', COUNT(*) FROM medical_records
+        UNION ALL
+        SELECT 'diagnosis', lower(trim(diagnosis)) AS k, COUNT(*) FROM medical_records WHERE k != '' GROUP BY k
+        UNION ALL
+        SELECT 'visit_week', date(next_visit, 'weekday 0', '-6 days') AS k, COUNT(*) FROM medical_records
+        WHERE k >= date('now', 'weekday 0', '-6 days') GROUP BY k
+    """)
+    db.execute("""
+        INSERT INTO analytics_worker_blood (health_uuid, blood_group, record_id)
+        SELECT health_uuid, upper(trim(blood_group)), MAX(id) FROM medical_records
+        WHERE upper(trim(blood_group)) != '' GROUP BY health_uuid
+    """)
+    db.execute("""
+        INSERT INTO analytics_counts (metric, key, count)
+        SELECT 'blood_group', blood_group, COUNT(*) FROM analytics_worker_blood GROUP BY blood_group
+    """)
+
+def _add_created_index(db):
+    # Date-range exports walk records in (created_at, id) order
+    db.execute("CREATE INDEX IF NOT EXISTS idx_records_created_id ON medical_records (created_at, id)")
+
+def _add_archive_marker(db):
+    # Moving a record to an archive partition deletes it from the hot table,
+    # but it isn't gone: while archival holds a row in archive_in_progress
+    # (inside its own transaction, so nobody else sees it) the delete is not
+    # logged for /sync.
+    db.execute("CREATE TABLE IF NOT EXISTS archive_in_progress (started_at REAL)")
+    db.execute("DROP TRIGGER IF EXISTS trg_medical_records_delete_log")
+    db.execute("""
+        CREATE TRIGGER trg_medical_records_delete_log
+        AFTER DELETE ON medical_records
+        WHEN NOT EXISTS (SELECT 1 FROM archive_in_progress) BEGIN
+            INSERT INTO change_log (tbl, row_id, scope) VALUES
+                ('records', OLD.id, 'health_uuid:' || OLD.health_uuid),
+                ('records', OLD.id, 'doctor_id:' || OLD.doctor_id);
+        END
+    """)
+
+def _add_shard_map(db):
+    # Hash ranges of health IDs and the database that owns each (see shards.py).
+    # Every database gets the table; only the main one's rows are read. Until
+    # the first split, main owns the whole range.
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS shard_map (
+            start INTEGER PRIMARY KEY,
+            name TEXT UNIQUE NOT NULL,
+            path TEXT,
+            id_base INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    db.execute("INSERT OR IGNORE INTO shard_map (start, name) VALUES (0, 'main')")
+
+def _add_archived_patients(db):
+    # Which archive years hold records of a patient (see archive.py), so reads
+    # only open a partition when the patient has something in it.
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS archived_patients (
+            health_uuid TEXT,
+            year TEXT,
+            PRIMARY KEY (health_uuid, year)
+        ) WITHOUT ROWID
+    """)
+
+MIGRATIONS = [
+    (1, _create_tables),
+    (2, _add_report_columns),
+    (3, _add_lookup_indexes),
+    (4, _add_keyset_indexes),
+    (5, _add_notification_outbox),
+    (6, _add_visit_reminders),
+    (7, _add_idempotency_keys),
+    (8, _add_change_log),
+    (9, _add_record_search),
+    (10, _add_analytics_rollups),
+    (11, _add_created_index),
+    (12, _add_archive_marker),
+    (13, _add_shard_map),
+    (14, _add_archived_patients),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+def current_version(db):
+    return db.execute("PRAGMA user_version").fetchone()[0]
+
+def migrate(db):
+    """Apply pending migrations. Returns the list of versions applied."""
+    version = current_version(db)
+    if version >= SCHEMA_VERSION:
+        return []
+    applied = []
+    # Take the write lock up front so concurrent workers don't both migrate.
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        version = current_version(db)
+        for target, step in MIGRATIONS:
+            if target <= version:
+                continue
+            step(db)
+            db.execute(f"PRAGMA user_version = {target}")
+            applied.append(target)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return applied
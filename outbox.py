@@ -0,0 +1,144 @@
+import logging
+import threading
+import time
+
+from database import connect
+
+log = logging.getLogger(__name__)
+
+# Notifications are written to notification_outbox in the same transaction as
+# the record that caused them; delivery happens later on a background thread.
+# Rows move pending -> sent, or back to pending with a backoff after a failed
+# attempt, and finally to failed once max_attempts is reached.
+
+def enqueue(db, notification_id, user_id, recipient, message, channel="sms"):
+    """Queue a delivery. Runs inside the caller's transaction; does not commit."""
+    enqueue_many(db, [(notification_id, user_id, recipient, message)], channel)
+
+def enqueue_many(db, deliveries, channel="sms"):
+    """Queue (notification_id, user_id, recipient, message) tuples with one executemany."""
+    now = time.time()
+    db.executemany("""
+        INSERT INTO notification_outbox
+        (notification_id, user_id, channel, recipient, message, status, attempts, next_attempt_at, created_at)
+        VALUES (?, ?, ?, ?, ?, 'pending', 0, ?, ?)
+    """, [(n, u, channel, r, m, now, now) for n, u, r, m in deliveries])
+
+# -------------------- SINKS --------------------
+
+class LogSink:
+    """Default sink until a real SMS/push gateway is configured."""
+
+    def send(self, recipient, message):
+        log.info("notify %s: %s", recipient, message)
+
+# -------------------- DISPATCHER --------------------
+
+class Dispatcher:
+    def __init__(self, path, sink=None, batch_size=100, interval=1.0,
+                 max_attempts=6, backoff=2.0, max_backoff=300.0, lease=60.0):
+        self.path = path
+        self.sink = sink or LogSink()
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.lease = lease
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _claim(self, db, now):
+        # A claimed row is leased by pushing next_attempt_at forward; if this
+        # process dies mid-batch the row simply becomes due again.
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            rows = db.execute("""
+                SELECT id, recipient, message, attempts FROM notification_outbox
+                WHERE status='pending' AND next_attempt_at <= ?
+                ORDER BY next_attempt_at
+                LIMIT ?
+            """, (now, self.batch_size)).fetchall()
+            db.executemany(
+                "UPDATE notification_outbox SET next_attempt_at=? WHERE id=?",
+                [(now + self.lease, row["id"]) for row in rows]
+            )
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        return rows
+
+    def retry_delay(self, attempts):
+        return min(self.backoff * 2 ** (attempts - 1), self.max_backoff)
+
+    def run_once(self, now=None):
+        """Deliver one batch of due messages. Returns (sent, failed) counts."""
+        now = time.time() if now is None else now
+        db = connect(self.path)
+        try:
+            rows = self._claim(db, now)
+            if not rows:
+                return 0, 0
+            sent, retry, dead = [], [], []
+            for row in rows:
+                attempts = row["attempts"] + 1
+                try:
+                    self.sink.send(row["recipient"], row["message"])
+                except Exception as exc:
+                    log.warning("delivery %s failed (attempt %s): %s", row["id"], attempts, exc)
+                    if attempts >= self.max_attempts:
+                        dead.append((attempts, str(exc), row["id"]))
+                    else:
+                        retry.append((attempts, now + self.retry_delay(attempts), str(exc), row["id"]))
+                else:
+                    sent.append((attempts, time.time(), row["id"]))
+
+            db.executemany(
+                "UPDATE notification_outbox SET status='sent', attempts=?, sent_at=?, last_error=NULL WHERE id=?",
+                sent
+            )
+            db.executemany(
+                "UPDATE notification_outbox SET attempts=?, next_attempt_at=?, last_error=? WHERE id=?",
+                retry
+            )
+            db.executemany(
+                "UPDATE notification_outbox SET status='failed', attempts=?, last_error=? WHERE id=?",
+                dead
+            )
+            db.commit()
+            return len(sent), len(retry) + len(dead)
+        finally:
+            db.close()
+
+    def drain(self):
+        """Deliver everything currently due (used by tests and one-off scripts)."""
+        total = 0
+        while True:
+            sent, failed = self.run_once()
+            if not sent and not failed:
+                return total
+            total += sent
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                sent, failed = self.run_once()
+            except Exception:
+                log.exception("outbox dispatch failed")
+                sent = failed = 0
+            # Keep going straight away while there is a backlog
+            if sent + failed < self.batch_size:
+                self._stop.wait(self.interval)
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, name="outbox-dispatcher", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
@@ -0,0 +1,41 @@
+import base64
+import json
+
+# Cursors are opaque to clients: a url-safe base64 of the keyset values of the
+# last row served, tagged with the listing they belong to.
+
+class InvalidCursor(ValueError):
+    pass
+
+def encode_cursor(kind, values):
+    raw = json.dumps([kind, list(values)], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+def decode_cursor(kind, token, size=None):
+    # size=None accepts any number of values
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        tag, values = json.loads(raw)
+    except (ValueError, TypeError):
+        raise InvalidCursor(token) from None
+    if (tag != kind or not isinstance(values, list) or (size is not None and len(values) != size)
+            or not all(isinstance(v, (str, int)) for v in values)):
+        raise InvalidCursor(token)
+    return values
+
+def page_size(requested, default, maximum):
+    if requested in (None, ""):
+        return default
+    try:
+        size = int(requested)
+    except (TypeError, ValueError):
+        raise InvalidCursor(requested) from None
+    return max(1, min(size, maximum))
+
+def split_page(rows, limit, kind, key):
+    """Trim a LIMIT limit+1 result to one page and build the next cursor."""
+    rows = list(rows)
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(kind, key(rows[-1]))
@@ -0,0 +1,135 @@
+import atexit
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+
+# qrcode/PIL are imported inside the render functions so that processes which
+# never draw a QR code don't pay for loading them.
+
+FORMATS = {"png": "image/png", "svg": "image/svg+xml"}
+
+def etag_for(health_uuid, fmt):
+    # Rendering is deterministic, so the tag is known before anything is drawn.
+    return hashlib.sha256(f"qr-v1:{fmt}:{health_uuid}".encode()).hexdigest()
+
+def render(health_uuid, fmt="png"):
+    import qrcode
+    if fmt == "svg":
+        import qrcode.image.svg
+        img = qrcode.make(health_uuid, image_factory=qrcode.image.svg.SvgPathImage)
+    else:
+        img = qrcode.make(health_uuid)
+    buf = io.BytesIO()
+    img.save(buf)
+    return buf.getvalue()
+
+# -------------------- CACHE --------------------
+
+class QRCache:
+    """Bounded in-memory LRU in front of a content-addressed directory of renders."""
+
+    def __init__(self, directory=None, max_entries=1024):
+        self.directory = directory
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _path(self, tag, fmt):
+        return os.path.join(self.directory, tag[:2], f"{tag}.{fmt}")
+
+    def _remember(self, tag, data):
+        with self._lock:
+            self._entries[tag] = data
+            self._entries.move_to_end(tag)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def lookup(self, health_uuid, fmt="png"):
+        tag = etag_for(health_uuid, fmt)
+        with self._lock:
+            data = self._entries.get(tag)
+            if data is not None:
+                self._entries.move_to_end(tag)
+                return data
+        if self.directory:
+            try:
+                with open(self._path(tag, fmt), "rb") as f:
+                    data = f.read()
+            except FileNotFoundError:
+                return None
+            self._remember(tag, data)
+        return data
+
+    def store(self, health_uuid, fmt, data):
+        tag = etag_for(health_uuid, fmt)
+        self._remember(tag, data)
+        if self.directory:
+            path = self._path(tag, fmt)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write-then-rename so concurrent readers never see a partial file
+            tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+
+    def get(self, health_uuid, fmt="png"):
+        data = self.lookup(health_uuid, fmt)
+        if data is None:
+            data = render(health_uuid, fmt)
+            self.store(health_uuid, fmt, data)
+        return data
+
+    def get_many(self, health_uuids, executor=None):
+        """PNG bytes for each ID, rendering cache misses on ``executor`` if given."""
+        found = {hid: self.lookup(hid) for hid in health_uuids}
+        missing = [hid for hid, data in found.items() if data is None]
+        if missing:
+            rendered = executor.map(render, missing, chunksize=16) if executor else map(render, missing)
+            for hid, data in zip(missing, rendered):
+                self.store(hid, "png", data)
+                found[hid] = data
+        return [found[hid] for hid in health_uuids]
+
+# -------------------- PRINT SHEETS --------------------
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def get_executor(workers):
+    global _executor
+    if workers <= 0:
+        return None
+    with _executor_lock:
+        if _executor is None:
+            # Deferred like qrcode/PIL: only admins printing sheets need it
+            from concurrent.futures import ProcessPoolExecutor
+            _executor = ProcessPoolExecutor(max_workers=workers)
+            # Shut down before interpreter teardown, when imported lazily the
+            # pool's finalizer otherwise runs after multiprocessing is gone
+            atexit.register(_executor.shutdown)
+    return _executor
+
+def render_sheet(health_uuids, pngs, columns=3, rows=4, cell=300):
+    """Lay out labelled codes on A4-proportioned pages and return a PDF."""
+    from PIL import Image, ImageDraw
+
+    width, height = columns * cell, int(rows * cell * 1.1)
+    per_page = columns * rows
+    pages = []
+    for start in range(0, len(pngs), per_page):
+        page = Image.new("RGB", (width, height), "white")
+        draw = ImageDraw.Draw(page)
+        for i, (hid, png) in enumerate(zip(health_uuids[start:start + per_page],
+                                           pngs[start:start + per_page])):
+            x = (i % columns) * cell
+            y = (i // columns) * int(cell * 1.1)
+            code = Image.open(io.BytesIO(png)).convert("RGB").resize((cell - 20, cell - 20))
+            page.paste(code, (x + 10, y + 10))
+            draw.text((x + 10, y + cell - 8), hid, fill="black")
+        pages.append(page)
+
+    buf = io.BytesIO()
+    pages[0].save(buf, format="PDF", save_all=True, append_images=pages[1:])
+    return buf.getvalue()
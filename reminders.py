@@ -0,0 +1,123 @@
+import logging
+import threading
+from datetime import date, timedelta
+
+import outbox
+from database import connect
+
+log = logging.getLogger(__name__)
+
+# A reminder of kind "T-n" fires for visits at most n days away. Each kind owns
+# the window of days between it and the next closer offset, so a sweep that
+# runs late still sends exactly one reminder per kind.
+OFFSETS = (3, 1)
+
+def windows(today, offsets=OFFSETS):
+    previous = 0
+    for offset in sorted(offsets):
+        yield f"T-{offset}", (today + timedelta(days=previous + 1)).isoformat(), \
+            (today + timedelta(days=offset)).isoformat()
+        previous = offset
+
+def sweep(db, message, today=None, offsets=OFFSETS, batch_size=1000):
+    """Create due next-visit reminders. Returns the number created.
+
+    ``message(lang, date, days_left)`` formats the text. Rows are read in keyset batches
+    over the next_visit index, so memory stays bounded by ``batch_size``.
+    """
+    today = today or date.today()
+    created = 0
+    for kind, start, end in windows(today, offsets):
+        # Keyset over (next_visit, id), which is exactly the index order
+        last = (start, 0)
+        while True:
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                rows = db.execute("""
+                    SELECT r.id, r.next_visit, users.id AS user_id, users.phone, users.language
+                    FROM medical_records r
+                    JOIN health_ids ON health_ids.health_uuid = r.health_uuid
+                    JOIN users ON users.id = health_ids.user_id
+                    WHERE (r.next_visit, r.id) > (?, ?) AND r.next_visit <= ?
+                      AND NOT EXISTS (SELECT 1 FROM visit_reminders v WHERE v.record_id = r.id AND v.kind = ?)
+                      -- Only a patient's latest record says when they are due back
+                      AND NOT EXISTS (
+                          SELECT 1 FROM medical_records newer
+                          WHERE newer.health_uuid = r.health_uuid
+                            AND (newer.created_at, newer.id) > (r.created_at, r.id)
+                      )
+                    ORDER BY r.next_visit, r.id
+                    LIMIT ?
+                """, (*last, end, kind, batch_size)).fetchall()
+                created += _send_batch(db, rows, kind, message, today)
+                db.commit()
+            except Exception:
+                db.rollback()
+                raise
+            if len(rows) < batch_size:
+                break
+            last = (rows[-1]["next_visit"], rows[-1]["id"])
+    return created
+
+def _send_batch(db, rows, kind, message, today):
+    texts = {}
+    created = 0
+    for row in rows:
+        sent = db.execute(
+            "INSERT OR IGNORE INTO visit_reminders (record_id, kind, sent_on) VALUES (?, ?, ?)",
+            (row["id"], kind, today.isoformat())
+        )
+        if not sent.rowcount:
+            continue # another sweeper got here first
+        key = (row["language"], row["next_visit"])
+        if key not in texts:
+            days_left = (date.fromisoformat(row["next_visit"]) - today).days
+            texts[key] = message(*key, days_left)
+        cur = db.execute(
+            "INSERT INTO notifications (user_id, message, language) VALUES (?, ?, ?)",
+            (row["user_id"], texts[key], row["language"])
+        )
+        outbox.enqueue(db, cur.lastrowid, row["user_id"], row["phone"], texts[key])
+        created += 1
+    return created
+
+# -------------------- SCHEDULER --------------------
+
+class ReminderScheduler:
+    def __init__(self, path, message, interval=3600.0, offsets=OFFSETS, batch_size=1000):
+        self.path = path
+        self.message = message
+        self.interval = interval
+        self.offsets = offsets
+        self.batch_size = batch_size
+        self._stop = threading.Event()
+        self._thread = None
+
+    def run_once(self, today=None):
+        db = connect(self.path)
+        try:
+            return sweep(db, self.message, today, self.offsets, self.batch_size)
+        finally:
+            db.close()
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                created = self.run_once()
+                if created:
+                    log.info("queued %s visit reminders", created)
+            except Exception:
+                log.exception("reminder sweep failed")
+            self._stop.wait(self.interval)
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, name="visit-reminders", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
@@ -0,0 +1,127 @@
+import gzip
+import json
+import sqlite3
+
+from flask import request
+from flask.json.provider import DefaultJSONProvider, JSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Response bodies on their way out: JSON is encoded straight to UTF-8 bytes
+# (sqlite rows included, so routes can hand over cursors' rows as they come;
+# each row still becomes a short-lived dict on the way), then compressed for clients that accept it. Both the fast encoder and
+# brotli are optional; without them the stdlib json and gzip paths are used.
+
+# -------------------- JSON --------------------
+
+def _default(o):
+    if isinstance(o, sqlite3.Row):
+        # Neither encoder can take pre-encoded members (orjson.Fragment needs
+        # 3.9+), and encoding values one by one measured slower than the copy
+        return dict(zip(o.keys(), o))
+    # Same rendering as Flask's provider for dates, UUIDs, dataclasses, ...
+    return DefaultJSONProvider.default(o)
+
+_stdlib = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"), default=_default)
+
+def _dumps_stdlib(obj):
+    return _stdlib.encode(obj).encode()
+
+def _dumps_orjson(obj):
+    # Dates go through _default so both encoders render them alike
+    return orjson.dumps(obj, default=_default,
+                        option=orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME)
+
+ENCODERS = {"json": (_dumps_stdlib, json.loads)}
+if orjson is not None:
+    ENCODERS["orjson"] = (_dumps_orjson, orjson.loads)
+
+def best_encoder():
+    return "orjson" if "orjson" in ENCODERS else "json"
+
+
+class FastJSONProvider(JSONProvider):
+    """Flask JSON provider backed by one of ENCODERS; jsonify() skips the str round trip."""
+
+    def __init__(self, app):
+        super().__init__(app)
+        self.use(app.config.get("JSON_ENCODER") or best_encoder())
+
+    def use(self, name):
+        self.encoder = name
+        self._dumps, self._loads = ENCODERS[name]
+
+    def dumps(self, obj, **kwargs):
+        return self._dumps(obj).decode()
+
+    def loads(self, s, **kwargs):
+        return self._loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self._dumps(obj), mimetype="application/json")
+
+# -------------------- COMPRESSION --------------------
+
+COMPRESSIBLE = {
+    "application/json", "application/x-ndjson", "application/javascript",
+    "image/svg+xml", "text/css", "text/csv", "text/html", "text/javascript", "text/plain",
+}
+
+def available_encodings():
+    # Server preference when the client rates several equally
+    return ["br", "gzip"] if brotli is not None else ["gzip"]
+
+def compress(data, encoding, gzip_level=6, brotli_quality=5):
+    if encoding == "br":
+        return brotli.compress(data, quality=brotli_quality)
+    # mtime=0 keeps the output (and any cache keyed on it) deterministic
+    return gzip.compress(data, gzip_level, mtime=0)
+
+def compress_response(response, accept_encodings, min_size=512, gzip_level=6, brotli_quality=5):
+    """Compress a buffered response in place if the client accepts it and it's worth it."""
+    if (response.status_code < 200 or response.status_code in (204, 304)
+            or response.is_streamed or response.direct_passthrough
+            or "Content-Encoding" in response.headers
+            or response.mimetype not in COMPRESSIBLE
+            or "no-transform" in response.headers.get("Cache-Control", "")):
+        return response
+    # Streamed and passthrough bodies were excluded above, so this is cheap
+    if response.content_length is not None and response.content_length < min_size:
+        return response
+    response.vary.add("Accept-Encoding")
+    encoding = accept_encodings.best_match(available_encodings())
+    if encoding is None:
+        return response
+
+    response.set_data(compress(response.get_data(), encoding, gzip_level, brotli_quality))
+    response.headers["Content-Encoding"] = encoding
+    # The bytes changed, so a strong validator no longer holds
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+# -------------------- FLASK --------------------
+
+def init_app(app):
+    app.config.setdefault("JSON_ENCODER", None) # None picks the fastest installed
+    app.config.setdefault("COMPRESS_MIN_SIZE", 512)
+    app.config.setdefault("COMPRESS_GZIP_LEVEL", 6)
+    app.config.setdefault("COMPRESS_BROTLI_QUALITY", 5)
+    app.json = FastJSONProvider(app)
+
+    @app.after_request
+    def compress_body(response):
+        return compress_response(response, request.accept_encodings,
+                                 app.config["COMPRESS_MIN_SIZE"],
+                                 app.config["COMPRESS_GZIP_LEVEL"],
+                                 app.config["COMPRESS_BROTLI_QUALITY"])
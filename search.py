@@ -0,0 +1,58 @@
+import heapq
+import re
+from itertools import islice
+
+# Full-text search over medical_records through the records_fts index
+# (migration 9). User input never reaches FTS5 syntax directly: every word is
+# quoted and turned into a prefix term, and the terms are ANDed.
+
+MAX_TERMS = 8
+
+_words = re.compile(r"[^\s\"*():^+-]+")
+
+def match_expression(text):
+    """'penic asth' -> '"penic"* "asth"*', or None if there is nothing to search."""
+    terms = _words.findall(text or "")[:MAX_TERMS]
+    if not terms:
+        return None
+    return " ".join(f'"{term}"*' for term in terms)
+
+def search(db, text, limit, offset=0):
+    """Ranked matches (best first) with a highlighted snippet, plus whether more exist."""
+    rows = ranked(db, text, limit + 1, offset)
+    return [_strip(row) for row in rows[:limit]], len(rows) > limit
+
+def ranked(db, text, limit, offset=0):
+    """Like search(), but rows keep their bm25 "rank" for merging across shards."""
+    expression = match_expression(text)
+    if expression is None:
+        return []
+    rows = db.execute("""
+        SELECT r.id, r.health_uuid, r.diagnosis, r.prescription, r.allergies, r.injuries, r.remarks,
+               r.next_visit, r.created_at, hits.snippet, hits.rank
+        FROM (
+            SELECT rowid, rank, snippet(records_fts, -1, '[', ']', '…', 10) AS snippet
+            FROM records_fts
+            WHERE records_fts MATCH ?
+            ORDER BY rank, rowid
+            LIMIT ? OFFSET ?
+        ) AS hits
+        JOIN medical_records r ON r.id = hits.rowid
+        ORDER BY hits.rank, hits.rowid
+    """, (expression, limit, offset)).fetchall()
+    return [dict(row) for row in rows]
+
+def merge(pages, limit, offset=0):
+    """One page of search() from several shards' ranked() lists.
+
+    Each list must start at offset 0 and hold offset + limit + 1 rows. bm25
+    scores use each shard's own term statistics, so the interleaving is
+    close to, not exactly, what a single index would give.
+    """
+    rows = list(islice(heapq.merge(*pages, key=lambda r: (r["rank"], r["id"])),
+                       offset, offset + limit + 1))
+    return [_strip(row) for row in rows[:limit]], len(rows) > limit
+
+def _strip(row):
+    del row["rank"]
+    return row
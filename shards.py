@@ -0,0 +1,394 @@
+"""Horizontal sharding of patient data by health ID.
+
+    python shards.py status
+    python shards.py split main shard-1 --path shards/shard-1.db
+    python shards.py repair
+
+A health ID hashes to a point in [0, 2**32); the shard map (migration 13, in
+the main database) splits that space into ranges, each owned by one SQLite
+file. A worker's health_ids and users rows, medical records, notifications
+and their outbox live in the owning shard, so requests about one patient
+touch one file and writes to different shards never share a write lock.
+
+The main database is also the directory: it keeps every users and
+health_ids row, so /login and /signup phone lookups and user -> health ID
+resolution never fan out. Other shards hold copies of their own workers'
+rows, which keeps their joins local. Until the first split, main owns the
+whole range and nothing here changes how a single database behaves.
+
+Splitting is offline: stop the app, split, start it again.
+"""
+import argparse
+import bisect
+import hashlib
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app, g, has_app_context
+
+import analytics
+import archive
+import migrations
+import database
+from database import DB, connect, get_db, get_pool
+
+MAIN = "main"
+SPACE = 1 << 32
+# Each shard hands out record/notification ids from its own range, so ids
+# stay unique across shards (and survive moves). 2**40 per shard leaves room
+# for 8192 shards below 2**53, the largest id JavaScript clients represent exactly.
+ID_STRIDE = 1 << 40
+SEQUENCED = ("medical_records", "notifications", "notification_outbox")
+
+def key_hash(health_uuid):
+    return int.from_bytes(hashlib.sha1(str(health_uuid).encode()).digest()[:4], "big")
+
+def archive_dir(base, name):
+    """Each shard archives its own records; main keeps the top-level directory."""
+    return base if name == MAIN else os.path.join(base, name)
+
+# -------------------- MAP --------------------
+
+class ShardMap:
+    """Sorted hash ranges: the shard at ``starts[i]`` owns up to ``starts[i + 1]``."""
+
+    def __init__(self, main_path, rows):
+        rows = sorted(rows) or [(0, MAIN, None)]
+        self.main_path = main_path
+        self.starts = [start for start, _, _ in rows]
+        self.names = [name for _, name, _ in rows]
+        base = os.path.dirname(os.path.abspath(main_path))
+        self.paths = {name: main_path if name == MAIN else os.path.join(base, path)
+                      for _, name, path in rows}
+
+    def __len__(self):
+        return len(self.names)
+
+    def shard_for(self, health_uuid):
+        return self.names[bisect.bisect_right(self.starts, key_hash(health_uuid)) - 1]
+
+    def range(self, name):
+        i = self.names.index(name)
+        return self.starts[i], self.starts[i + 1] if i + 1 < len(self.starts) else SPACE
+
+    def group(self, health_uuids):
+        """{shard: [health_uuid, ...]}, keeping input order within each shard."""
+        groups = {}
+        for health_uuid in health_uuids:
+            groups.setdefault(self.shard_for(health_uuid), []).append(health_uuid)
+        return groups
+
+
+def load_map(db, main_path):
+    try:
+        rows = db.execute("SELECT start, name, path FROM shard_map").fetchall()
+    except Exception:
+        rows = [] # not migrated yet: a single database
+    return ShardMap(main_path, [tuple(row) for row in rows])
+
+_maps = {}
+_maps_lock = threading.Lock()
+
+def get_map(main_path=None):
+    """The shard map of ``main_path`` (the app's database by default), read once per process."""
+    if main_path is None:
+        main_path = current_app.config.get("DATABASE", DB) if has_app_context() else DB
+    key = (os.getpid(), main_path)
+    smap = _maps.get(key)
+    if smap is None:
+        with _maps_lock:
+            smap = _maps.get(key)
+            if smap is None:
+                db = connect(main_path)
+                try:
+                    smap = _maps[key] = load_map(db, main_path)
+                finally:
+                    db.close()
+    return smap
+
+def reset():
+    """Forget cached maps, e.g. after a split in this process."""
+    with _maps_lock:
+        _maps.clear()
+
+def migrate_shards(main_path):
+    """Bring every shard other than main (migrated by the caller) up to date."""
+    reset()
+    for name, path in get_map(main_path).paths.items():
+        if name != MAIN:
+            db = connect(path)
+            try:
+                migrations.migrate(db)
+            finally:
+                db.close()
+
+# -------------------- FLASK --------------------
+
+def get_shard_db(name):
+    """Pooled connection to shard ``name`` for the current app context."""
+    if name == MAIN:
+        return get_db()
+    if "shard_dbs" not in g:
+        g.shard_dbs = {}
+    db = g.shard_dbs.get(name)
+    if db is None:
+        db = g.shard_dbs[name] = _pool(name).acquire()
+    return db
+
+def db_for(health_uuid):
+    return get_shard_db(get_map().shard_for(health_uuid))
+
+def _pool(name):
+    return get_pool(get_map().paths[name], current_app.config.get("DB_POOL_SIZE", 8))
+
+def close_shards(exc=None):
+    for name, db in g.pop("shard_dbs", {}).items():
+        _pool(name).release(db)
+
+def write(name, fn):
+    """Run ``fn(db)`` as one transaction on shard ``name``'s writer."""
+    return database.write(fn, get_map().paths[name])
+
+def write_for(health_uuid, fn):
+    return write(get_map().shard_for(health_uuid), fn)
+
+_scatter = None
+_scatter_lock = threading.Lock()
+
+def scatter(fn):
+    """[(name, fn(name, db))] over every shard in map order; shards run in parallel.
+
+    SQLite releases the GIL while it reads, so N shards cost about the
+    slowest one rather than the sum.
+    """
+    global _scatter
+    smap = get_map()
+    if len(smap) == 1:
+        return [(MAIN, fn(MAIN, get_db()))]
+    if _scatter is None:
+        with _scatter_lock:
+            if _scatter is None:
+                _scatter = ThreadPoolExecutor(8, thread_name_prefix="shard-scatter")
+    futures = [(name, _scatter.submit(fn, name, get_shard_db(name))) for name in smap.names]
+    return [(name, future.result()) for name, future in futures]
+
+def place_workers(directory, health_uuids, smap=None):
+    """Copy workers' users/health_ids rows from the directory into their shards.
+
+    Idempotent; run after the directory insert commits. ``repair`` redoes it
+    for every worker if a process died in between.
+    """
+    smap = smap or get_map()
+    for name, group in smap.group(health_uuids).items():
+        if name == MAIN:
+            continue
+        marks = ",".join("?" * len(group))
+        ids = directory.execute(
+            f"SELECT * FROM health_ids WHERE health_uuid IN ({marks})", group).fetchall()
+        users = directory.execute(f"""
+            SELECT * FROM users WHERE id IN (SELECT user_id FROM health_ids WHERE health_uuid IN ({marks}))
+        """, group).fetchall()
+
+        def copy(db, ids=ids, users=users):
+            for table, rows in (("users", users), ("health_ids", ids)):
+                if rows:
+                    db.executemany(f"INSERT OR IGNORE INTO {table} VALUES ({','.join('?' * len(rows[0]))})",
+                                   [tuple(row) for row in rows])
+        database.write(copy, smap.paths[name])
+
+def init_app(app):
+    app.teardown_appcontext(close_shards)
+
+# -------------------- REBALANCING --------------------
+
+def _seed_sequences(db, base):
+    for table in SEQUENCED:
+        row = db.execute("SELECT seq FROM sqlite_sequence WHERE name=?", (table,)).fetchone()
+        if row is None:
+            db.execute("INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)", (table, base))
+        elif row[0] < base:
+            db.execute("UPDATE sqlite_sequence SET seq=? WHERE name=?", (base, table))
+    db.commit()
+
+def _move_batch(db, batch, source, directory, keep_workers):
+    marks = ",".join("?" * len(batch))
+    users = f"SELECT user_id FROM {directory}.health_ids WHERE health_uuid IN ({marks})"
+    records = f"SELECT id FROM {source}.medical_records WHERE health_uuid IN ({marks})"
+    copies = [
+        f"INSERT OR IGNORE INTO main.users SELECT * FROM {directory}.users WHERE id IN ({users})",
+        f"INSERT OR IGNORE INTO main.health_ids SELECT * FROM {directory}.health_ids WHERE health_uuid IN ({marks})",
+        f"INSERT OR IGNORE INTO main.medical_records SELECT * FROM {source}.medical_records WHERE health_uuid IN ({marks})",
+        f"INSERT OR IGNORE INTO main.visit_reminders SELECT * FROM {source}.visit_reminders WHERE record_id IN ({records})",
+        f"INSERT OR IGNORE INTO main.notifications SELECT * FROM {source}.notifications WHERE user_id IN ({users})",
+        f"INSERT OR IGNORE INTO main.notification_outbox SELECT * FROM {source}.notification_outbox WHERE user_id IN ({users})",
+        f"INSERT OR IGNORE INTO main.archived_patients SELECT * FROM {source}.archived_patients WHERE health_uuid IN ({marks})",
+    ]
+    deletes = [
+        f"DELETE FROM {source}.visit_reminders WHERE record_id IN ({records})",
+        f"DELETE FROM {source}.medical_records WHERE health_uuid IN ({marks})",
+        f"DELETE FROM {source}.notification_outbox WHERE user_id IN ({users})",
+        f"DELETE FROM {source}.notifications WHERE user_id IN ({users})",
+        f"DELETE FROM {source}.archived_patients WHERE health_uuid IN ({marks})",
+    ]
+    if not keep_workers:
+        deletes += [
+            f"DELETE FROM {source}.users WHERE id IN ({users})",
+            f"DELETE FROM {source}.health_ids WHERE health_uuid IN ({marks})",
+        ]
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        for sql in copies:
+            db.execute(sql, batch)
+        # A move is not a delete as far as /sync is concerned (migration 12)
+        db.execute(f"INSERT INTO {source}.archive_in_progress (started_at) VALUES (?)", (time.time(),))
+        for sql in deletes:
+            db.execute(sql, batch)
+        db.execute(f"DELETE FROM {source}.archive_in_progress")
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+def _move_archives(db, moving, source_dir, target_dir, batch_size):
+    for year in archive.years(source_dir):
+        schema = f"archive_{year}"
+        os.makedirs(target_dir, exist_ok=True)
+        db.execute("ATTACH DATABASE ? AS moving_from", (archive.path_for(source_dir, year),))
+        db.execute(f"ATTACH DATABASE ? AS {schema}", (archive.path_for(target_dir, year),))
+        try:
+            columns = ", ".join(archive._create_partition(db, schema))
+            for i in range(0, len(moving), batch_size):
+                batch = moving[i:i + batch_size]
+                marks = ",".join("?" * len(batch))
+                db.execute("BEGIN IMMEDIATE")
+                try:
+                    db.execute(f"""
+                        INSERT OR IGNORE INTO {schema}.medical_records ({columns})
+                        SELECT {columns} FROM moving_from.medical_records WHERE health_uuid IN ({marks})
+                    """, batch)
+                    db.execute(f"DELETE FROM moving_from.medical_records WHERE health_uuid IN ({marks})", batch)
+                    db.commit()
+                except Exception:
+                    db.rollback()
+                    raise
+        finally:
+            db.execute("DETACH DATABASE moving_from")
+            db.execute(f"DETACH DATABASE {schema}")
+
+def split(main_path, name, new_name, new_path, archive_base=None, batch_size=500):
+    """Move the upper half of shard ``name``'s hash range into a new database.
+
+    Returns the number of health IDs moved. Copies are INSERT OR IGNORE and
+    the map is updated last, so a run that dies part way can simply be
+    repeated. The app must not be running.
+    """
+    main = connect(main_path)
+    try:
+        migrations.migrate(main)
+        smap = load_map(main, main_path)
+        if new_name in smap.paths:
+            raise ValueError(f"shard {new_name!r} already exists")
+        start, end = smap.range(name)
+        if end - start < 2:
+            raise ValueError(f"shard {name!r} owns too small a range to split")
+        mid = (start + end) // 2
+        moving = [hid for (hid,) in main.execute("SELECT health_uuid FROM health_ids")
+                  if mid <= key_hash(hid) < end]
+        base = main.execute("SELECT MAX(id_base) FROM shard_map").fetchone()[0] + ID_STRIDE
+    finally:
+        main.close()
+
+    source_path = smap.paths[name]
+    os.makedirs(os.path.dirname(os.path.abspath(new_path)), exist_ok=True)
+    db = connect(new_path)
+    try:
+        migrations.migrate(db)
+        _seed_sequences(db, base)
+        db.execute("ATTACH DATABASE ? AS source", (source_path,))
+        if name != MAIN:
+            db.execute("ATTACH DATABASE ? AS directory", (main_path,))
+        for i in range(0, len(moving), batch_size):
+            _move_batch(db, moving[i:i + batch_size], "source",
+                        "source" if name == MAIN else "directory", keep_workers=name == MAIN)
+        db.execute("DETACH DATABASE source")
+        if name != MAIN:
+            db.execute("DETACH DATABASE directory")
+        if archive_base:
+            _move_archives(db, moving, archive_dir(archive_base, name),
+                           archive_dir(archive_base, new_name), batch_size)
+        # Rollups only count inserts; recount both sides of the move,
+        # archived records included
+        analytics.rebuild(db, archive_dir=archive_base and archive_dir(archive_base, new_name))
+    finally:
+        db.close()
+    source = connect(source_path)
+    try:
+        analytics.rebuild(source, archive_dir=archive_base and archive_dir(archive_base, name))
+    finally:
+        source.close()
+
+    main = connect(main_path)
+    try:
+        stored = os.path.relpath(os.path.abspath(new_path), os.path.dirname(os.path.abspath(main_path)))
+        main.execute("INSERT INTO shard_map (start, name, path, id_base) VALUES (?, ?, ?, ?)",
+                     (mid, new_name, stored, base))
+        main.commit()
+    finally:
+        main.close()
+    reset()
+    return len(moving)
+
+def repair(main_path, batch_size=1000):
+    """Re-copy every worker into its shard. Returns the number of workers checked."""
+    smap = get_map(main_path)
+    directory = connect(main_path)
+    try:
+        hids = [hid for (hid,) in directory.execute("SELECT health_uuid FROM health_ids")]
+        for i in range(0, len(hids), batch_size):
+            place_workers(directory, hids[i:i + batch_size], smap)
+    finally:
+        directory.close()
+    return len(hids)
+
+def status(main_path):
+    """(name, share of the hash space, records, notifications) per shard."""
+    smap = get_map(main_path)
+    rows = []
+    for name in smap.names:
+        start, end = smap.range(name)
+        db = connect(smap.paths[name])
+        try:
+            records = db.execute("SELECT COUNT(*) FROM medical_records").fetchone()[0]
+            notes = db.execute("SELECT COUNT(*) FROM notifications").fetchone()[0]
+        finally:
+            db.close()
+        rows.append((name, (end - start) / SPACE, records, notes))
+    return rows
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database", default="database.db", help="the main (directory) database")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("status")
+    commands.add_parser("repair", help="copy missing workers into their shards")
+    split_cmd = commands.add_parser("split", help="move half of a shard's range to a new database")
+    split_cmd.add_argument("shard")
+    split_cmd.add_argument("new_shard")
+    split_cmd.add_argument("--path", help="new database file (default shards/<new_shard>.db)")
+    split_cmd.add_argument("--archive-dir", default="archive", help="ARCHIVE_DIR of the app")
+    split_cmd.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args(argv)
+
+    if args.command == "split":
+        path = args.path or os.path.join("shards", f"{args.new_shard}.db")
+        moved = split(args.database, args.shard, args.new_shard, path, args.archive_dir, args.batch_size)
+        print(f"moved {moved} health IDs from {args.shard} to {args.new_shard} ({path})")
+    elif args.command == "repair":
+        print(f"checked {repair(args.database)} workers")
+    for name, share, records, notes in status(args.database):
+        print(f"{name:12} {share:7.2%} of IDs  {records:>10} records  {notes:>10} notifications")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+import pagination
+from shards import MAIN
+
+# Delta sync. Triggers (migration 8) append to change_log whenever a synced row
+# changes, tagged with the scopes that can see it ("health_uuid:HID-...",
+# "doctor_id:7", "user_id:7"). A client keeps the seq of the last change it
+# applied as an opaque token and asks only for what came after it.
+#
+# SQLite has a single writer and seq is AUTOINCREMENT, so a reader never sees
+# seq N+1 committed before seq N; a token can't skip a change.
+#
+# Each shard (see shards.py) has its own change_log, so a token holds one seq
+# per shard it has read from. Until the first split that is just main's seq,
+# which is also what tokens issued before sharding contain.
+#
+# Only the hot table is synced. Records moved to the archive partitions
+# (archive.py) are not reported as deletions, but a client syncing from an
+# empty token never receives them either; older history is read per patient
+# through /doctor/get_patient, which falls through to the archives.
+
+TABLES = {
+    "records": ("medical_records", ["id", "health_uuid", "diagnosis", "prescription", "blood_group",
+                                    "blood_summary", "injuries", "allergies", "remarks", "next_visit",
+                                    "created_at"]),
+    "notifications": ("notifications", ["id", "message", "language", "is_read"]),
+}
+
+def decode_token(token):
+    """{shard: seq} from a client's token; shards it doesn't name start at 0."""
+    if not token:
+        return {}
+    values = pagination.decode_cursor("sync", token)
+    if len(values) == 1:
+        values = [MAIN, *values]
+    seqs = dict(zip(values[::2], values[1::2]))
+    if (len(values) % 2 or len(seqs) * 2 != len(values)
+            or not all(isinstance(k, str) and isinstance(v, int) for k, v in seqs.items())):
+        raise pagination.InvalidCursor(token)
+    return seqs
+
+def encode_token(seqs):
+    if set(seqs) <= {MAIN}:
+        return pagination.encode_cursor("sync", (seqs.get(MAIN, 0),))
+    return pagination.encode_cursor("sync", [v for item in sorted(seqs.items()) for v in item])
+
+def changes(db, scopes, since=0, limit=500):
+    """Rows changed after ``since`` for ``scopes``: {tbl: (column, value)}.
+
+    Rows come back in a compact columns + rows form; rows that were deleted
+    (or moved out of scope) are listed by id under "deleted". "seq" is the
+    position reached in this database's change_log; merge() turns it into
+    the client's token.
+    """
+    tags = [f"{column}:{value}" for column, value in scopes.values()]
+    log = db.execute(f"""
+        SELECT seq, tbl, row_id FROM change_log
+        WHERE scope IN ({",".join("?" * len(tags))}) AND seq > ?
+        ORDER BY seq
+        LIMIT ?
+    """, (*tags, since, limit + 1)).fetchall()
+    more = len(log) > limit
+    log = log[:limit]
+
+    changed = {}
+    for row in log:
+        if row["tbl"] in scopes:
+            changed.setdefault(row["tbl"], {})[row["row_id"]] = None
+
+    result = {"seq": log[-1]["seq"] if log else since, "more": more}
+    deleted = {}
+    for tbl, ids in changed.items():
+        table, columns = TABLES[tbl]
+        column, value = scopes[tbl]
+        rows = db.execute(f"""
+            SELECT {", ".join(columns)} FROM {table}
+            WHERE id IN ({",".join("?" * len(ids))}) AND {column} = ?
+            ORDER BY id
+        """, (*ids, value)).fetchall()
+        if rows:
+            result[tbl] = {"cols": columns, "rows": [list(row) for row in rows]}
+        gone = set(ids) - {row["id"] for row in rows}
+        if gone:
+            deleted[tbl] = sorted(gone)
+    if deleted:
+        result["deleted"] = deleted
+    return result
+
+def merge(parts, since=None):
+    """One response from {shard: changes(...)}; ``since`` carries seqs of shards not read."""
+    seqs = dict(since or {})
+    result = {"more": False}
+    deleted = {}
+    for name, part in parts.items():
+        seqs[name] = part["seq"]
+        result["more"] = result["more"] or part["more"]
+        for tbl in TABLES:
+            if tbl in part:
+                result.setdefault(tbl, {"cols": part[tbl]["cols"], "rows": []})["rows"] += part[tbl]["rows"]
+        for tbl, ids in part.get("deleted", {}).items():
+            deleted.setdefault(tbl, []).extend(ids)
+    result["token"] = encode_token(seqs)
+    if deleted:
+        result["deleted"] = {tbl: sorted(ids) for tbl, ids in deleted.items()}
+    return result
@@ -0,0 +1,128 @@
+import unittest
+import uuid
+import app as app_module
+import limits
+import metrics
+from app import app
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class LimiterTestCase(unittest.TestCase):
+    def test_local_bucket_bursts_then_refills(self):
+        clock = Clock()
+        limiter = limits.LocalLimiter(clock=clock)
+        self.assertEqual([limiter.take('k', 2.0, 3)[0] for _ in range(4)], [True, True, True, False])
+        allowed, wait = limiter.take('k', 2.0, 3)
+        self.assertFalse(allowed)
+        self.assertAlmostEqual(wait, 0.5)
+        clock.now += 0.5
+        self.assertTrue(limiter.take('k', 2.0, 3)[0])
+        self.assertTrue(limiter.take('other', 2.0, 3)[0]) # keys are independent
+
+    def test_local_limiter_is_bounded(self):
+        limiter = limits.LocalLimiter(max_keys=2)
+        for key in 'abc':
+            limiter.take(key, 1.0, 1)
+        self.assertEqual(limiter.stats()['buckets'], 2)
+
+    def test_shared_limiter_counts_across_processes(self):
+        clock = Clock()
+        store = limits.LocalStore(clock=clock)
+        # Two "processes" with their own limiter over one store share the budget
+        a, b = limits.SharedLimiter(store, clock=clock), limits.SharedLimiter(store, clock=clock)
+        taken = [limiter.take('k', 1.0, 4)[0] for limiter in (a, b, a, b, a)]
+        self.assertEqual(taken, [True, True, True, True, False])
+        clock.now += 1
+        self.assertTrue(b.take('k', 1.0, 4)[0])
+        # Idle buckets expire from the store
+        clock.now += 10
+        self.assertIsNone(store.get('k'))
+
+    def test_rules_pick_the_longest_wait(self):
+        limiter = limits.LocalLimiter(clock=Clock())
+        rules = [('session', 1.0, 1), ('role', 0.1, 1)]
+        session = {'user_id': 7, 'role': 'doctor'}
+        self.assertIsNone(limits.check(limiter, rules, 'add_record', session, '10.0.0.1'))
+        self.assertEqual(limits.check(limiter, rules, 'add_record', session, '10.0.0.1'), 10)
+        # Another doctor has their own session bucket but shares the role's
+        self.assertEqual(limits.check(limiter, rules, 'add_record', {'user_id': 8, 'role': 'doctor'}, '10.0.0.2'), 10)
+
+
+class AdmissionTestCase(unittest.TestCase):
+    def setUp(self):
+        self.client = app.test_client()
+        self.saved = {k: app.config[k] for k in ('RATE_LIMIT_BY_ADDRESS', 'RATE_LIMITS', 'WRITE_QUEUE_MAX')}
+        self.limiter, self.gate = app_module.rate_limiter, app_module.write_gate
+        app_module.rate_limiter = limits.LocalLimiter()
+
+    def tearDown(self):
+        app.config.update(self.saved)
+        app_module.rate_limiter, app_module.write_gate = self.limiter, self.gate
+
+    def test_login_is_rate_limited_per_address(self):
+        app.config.update(RATE_LIMIT_BY_ADDRESS=True, RATE_LIMITS={'login': [('ip', 0.01, 2)]})
+        before = metrics.admissions.value('login', 'rate_limited')
+        codes = [self.client.post('/login', json={'phone': 'nobody'}).status_code for _ in range(3)]
+        self.assertEqual(codes, [401, 401, 429])
+        res = self.client.post('/login', json={'phone': 'nobody'})
+        self.assertEqual(res.status_code, 429)
+        self.assertGreaterEqual(int(res.headers['Retry-After']), 99)
+        self.assertEqual(metrics.admissions.value('login', 'rate_limited'), before + 2)
+        # Other addresses are unaffected
+        res = self.client.post('/login', json={'phone': 'nobody'}, environ_base={'REMOTE_ADDR': '10.1.1.1'})
+        self.assertEqual(res.status_code, 401)
+
+    def test_address_limits_are_off_by_default(self):
+        for n in range(20):
+            self.assertEqual(self.client.post('/login', json={'phone': f'nobody-{n}'}).status_code, 401)
+
+    def test_login_is_rate_limited_per_phone_by_default(self):
+        burst = app.config['RATE_LIMITS']['login'][0][2]
+        # Spread over many addresses: the phone number is what counts
+        codes = [self.client.post('/login', json={'phone': ' +91 00000-1111'},
+                                  environ_base={'REMOTE_ADDR': f'10.2.0.{n}'}).status_code
+                 for n in range(burst + 1)]
+        self.assertEqual(codes, [401] * burst + [429])
+        # The same number written differently shares the bucket; other numbers don't
+        self.assertEqual(self.client.post('/login', json={'phone': '91000001111'}).status_code, 429)
+        self.assertEqual(self.client.post('/login', json={'phone': '91000001112'}).status_code, 401)
+
+    def test_session_limits_are_on_by_default(self):
+        with self.client.session_transaction() as sess:
+            sess['user_id'] = 4242
+            sess['role'] = 'doctor'
+        burst = app.config['RATE_LIMITS']['add_records'][0][2]
+        codes = [self.client.post('/doctor/add_records', json={'records': 'x'}).status_code for _ in range(burst + 1)]
+        self.assertEqual(codes, [400] * burst + [429])
+
+    def signup(self):
+        return self.client.post('/signup', json={'name': 'Gate Worker', 'phone': str(uuid.uuid4())[:10]})
+
+    def test_write_gate_sheds_when_full(self):
+        app_module.write_gate = gate = limits.Gate(1, timeout=0.01)
+        self.assertTrue(gate.enter()) # someone else is writing
+        res = self.signup()
+        self.assertEqual(res.status_code, 503)
+        self.assertEqual(res.headers['Retry-After'], str(app.config['RETRY_AFTER']))
+        gate.leave()
+        admitted = metrics.admissions.value('signup', 'admitted')
+        self.assertEqual(self.signup().status_code, 200)
+        self.assertEqual(metrics.admissions.value('signup', 'admitted'), admitted + 1)
+        self.assertEqual(gate.active, 0) # released after the request
+
+    def test_write_gate_sheds_when_writer_is_backed_up(self):
+        app.config['WRITE_QUEUE_MAX'] = 0
+        self.assertEqual(self.signup().status_code, 503)
+        # Reads are never gated
+        self.assertEqual(self.client.post('/login', json={'phone': 'nobody'}).status_code, 401)
+        self.assertIn(b'http_admissions_total{endpoint="signup",outcome="overloaded"}',
+                      self.client.get('/metrics').data)
+
+if __name__ == '__main__':
+    unittest.main()
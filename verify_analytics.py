@@ -0,0 +1,81 @@
+import unittest
+import uuid
+from datetime import date
+import analytics
+from app import app
+from database import get_db
+
+class AnalyticsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.ctx = app.app_context()
+        self.ctx.push()
+        self.client = app.test_client()
+        self.db = get_db()
+        self.tag = 'diag-' + uuid.uuid4().hex[:8]
+
+        self.hid = self.client.post('/signup', json={
+            'name': 'Camp Worker', 'phone': str(uuid.uuid4())[:10], 'role': 'worker'
+        }).json['health_id']
+        self.as_role('doctor')
+
+    def tearDown(self):
+        self.ctx.pop()
+
+    def as_role(self, role):
+        with self.client.session_transaction() as sess:
+            sess['user_id'] = 999
+            sess['role'] = role
+
+    def add(self, **fields):
+        self.client.post('/doctor/add_record', json={'health_id': self.hid, **fields})
+
+    def summary(self, **kwargs):
+        return analytics.summary(self.db, top=100000, weeks=520, **kwargs)
+
+    def count(self, summary, tag):
+        return next((d['count'] for d in summary['top_diagnoses'] if d['diagnosis'] == tag), 0)
+
+    def test_incremental_counts(self):
+        before = self.summary()
+        self.add(diagnosis=f' {self.tag.upper()} ', blood_group='ab-', next_visit='2031-06-04')
+        self.add(diagnosis=self.tag, blood_group='O+')
+        after = self.summary()
+
+        self.assertEqual(after['records'], before['records'] + 2)
+        self.assertEqual(self.count(after, self.tag), 2)
+        # The worker moved from AB- to O+, so they count once
+        self.assertEqual(after['blood_groups'].get('AB-', 0), before['blood_groups'].get('AB-', 0))
+        self.assertEqual(after['blood_groups']['O+'], before['blood_groups'].get('O+', 0) + 1)
+
+        week = analytics.summary(self.db, today=date(2031, 6, 1), weeks=2)['upcoming_visits']
+        self.assertIn('2031-06-02', [w['week'] for w in week])
+
+    def test_endpoint(self):
+        self.add(diagnosis=self.tag)
+        self.as_role('admin')
+        res = self.client.get('/admin/analytics?top=5')
+        self.assertEqual(res.status_code, 200)
+        self.assertLessEqual(len(res.json['top_diagnoses']), 5)
+        self.assertFalse(res.json['rebuilding'])
+        self.as_role('doctor')
+        self.assertEqual(self.client.get('/admin/analytics').status_code, 403)
+
+    def test_rebuild_matches_incremental(self):
+        self.add(diagnosis=self.tag, blood_group='B+', next_visit='2031-01-01')
+        self.add(diagnosis=self.tag, blood_group='A+')
+        analytics.compact(self.db)
+        incremental = self.summary()
+        scanned = analytics.rebuild(self.db, batch_size=7)
+        self.assertEqual(scanned, incremental['records'])
+        self.assertEqual(self.summary(), incremental)
+
+    def test_compaction_drops_past_weeks(self):
+        self.add(diagnosis=self.tag, next_visit=date.today().isoformat())
+        self.assertTrue(analytics.summary(self.db, weeks=1)['upcoming_visits'])
+        analytics.compact(self.db, today=date(2100, 1, 1))
+        left = self.db.execute("SELECT COUNT(*) FROM analytics_counts WHERE metric='visit_week'").fetchone()[0]
+        self.assertEqual(left, 0)
+        analytics.rebuild(self.db) # put the real weeks back for the other tests
+
+if __name__ == '__main__':
+    unittest.main()
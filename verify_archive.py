@@ -0,0 +1,158 @@
+import os
+import shutil
+import tempfile
+import unittest
+import uuid
+import analytics
+import app as app_module
+import archive
+from app import app
+from database import get_db
+
+class ArchiveTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.dir = tempfile.mkdtemp()
+        cls.saved = app.config['ARCHIVE_DIR']
+        app.config['ARCHIVE_DIR'] = cls.dir
+
+    @classmethod
+    def tearDownClass(cls):
+        app.config['ARCHIVE_DIR'] = cls.saved
+        shutil.rmtree(cls.dir)
+
+    def setUp(self):
+        self.ctx = app.app_context()
+        self.ctx.push()
+        self.client = app.test_client()
+        self.db = get_db()
+
+        self.phone = str(uuid.uuid4())[:10]
+        self.hid = self.client.post('/signup', json={
+            'name': 'Veteran Worker', 'phone': self.phone, 'role': 'worker'
+        }).json['health_id']
+        # Two visits in 2017, one in 2018, then two recent ones
+        for n, when in enumerate(['2017-03-01T10:00:00', '2017-09-01T10:00:00', '2018-02-01T10:00:00']):
+            self.db.execute(
+                "INSERT INTO medical_records (health_uuid, diagnosis, doctor_id, created_at) VALUES (?, ?, 999, ?)",
+                (self.hid, f'Old {n}', when))
+        self.db.commit()
+        self.as_doctor()
+        for n in range(2):
+            self.client.post('/doctor/add_record', json={'health_id': self.hid, 'diagnosis': f'New {n}'})
+
+    def tearDown(self):
+        self.ctx.pop()
+
+    def as_doctor(self):
+        with self.client.session_transaction() as sess:
+            sess['user_id'] = 999
+            sess['role'] = 'doctor'
+
+    def run_archival(self):
+        return archive.archive(self.db, self.dir, '2019-01-01', batch_size=2)
+
+    def history(self, **params):
+        seen, cursor = [], None
+        while True:
+            res = self.client.post('/doctor/get_patient', json={'health_id': self.hid, 'cursor': cursor, **params})
+            self.assertEqual(res.status_code, 200)
+            seen += [h['diagnosis'] for h in res.json['history']]
+            cursor = res.json['next_cursor']
+            if not cursor:
+                return seen
+
+    def test_records_move_to_yearly_files(self):
+        self.assertGreaterEqual(self.run_archival(), 3)
+        self.assertTrue(os.path.exists(archive.path_for(self.dir, '2017')))
+        self.assertTrue(os.path.exists(archive.path_for(self.dir, '2018')))
+        hot = self.db.execute("SELECT COUNT(*) FROM medical_records WHERE health_uuid=?", (self.hid,)).fetchone()[0]
+        self.assertEqual(hot, 2)
+        # Nothing left to do on a second run
+        self.assertEqual(self.run_archival(), 0)
+
+    def test_history_pages_through_archives(self):
+        expected = ['New 1', 'New 0', 'Old 2', 'Old 1', 'Old 0']
+        self.run_archival()
+        self.assertEqual(self.history(limit=2), expected)
+        self.assertEqual(self.history(limit=3), expected)
+        batch = self.client.post('/doctor/get_patients', json={'health_ids': [self.hid], 'limit': 4}).json
+        self.assertEqual([h['diagnosis'] for h in batch['patients'][self.hid]['history']], expected[:4])
+        self.assertIsNotNone(batch['patients'][self.hid]['next_cursor'])
+
+    def attached(self):
+        return [row[1] for row in self.db.execute("PRAGMA database_list") if row[1].startswith('archive_')]
+
+    def detach_all(self):
+        for schema in self.attached():
+            self.db.execute(f"DETACH DATABASE {schema}")
+
+    def test_patients_without_archives_stay_on_the_hot_table(self):
+        self.run_archival()
+        self.detach_all()
+        other = self.client.post('/signup', json={'name': 'New Worker', 'phone': str(uuid.uuid4())[:10]}).json
+        self.assertEqual(app_module.load_history(self.db, other['health_id'], 10), ([], None))
+        self.assertEqual(archive.histories(self.db, self.dir, [other['health_id']], 10), {})
+        self.assertEqual(self.attached(), [])
+        # Paging into 2017 only opens that year
+        rows = archive.history(self.db, self.dir, self.hid, 5, ('2017-12-01', 0))
+        self.assertEqual([r['diagnosis'] for r in rows], ['Old 1', 'Old 0'])
+        self.assertEqual(self.attached(), ['archive_2017'])
+
+    def test_attachments_stay_under_the_cap(self):
+        self.run_archival()
+        self.detach_all()
+        saved, archive.MAX_ATTACHED = archive.MAX_ATTACHED, 1
+        self.assertEqual(len(archive.history(self.db, self.dir, self.hid, 5)), 3)
+        try:
+            self.assertEqual(self.history(limit=2), ['New 1', 'New 0', 'Old 2', 'Old 1', 'Old 0'])
+            self.assertEqual(len(archive.histories(self.db, self.dir, [self.hid], 5)[self.hid]), 3)
+            self.assertEqual(list(archive.partitions(self.db, self.dir)), ['archive_2017', 'archive_2018'])
+            self.assertLessEqual(len(self.attached()), 1)
+        finally:
+            archive.MAX_ATTACHED = saved
+
+    def test_reindex_restores_the_index(self):
+        self.run_archival()
+        self.db.execute("DELETE FROM archived_patients WHERE health_uuid=?", (self.hid,))
+        self.db.commit()
+        self.assertEqual(archive.history(self.db, self.dir, self.hid, 5), [])
+        self.assertGreaterEqual(archive.reindex(self.db, self.dir), 2)
+        self.assertEqual(len(archive.history(self.db, self.dir, self.hid, 5)), 3)
+
+    def test_dashboard_and_sync(self):
+        self.client.post('/login', json={'phone': self.phone})
+        token = self.client.get('/sync').json['token']
+        self.db.execute("DELETE FROM medical_records WHERE health_uuid=? AND diagnosis LIKE 'New%'", (self.hid,))
+        self.db.commit()
+        token = self.client.get('/sync', query_string={'since': token}).json['token']
+
+        self.run_archival()
+        # Archived records are not deletions as far as clients are concerned
+        delta = self.client.get('/sync', query_string={'since': token}).json
+        self.assertNotIn('deleted', delta)
+        # With nothing hot left, the dashboard falls back to the archive
+        res = self.client.get('/worker/dashboard')
+        self.assertEqual(res.json['medical_record']['diagnosis'], 'Old 2')
+
+    def test_rebuild_counts_archived_records(self):
+        self.run_archival()
+        scanned = analytics.rebuild(self.db, batch_size=3, archive_dir=self.dir)
+        count = lambda schema: self.db.execute(f"SELECT COUNT(*) FROM {schema}.medical_records").fetchone()[0]
+        total = count('main') + sum(map(count, archive.partitions(self.db, self.dir)))
+        self.assertEqual(scanned, total)
+        summary = analytics.summary(self.db, top=-1)
+        self.assertEqual(summary['records'], total)
+        self.assertIn('old 2', [d['diagnosis'] for d in summary['top_diagnoses']])
+
+    def test_export_includes_archives(self):
+        self.run_archival()
+        with self.client.session_transaction() as sess:
+            sess['role'] = 'admin'
+        res = self.client.get('/admin/export', query_string={'format': 'jsonl', 'to': '2018-12-31'})
+        text = res.get_data(as_text=True)
+        self.assertIn(self.hid, text)
+        self.assertLess(text.index('2017-03-01'), text.index('2018-02-01'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,159 @@
+import asyncio
+import os
+import tempfile
+import threading
+import time
+import unittest
+import uuid
+from asgi import ASGIApp, application
+from database import Writer, WriteTimeout, connect
+
+async def call(app, method, path, body=b'', headers=()):
+    sent = []
+    messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+
+    async def receive():
+        return messages.pop(0) if messages else {'type': 'http.disconnect'}
+
+    async def send(message):
+        sent.append(message)
+
+    path, _, query = path.partition('?')
+    await app({'type': 'http', 'method': method, 'path': path, 'query_string': query.encode(),
+               'headers': [(k.encode(), v.encode()) for k, v in headers],
+               'client': ('127.0.0.1', 5000), 'server': ('testserver', 80)}, receive, send)
+    start = sent[0]
+    return start['status'], dict(start['headers']), [m['body'] for m in sent[1:]]
+
+class ASGITestCase(unittest.TestCase):
+    def test_flask_routes_through_asgi(self):
+        phone = str(uuid.uuid4())[:10]
+
+        async def scenario():
+            status, headers, _ = await call(application, 'POST', '/signup',
+                                            b'{"name": "Async Worker", "phone": "%s"}' % phone.encode(),
+                                            [('content-type', 'application/json')])
+            self.assertEqual(status, 200)
+            cookie = headers[b'set-cookie'].decode().split(';')[0]
+            # Many dashboards at once over a handful of threads
+            results = await asyncio.gather(*[
+                call(application, 'GET', '/worker/dashboard?limit=5', headers=[('cookie', cookie)])
+                for _ in range(200)
+            ])
+            return results
+
+        results = asyncio.run(scenario())
+        self.assertEqual({status for status, _, _ in results}, {200})
+        self.assertIn(b'HID-', b''.join(results[0][2]))
+
+    def test_thread_pool_is_bounded_and_responses_stream(self):
+        active = [0, 0]
+        lock = threading.Lock()
+
+        def wsgi(environ, start_response):
+            with lock:
+                active[0] += 1
+                active[1] = max(active)
+            time.sleep(0.01)
+            with lock:
+                active[0] -= 1
+            start_response('200 OK', [('Content-Type', 'text/plain')])
+            return iter([b'a', b'b', environ['wsgi.input'].read()])
+
+        app = ASGIApp(wsgi, workers=3)
+
+        async def scenario():
+            return await asyncio.gather(*[call(app, 'POST', '/', b'c') for _ in range(30)])
+
+        results = asyncio.run(scenario())
+        self.assertLessEqual(active[1], 3)
+        self.assertEqual(results[0][2], [b'a', b'b', b'c', b''])
+
+    def test_oversized_body_is_rejected(self):
+        app = ASGIApp(lambda e, s: [], max_body=4)
+        status, _, _ = asyncio.run(call(app, 'POST', '/', b'too large'))
+        self.assertEqual(status, 413)
+
+    def test_files_are_sent_by_path_when_supported(self):
+        handle, path = tempfile.mkstemp()
+        os.write(handle, b'static bytes')
+        os.close(handle)
+
+        def wsgi(environ, start_response):
+            start_response('200 OK', [('Content-Length', '12')])
+            return environ['wsgi.file_wrapper'](open(path, 'rb'))
+
+        async def scenario(extensions):
+            sent = []
+            messages = [{'type': 'http.request', 'body': b''}]
+
+            async def receive():
+                return messages.pop(0)
+
+            async def send(message):
+                sent.append(message)
+
+            await ASGIApp(wsgi, workers=1)({'type': 'http', 'method': 'GET', 'path': '/', 'headers': [],
+                                            'extensions': extensions}, receive, send)
+            return sent
+
+        try:
+            sent = asyncio.run(scenario({'http.response.pathsend': {}}))
+            self.assertEqual(sent[1], {'type': 'http.response.pathsend', 'path': os.path.abspath(path)})
+            sent = asyncio.run(scenario({}))
+            self.assertEqual(b''.join(m['body'] for m in sent[1:]), b'static bytes')
+        finally:
+            os.remove(path)
+
+class WriterTestCase(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        db = connect(self.path)
+        db.execute("CREATE TABLE counter (n INTEGER)")
+        db.execute("INSERT INTO counter VALUES (0)")
+        db.commit()
+        db.close()
+        self.writer = Writer(self.path)
+
+    def tearDown(self):
+        self.writer.close()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.path + suffix):
+                os.remove(self.path + suffix)
+
+    def test_serializes_concurrent_writes(self):
+        def bump(db):
+            n = db.execute("SELECT n FROM counter").fetchone()[0]
+            db.execute("UPDATE counter SET n=?", (n + 1,))
+            return n + 1
+
+        threads = [threading.Thread(target=lambda: [self.writer.run(bump) for _ in range(25)]) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        db = connect(self.path)
+        self.assertEqual(db.execute("SELECT n FROM counter").fetchone()[0], 200)
+        db.close()
+
+    def test_failed_write_rolls_back(self):
+        def fail(db):
+            db.execute("UPDATE counter SET n=99")
+            raise ValueError("nope")
+
+        with self.assertRaises(ValueError):
+            self.writer.run(fail)
+        self.assertEqual(self.writer.run(lambda db: db.execute("SELECT n FROM counter").fetchone()[0]), 0)
+
+    def test_stuck_writer_times_out_and_skips_queued_work(self):
+        release = threading.Event()
+        self.writer.submit(lambda db: release.wait(5))
+        with self.assertRaises(WriteTimeout):
+            self.writer.run(lambda db: db.execute("UPDATE counter SET n=1"), timeout=0.05)
+        release.set()
+        # The timed-out write was cancelled while queued, so it never ran
+        self.assertEqual(self.writer.run(lambda db: db.execute("SELECT n FROM counter").fetchone()[0]), 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+import gzip
+import os
+import re
+import shutil
+import tempfile
+import unittest
+import assets
+import app as app_module
+from app import app
+
+class PipelineTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.src = os.path.join(self.tmp, 'src')
+        self.out = os.path.join(self.tmp, 'out')
+        self.write('page.html', '<link href="/style.css"><script src="js/app.js"></script>'
+                                '<a href="https://example.com/app.js">x</a>')
+        self.write('style.css', 'body { background: url("img/dot.svg"); }')
+        self.write('js/app.js', 'console.log("hello");\n' * 50)
+        self.write('img/dot.svg', '<svg/>')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def write(self, rel, text):
+        path = os.path.join(self.src, rel)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(text)
+
+    def test_fingerprints_and_rewrites_references(self):
+        built = assets.build([('/', self.src, ())], self.out)
+        js = built['/js/app.js']
+        self.assertFalse(js.immutable)
+        hashed = [url for url, a in built.items() if a.path == js.path and a.immutable]
+        self.assertEqual(len(hashed), 1)
+        self.assertRegex(hashed[0], r'^/js/app\.[0-9a-f]{12}\.js$')
+
+        with open(built['/page.html'].path) as f:
+            page = f.read()
+        self.assertIn(f'src="{hashed[0]}"', page)
+        self.assertIn('href="https://example.com/app.js"', page)
+        css_url = re.search(r'href="(/style\.[0-9a-f]{12}\.css)"', page).group(1)
+        with open(built[css_url].path) as f:
+            self.assertRegex(f.read(), r'url\("/img/dot\.[0-9a-f]{12}\.svg"\)')
+
+        # Compressible and big enough gets a .gz; tiny files don't
+        with open(js.encodings['gzip'], 'rb') as f, open(js.path, 'rb') as raw:
+            self.assertEqual(gzip.decompress(f.read()), raw.read())
+        self.assertEqual(built['/img/dot.svg'].encodings, {})
+
+    def test_rebuild_is_stable_and_prehashed_names_are_kept(self):
+        self.write('assets/index-AbC123xy.js', 'export default 1;')
+        first = assets.build([('/app/', self.src, ('assets',))], self.out)
+        self.assertTrue(first['/app/assets/index-AbC123xy.js'].immutable)
+        self.assertEqual(assets.build([('/app/', self.src, ('assets',))], self.out), first)
+
+
+class ServingTestCase(unittest.TestCase):
+    def setUp(self):
+        self.ctx = app.app_context()
+        self.ctx.push()
+        self.client = app.test_client()
+
+    def tearDown(self):
+        self.ctx.pop()
+
+    def hashed_translations(self):
+        page = self.client.get('/login.html')
+        self.assertEqual(page.headers['Cache-Control'], 'public, no-cache')
+        return re.search(rb'src="(/translations\.[0-9a-f]{12}\.js)"', page.data).group(1).decode()
+
+    def test_hashed_urls_are_immutable_and_precompressed(self):
+        url = self.hashed_translations()
+        res = self.client.get(url)
+        self.assertEqual(res.status_code, 200)
+        self.assertIn('immutable', res.headers['Cache-Control'])
+        self.assertEqual(res.data, self.client.get('/translations.js').data)
+
+        packed = self.client.get(url, headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(packed.headers['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', packed.headers['Vary'])
+        self.assertNotIn('Content-Disposition', packed.headers)
+        self.assertEqual(gzip.decompress(packed.data), res.data)
+
+        again = self.client.get(url, headers={'Accept-Encoding': 'gzip', 'If-None-Match': packed.headers['ETag']})
+        self.assertEqual(again.status_code, 304)
+
+    def test_build_dir_does_not_depend_on_the_cwd(self):
+        tmp, cwd = tempfile.mkdtemp(), os.getcwd()
+        try:
+            os.chdir(tmp)
+            app_module._assets = None
+            self.assertEqual(self.client.get(self.hashed_translations()).status_code, 200)
+            self.assertEqual(os.listdir(tmp), [])
+        finally:
+            os.chdir(cwd)
+            shutil.rmtree(tmp)
+
+    def test_unknown_files_404(self):
+        self.assertEqual(self.client.get('/nope.js').status_code, 404)
+        self.assertEqual(self.client.get('/../app.py').status_code, 404)
+
+    def test_client_build_with_spa_fallback(self):
+        tmp = tempfile.mkdtemp()
+        saved = {k: app.config[k] for k in ('CLIENT_DIST_DIR', 'ASSET_BUILD_DIR')}
+        try:
+            dist = os.path.join(tmp, 'dist')
+            os.makedirs(os.path.join(dist, 'assets'))
+            with open(os.path.join(dist, 'index.html'), 'w') as f:
+                f.write('<script type="module" src="/app/assets/index-AbC123xy.js"></script>')
+            with open(os.path.join(dist, 'assets', 'index-AbC123xy.js'), 'w') as f:
+                f.write('export default 1;')
+            app.config.update(CLIENT_DIST_DIR=dist, ASSET_BUILD_DIR=os.path.join(tmp, 'out'))
+            app_module.build_assets()
+
+            for path in ('/app/', '/app/doctor'):
+                res = self.client.get(path)
+                self.assertEqual(res.status_code, 200, path)
+                self.assertIn(b'/app/assets/index-AbC123xy.js', res.data)
+            res = self.client.get('/app/assets/index-AbC123xy.js')
+            self.assertIn('immutable', res.headers['Cache-Control'])
+            self.assertEqual(self.client.get('/app/missing.js').status_code, 404)
+        finally:
+            app.config.update(saved)
+            app_module.build_assets()
+            shutil.rmtree(tmp)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import unittest
+import uuid
+from app import app, patient_cache
+
+class BatchLookupTestCase(unittest.TestCase):
+    def setUp(self):
+        self.ctx = app.app_context()
+        self.ctx.push()
+        self.client = app.test_client()
+
+        self.hids = []
+        for n in range(3):
+            self.hids.append(self.client.post('/signup', json={
+                'name': f'Camp Worker {n}', 'phone': str(uuid.uuid4())[:10], 'role': 'worker'
+            }).json['health_id'])
+
+        with self.client.session_transaction() as sess:
+            sess['user_id'] = 999
+            sess['role'] = 'doctor'
+        for n, hid in enumerate(self.hids):
+            for i in range(n + 1):
+                self.client.post('/doctor/add_record', json={'health_id': hid, 'diagnosis': f'Visit {i}'})
+
+    def tearDown(self):
+        self.ctx.pop()
+
+    def test_batch_matches_single_lookups(self):
+        patient_cache.clear()
+        res = self.client.post('/doctor/get_patients', json={'health_ids': self.hids, 'limit': 2})
+        self.assertEqual(res.status_code, 200)
+        patients = res.json['patients']
+        self.assertEqual(set(patients), set(self.hids))
+        for hid in self.hids:
+            single = self.client.post('/doctor/get_patient', json={'health_id': hid, 'limit': 2}).json
+            self.assertEqual(patients[hid], single)
+        self.assertEqual([h['diagnosis'] for h in patients[self.hids[2]]['history']], ['Visit 2', 'Visit 1'])
+        self.assertIsNotNone(patients[self.hids[2]]['next_cursor'])
+        self.assertIsNone(patients[self.hids[0]]['next_cursor'])
+
+    def test_unknown_ids_do_not_fail_the_batch(self):
+        res = self.client.post('/doctor/get_patients', json={'health_ids': [self.hids[0], 'HID-missing']})
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.json['patients']['HID-missing'], {'error': 'not found'})
+        self.assertEqual(res.json['patients'][self.hids[0]]['name'], 'Camp Worker 0')
+
+    def test_rejects_bad_input(self):
+        res = self.client.post('/doctor/get_patients', json={'health_ids': 'HID-1'})
+        self.assertEqual(res.status_code, 400)
+        too_many = ['HID-%d' % i for i in range(app.config['BATCH_LOOKUP_MAX'] + 1)]
+        res = self.client.post('/doctor/get_patients', json={'health_ids': too_many})
+        self.assertEqual(res.status_code, 400)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import unittest
+import uuid
+from app import app, patient_cache
+from database import get_db
+
+class BatchRecordsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.ctx = app.app_context()
+        self.ctx.push()
+        self.client = app.test_client()
+
+        self.phone = str(uuid.uuid4())[:10]
+        self.hid = self.client.post('/signup', json={
+            'name': 'Offline Worker', 'phone': self.phone, 'role': 'worker'
+        }).json['health_id']
+
+        self.doctor = 900000 + uuid.uuid4().int % 100000
+        with self.client.session_transaction() as sess:
+            sess['user_id'] = self.doctor
+            sess['role'] = 'doctor'
+
+    def tearDown(self):
+        self.ctx.pop()
+
+    def sync(self, records):
+        res = self.client.post('/doctor/add_records', json={'records': records})
+        self.assertEqual(res.status_code, 200)
+        return res.json['results']
+
+    def test_per_item_results(self):
+        results = self.sync([
+            {'health_id': self.hid, 'diagnosis': 'Camp 1', 'next_visit': '2030-02-01'},
+            {'health_id': 'HID-missing', 'diagnosis': 'Nobody'},
+            {'health_id': 'bogus'},
+            {'health_id': self.hid, 'diagnosis': 'Old', 'next_visit': '2000-01-01'},
+            {'health_id': self.hid, 'diagnosis': 'Camp 2'},
+        ])
+        self.assertEqual([r['status'] for r in results], ['created', 'error', 'error', 'error', 'created'])
+        self.assertEqual(results[1]['error'], 'health_id not found')
+        self.assertEqual(results[4]['record_id'], results[0]['record_id'] + 1)
+
+        db = get_db()
+        rows = db.execute("SELECT id, diagnosis FROM medical_records WHERE health_uuid=? ORDER BY id",
+                          (self.hid,)).fetchall()
+        self.assertEqual([(r['id'], r['diagnosis']) for r in rows],
+                         [(results[0]['record_id'], 'Camp 1'), (results[4]['record_id'], 'Camp 2')])
+        # One notification, queued for delivery in the same transaction
+        note = db.execute("""
+            SELECT n.message, o.recipient FROM notifications n
+            JOIN notification_outbox o ON o.notification_id = n.id
+            JOIN users u ON u.id = n.user_id WHERE u.phone=?
+        """, (self.phone,)).fetchall()
+        self.assertEqual(len(note), 1)
+        self.assertIn('2030-02-01', note[0]['message'])
+        self.assertEqual(note[0]['recipient'], self.phone)
+
+    def test_retried_sync_is_idempotent(self):
+        batch = [
+            {'health_id': self.hid, 'diagnosis': 'A', 'idempotency_key': 'visit-a'},
+            {'health_id': self.hid, 'diagnosis': 'B', 'idempotency_key': 'visit-b', 'next_visit': '2030-03-01'},
+            {'health_id': self.hid, 'diagnosis': 'A again', 'idempotency_key': 'visit-a'},
+        ]
+        first = self.sync(batch)
+        self.assertEqual([r['status'] for r in first], ['created', 'created', 'duplicate'])
+        self.assertEqual(first[2]['record_id'], first[0]['record_id'])
+
+        again = self.sync(batch)
+        self.assertEqual([r['status'] for r in again], ['duplicate'] * 3)
+        self.assertEqual([r['record_id'] for r in again],
+                         [first[0]['record_id'], first[1]['record_id'], first[0]['record_id']])
+
+        db = get_db()
+        count = db.execute("SELECT COUNT(*) FROM medical_records WHERE health_uuid=?", (self.hid,)).fetchone()[0]
+        self.assertEqual(count, 2)
+        notes = db.execute("SELECT COUNT(*) FROM notifications n JOIN users u ON u.id=n.user_id WHERE u.phone=?",
+                           (self.phone,)).fetchone()[0]
+        self.assertEqual(notes, 1)
+
+    def test_invalidates_patient_cache(self):
+        self.client.post('/doctor/get_patient', json={'health_id': self.hid})
+        self.assertIsNotNone(patient_cache.get(self.hid))
+        self.sync([{'health_id': self.hid, 'diagnosis': 'Fresh'}])
+        res = self.client.post('/doctor/get_patient', json={'health_id': self.hid})
+        self.assertEqual(res.json['history'][0]['diagnosis'], 'Fresh')
+
+    def test_rejects_non_list(self):
+        res = self.client.post('/doctor/add_records', json={'records': {}})
+        self.assertEqual(res.status_code, 400)
+
+if __name__ == '__main__':
+    unittest.main()
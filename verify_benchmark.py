@@ -0,0 +1,87 @@
+
+import contextlib
+import unittest
+import io
+import os
+import subprocess
+import sys
+import tempfile
+import benchmark
+import migrations
+
+class BenchmarkHarnessTestCase(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+
+    def tearDown(self):
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(self.path + suffix):
+                os.remove(self.path + suffix)
+
+    def test_seed_is_resumable(self):
+        self.assertEqual(benchmark.seed(self.path, 200), 20)
+        self.assertEqual(benchmark.seed(self.path, 300), 30)
+        from database import connect
+        db = connect(self.path)
+        self.assertEqual(db.execute("SELECT COUNT(*) FROM medical_records").fetchone()[0], 300)
+        self.assertEqual(db.execute("SELECT COUNT(*) FROM health_ids").fetchone()[0], 30)
+        db.close()
+
+    def test_small_run_reports_percentiles(self):
+        import app as app_module
+        original = app_module.app.config["DATABASE"]
+        try:
+            results = benchmark.main(["--database", self.path, "--records", "200",
+                                      "--requests", "20", "--concurrency", "2"])
+        finally:
+            app_module.create_app({"DATABASE": original})
+        for route in benchmark.ROUTES:
+            r = results["routes"][route]
+            self.assertEqual(r["requests"], 20)
+            self.assertEqual(r["errors"], 0, route)
+            self.assertLessEqual(r["p50_ms"], r["p99_ms"])
+
+        out = io.StringIO()
+        benchmark.compare(results, results, out)
+        self.assertIn("+0.0%", out.getvalue())
+
+    def test_import_does_no_database_work(self):
+        # A fresh interpreter in an empty directory: importing must not create
+        # database.db, create_app() must migrate it.
+        here = os.path.dirname(os.path.abspath(__file__))
+        env = dict(os.environ, PYTHONPATH=here)
+        with tempfile.TemporaryDirectory() as tmp:
+            subprocess.run([sys.executable, "-c", "import app"], cwd=tmp, env=env, check=True)
+            self.assertFalse(os.path.exists(os.path.join(tmp, "database.db")))
+            path = os.path.join(tmp, "database.db")
+            code = (f"import app, migrations; app.create_app({{'DATABASE': {path!r}}}); "
+                    f"print(migrations.current_version(app.database.connect({path!r})))")
+            out = subprocess.run([sys.executable, "-c", code], cwd=tmp, env=env, check=True,
+                                 capture_output=True, text=True).stdout
+            self.assertEqual(int(out), len(migrations.MIGRATIONS))
+
+    def test_payload_reports_sizes(self):
+        import app as app_module
+        original = app_module.app.config["DATABASE"]
+        try:
+            results = benchmark.main(["--payload", "--database", self.path, "--records", "200",
+                                      "--requests", "5"])["payloads"]
+        finally:
+            app_module.create_app({"DATABASE": original})
+        for route in benchmark.PAYLOAD_ROUTES:
+            plain, packed = results[f"json/{route}/identity"], results[f"json/{route}/gzip"]
+            self.assertGreater(plain["bytes"], 0)
+            self.assertLessEqual(packed["bytes"], plain["bytes"])
+
+    def test_rejects_empty_runs(self):
+        for flag in ("--requests", "--concurrency", "--runs"):
+            with self.assertRaises(SystemExit), contextlib.redirect_stderr(io.StringIO()):
+                benchmark.main(["--payload", "--database", self.path, flag, "0"])
+
+    def test_startup_reports_each_step(self):
+        results = benchmark.startup(self.path, runs=1, out=io.StringIO())
+        self.assertEqual(set(results["startup"]), set(benchmark.STARTUP_STEPS))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+
+import unittest
+import json
+from app import app
+import uuid
+import bulk
+import migrations
+from database import connect
+
+class BulkRegistrationTestCase(unittest.TestCase):
+    def setUp(self):
+        self.ctx = app.app_context()
+        self.ctx.push()
+        self.client = app.test_client()
+        with self.client.session_transaction() as sess:
+            sess['user_id'] = 1
+            sess['role'] = 'admin'
+
+    def tearDown(self):
+        self.ctx.pop()
+
+    def results(self, res):
+        self.assertEqual(res.status_code, 200)
+        return [json.loads(line) for line in res.data.decode().splitlines()]
+
+    def test_csv_upload(self):
+        p1, p2 = str(uuid.uuid4())[:10], str(uuid.uuid4())[:10]
+        body = "name,phone,language\n" \
+               f"Worker A,{p1},ta\n" \
+               f"Worker B,{p2},hi\n" \
+               f"Worker A Again,{p1},ta\n" \
+               f",{uuid.uuid4().hex[:10]},en\n" \
+               "Admin Clash,111,en\n"
+        app.config['BULK_BATCH_SIZE'] = 2 # force several batches
+        try:
+            res = self.client.post('/admin/register_workers/bulk', data=body, content_type='text/csv')
+        finally:
+            app.config['BULK_BATCH_SIZE'] = 500
+        lines = self.results(res)
+
+        self.assertEqual([l['row'] for l in lines[:-1]], [2, 3, 4, 5, 6])
+        self.assertTrue(lines[0]['health_id'].startswith('HID-'))
+        self.assertTrue(lines[1]['health_id'].startswith('HID-'))
+        self.assertEqual(lines[2]['error'], 'duplicate phone')
+        self.assertEqual(lines[3]['error'], 'name is required')
+        self.assertEqual(lines[4]['error'], 'duplicate phone')
+        self.assertEqual(lines[-1]['summary'], {'created': 2, 'failed': 3})
+
+        # Registered workers can log in
+        res_login = self.client.post('/login', json={'phone': p2})
+        self.assertEqual(res_login.json['role'], 'worker')
+
+    def test_jsonl_upload(self):
+        phone = str(uuid.uuid4())[:10]
+        body = json.dumps({'name': 'Json Worker', 'phone': phone}) + "\n" + "not json\n"
+        res = self.client.post('/admin/register_workers/bulk', data=body, content_type='application/x-ndjson')
+        lines = self.results(res)
+        self.assertIn('health_id', lines[0])
+        self.assertEqual(lines[1], {'row': 2, 'error': 'malformed row'})
+
+    def test_invalid_encoding_stops_cleanly(self):
+        phone = str(uuid.uuid4())[:10]
+        body = "\ufeffname,phone\n".encode() + f"Worker Ok,{phone}\n".encode() \
+            + b"Worker \xff\xfe,123\n" + f"Never Read,{phone}9\n".encode()
+        lines = self.results(self.client.post('/admin/register_workers/bulk', data=body, content_type='text/csv'))
+        self.assertIn('health_id', lines[0])
+        self.assertEqual(lines[1], {'row': 3, 'error': 'invalid encoding'})
+        self.assertEqual(lines[-1]['summary'], {'created': 1, 'failed': 1})
+        self.assertEqual(len(lines), 3)
+
+    def test_requires_admin(self):
+        with self.client.session_transaction() as sess:
+            sess['role'] = 'worker'
+        res = self.client.post('/admin/register_workers/bulk', data="name,phone\n", content_type='text/csv')
+        self.assertEqual(res.status_code, 403)
+
+
+class RacingConnection:
+    """Hides existing phones from the pre-check, as if they were registered right after it."""
+
+    def __init__(self, db):
+        self.db = db
+
+    def execute(self, sql, params=()):
+        if sql.startswith("SELECT phone FROM users"):
+            return iter(())
+        return self.db.execute(sql, params)
+
+    def __getattr__(self, name):
+        return getattr(self.db, name)
+
+
+class BatchTestCase(unittest.TestCase):
+    def test_phone_registered_after_the_check_is_a_duplicate(self):
+        db = connect(':memory:')
+        migrations.migrate(db)
+        db.execute("INSERT INTO users (name, role, phone, language) VALUES ('Early', 'worker', '4242', 'en')")
+        db.commit()
+        def write(fn):
+            result = fn(RacingConnection(db))
+            db.commit()
+            return result
+        results = list(bulk.register_workers(write, [
+            (2, {'name': 'Late', 'phone': '4242'}), (3, {'name': 'Fresh', 'phone': '4343'})
+        ]))
+        self.assertEqual(results[0], {'row': 2, 'phone': '4242', 'error': 'duplicate phone'})
+        self.assertTrue(results[1]['health_id'].startswith('HID-'))
+        self.assertEqual(db.execute("SELECT COUNT(*) FROM health_ids").fetchone()[0], 1)
+        db.close()
+
+if __name__ == '__main__':
+    unittest.main()
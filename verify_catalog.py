@@ -0,0 +1,49 @@
+
+import unittest
+import json
+from app import app, catalog, get_message, get_reminder_message
+
+class CatalogTestCase(unittest.TestCase):
+    def setUp(self):
+        self.ctx = app.app_context()
+        self.ctx.push()
+        self.client = app.test_client()
+
+    def tearDown(self):
+        self.ctx.pop()
+
+    def test_messages(self):
+        self.assertEqual(get_message('en', '2027-05-20'), 'Your next doctor visit is on Thursday, 2027-05-20')
+        self.assertIn('வியாழன், 2027-05-20', get_message('ta', '2027-05-20'))
+        # Unknown languages fall back to English
+        self.assertEqual(get_message('xx', '2027-05-20'), get_message('en', '2027-05-20'))
+
+    def test_plurals(self):
+        self.assertIn('tomorrow', get_reminder_message('en', '2027-05-20', 1))
+        self.assertIn('in 3 days', get_reminder_message('en', '2027-05-20', 3))
+        # Hindi treats 0 as singular too
+        self.assertEqual(catalog.message('hi', 'visit_reminder', count=0, date='x'),
+                         catalog.message('hi', 'visit_reminder', count=1, date='x'))
+
+    def test_manifest_and_hashed_bundles(self):
+        res = self.client.get('/i18n/manifest.json')
+        self.assertEqual(res.status_code, 200)
+        langs = res.json['languages']
+        self.assertTrue({'en', 'ta', 'hi'} <= set(langs))
+
+        url = langs['ta']['url']
+        res = self.client.get(url)
+        self.assertEqual(res.status_code, 200)
+        self.assertIn('immutable', res.headers['Cache-Control'])
+        self.assertEqual(json.loads(res.data)['language'], 'ta')
+        self.assertIn('app_name', json.loads(res.data)['ui'])
+
+        res_304 = self.client.get(url, headers={'If-None-Match': res.headers['ETag']})
+        self.assertEqual(res_304.status_code, 304)
+
+        # A stale hash is not served as if it were current
+        self.assertEqual(self.client.get('/i18n/ta.0000000000000000.json').status_code, 404)
+        self.assertEqual(self.client.get('/i18n/zz.json').status_code, 404)
+
+if __name__ == '__main__':
+    unittest.main()
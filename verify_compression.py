@@ -0,0 +1,97 @@
+import gzip
+import json
+import sqlite3
+import unittest
+import uuid
+from datetime import date
+import responses
+from app import app
+
+class CompressionTestCase(unittest.TestCase):
+    def setUp(self):
+        self.ctx = app.app_context()
+        self.ctx.push()
+        self.client = app.test_client()
+        self.hid = self.client.post('/signup', json={
+            'name': 'Zip Worker', 'phone': str(uuid.uuid4())[:10], 'role': 'worker'
+        }).json['health_id']
+        with self.client.session_transaction() as sess:
+            sess['user_id'] = 999
+            sess['role'] = 'doctor'
+        for i in range(10):
+            self.client.post('/doctor/add_record', json={
+                'health_id': self.hid, 'diagnosis': f'Seasonal fever, visit {i}', 'prescription': 'Paracetamol 500mg'
+            })
+
+    def tearDown(self):
+        self.ctx.pop()
+
+    def patient(self, **headers):
+        res = self.client.post('/doctor/get_patient', json={'health_id': self.hid}, headers=headers)
+        self.assertEqual(res.status_code, 200)
+        return res
+
+    def test_gzip_when_accepted(self):
+        plain = self.patient()
+        self.assertNotIn('Content-Encoding', plain.headers)
+        self.assertIn('Accept-Encoding', plain.headers['Vary'])
+
+        res = self.patient(**{'Accept-Encoding': 'gzip, deflate'})
+        self.assertEqual(res.headers['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', res.headers['Vary'])
+        self.assertLess(int(res.headers['Content-Length']), int(plain.headers['Content-Length']))
+        self.assertEqual(json.loads(gzip.decompress(res.get_data())), plain.json)
+
+    def test_small_and_streamed_bodies_are_left_alone(self):
+        res = self.client.post('/login', json={'phone': 'nobody'}, headers={'Accept-Encoding': 'gzip'})
+        self.assertNotIn('Content-Encoding', res.headers)
+
+        with self.client.session_transaction() as sess:
+            sess['role'] = 'admin'
+        res = self.client.get('/admin/export', query_string={'format': 'jsonl'}, headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(res.status_code, 200)
+        self.assertNotIn('Content-Encoding', res.headers)
+
+    @unittest.skipIf(responses.brotli is None, 'brotli not installed')
+    def test_brotli_preferred(self):
+        res = self.patient(**{'Accept-Encoding': 'gzip, br'})
+        self.assertEqual(res.headers['Content-Encoding'], 'br')
+        self.assertEqual(json.loads(responses.brotli.decompress(res.get_data())), self.patient().json)
+
+    def test_compressed_etag_is_weak_and_revalidates(self):
+        db = sqlite3.connect(app.config['DATABASE'])
+        user_id = db.execute('SELECT user_id FROM health_ids WHERE health_uuid=?', (self.hid,)).fetchone()[0]
+        db.executemany('INSERT INTO notifications (user_id, message, language) VALUES (?, ?, ?)',
+                       [(user_id, f'Reminder number {i} for your next visit', 'en') for i in range(20)])
+        db.commit()
+        db.close()
+        with self.client.session_transaction() as sess:
+            sess['user_id'] = user_id
+            sess['role'] = 'worker'
+        res = self.client.get('/worker/dashboard', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(res.headers['Content-Encoding'], 'gzip')
+        self.assertTrue(res.headers['ETag'].startswith('W/'))
+        again = self.client.get('/worker/dashboard', headers={'Accept-Encoding': 'gzip',
+                                                              'If-None-Match': res.headers['ETag']})
+        self.assertEqual(again.status_code, 304)
+
+
+class EncoderTestCase(unittest.TestCase):
+    def test_encoders_agree(self):
+        db = sqlite3.connect(':memory:')
+        db.row_factory = sqlite3.Row
+        row = db.execute("SELECT 1 AS id, 'ज्वर' AS diagnosis, NULL AS next_visit").fetchone()
+        payload = {'rows': [row], 'day': date(2030, 1, 2), 'n': 1.5}
+        outputs = {name: dumps(payload) for name, (dumps, _) in responses.ENCODERS.items()}
+        for name, body in outputs.items():
+            self.assertEqual(json.loads(body), {
+                'rows': [{'id': 1, 'diagnosis': 'ज्वर', 'next_visit': None}],
+                'day': 'Wed, 02 Jan 2030 00:00:00 GMT', 'n': 1.5,
+            }, name)
+            self.assertIn('ज्वर'.encode(), body) # UTF-8, not \u escapes
+
+    def test_app_uses_configured_encoder(self):
+        self.assertEqual(app.json.encoder, app.config['JSON_ENCODER'] or responses.best_encoder())
+
+if __name__ == '__main__':
+    unittest.main()
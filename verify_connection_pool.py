@@ -0,0 +1,53 @@
+
+import unittest
+from app import app
+from database import ConnectionPool, get_db, get_pool
+
+class ConnectionPoolTestCase(unittest.TestCase):
+    def test_connection_bound_to_context(self):
+        with app.app_context():
+            db = get_db()
+            self.assertIs(db, get_db())
+            self.assertEqual(db.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+            self.assertEqual(db.execute("PRAGMA synchronous").fetchone()[0], 1) # NORMAL
+
+        # Teardown returns the connection to the pool for the next request
+        with app.app_context():
+            self.assertIs(get_db(), db)
+
+    def test_uncommitted_work_rolled_back_on_release(self):
+        with app.app_context():
+            db = get_db()
+            db.execute("INSERT INTO users (name, role, phone, language) VALUES ('Ghost', 'worker', 'pool-ghost', 'en')")
+
+        with app.app_context():
+            row = get_db().execute("SELECT * FROM users WHERE phone='pool-ghost'").fetchone()
+            self.assertIsNone(row)
+
+    def test_pool_is_bounded(self):
+        pool = get_pool(":memory:", max_size=2)
+        pool.timeout = 0.05
+        a, b = pool.acquire(), pool.acquire()
+        with self.assertRaises(RuntimeError):
+            pool.acquire()
+        pool.release(a)
+        self.assertIs(pool.acquire(), a)
+        pool.release(a)
+        pool.release(b)
+        pool.close()
+
+    def test_close_keeps_checked_out_connections_counted(self):
+        pool = ConnectionPool(":memory:", max_size=2, timeout=0.05)
+        a, b = pool.acquire(), pool.acquire()
+        pool.release(b)
+        pool.close()
+        # a is still checked out, so only one new connection may be opened
+        c = pool.acquire()
+        with self.assertRaises(RuntimeError):
+            pool.acquire()
+        pool.release(a)
+        pool.release(c)
+        pool.close()
+
+if __name__ == '__main__':
+    unittest.main()
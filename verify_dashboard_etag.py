@@ -0,0 +1,46 @@
+
+import unittest
+import uuid
+from app import app
+
+class DashboardETagTestCase(unittest.TestCase):
+    def setUp(self):
+        self.ctx = app.app_context()
+        self.ctx.push()
+        self.client = app.test_client()
+
+        self.phone = str(uuid.uuid4())[:10]
+        self.hid = self.client.post('/signup', json={
+            'name': 'Polling Worker', 'phone': self.phone, 'role': 'worker'
+        }).json['health_id']
+
+    def tearDown(self):
+        self.ctx.pop()
+
+    def test_not_modified_until_new_record(self):
+        res = self.client.get('/worker/dashboard')
+        self.assertEqual(res.status_code, 200)
+        etag = res.headers['ETag']
+
+        res_304 = self.client.get('/worker/dashboard', headers={'If-None-Match': etag})
+        self.assertEqual(res_304.status_code, 304)
+        self.assertEqual(res_304.data, b'')
+
+        # Different page -> different representation
+        res_page = self.client.get('/worker/dashboard?limit=1', headers={'If-None-Match': etag})
+        self.assertEqual(res_page.status_code, 200)
+
+        # A doctor adds a record with a follow-up; the tag must change
+        with self.client.session_transaction() as sess:
+            sess['user_id'] = 999
+            sess['role'] = 'doctor'
+        self.client.post('/doctor/add_record', json={'health_id': self.hid, 'next_visit': '2030-02-02'})
+        self.client.post('/login', json={'phone': self.phone})
+
+        res_new = self.client.get('/worker/dashboard', headers={'If-None-Match': etag})
+        self.assertEqual(res_new.status_code, 200)
+        self.assertNotEqual(res_new.headers['ETag'], etag)
+        self.assertEqual(len(res_new.json['notifications']), 1)
+
+if __name__ == '__main__':
+    unittest.main()
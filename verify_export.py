@@ -0,0 +1,95 @@
+import csv
+import gzip
+import io
+import json
+import unittest
+import uuid
+from datetime import date, timedelta
+import export
+from app import app
+from database import get_db
+
+class ExportTestCase(unittest.TestCase):
+    def setUp(self):
+        self.ctx = app.app_context()
+        self.ctx.push()
+        self.client = app.test_client()
+        self.tag = 'export-' + uuid.uuid4().hex[:8]
+
+        hid = self.client.post('/signup', json={
+            'name': 'Export Worker', 'phone': str(uuid.uuid4())[:10], 'role': 'worker'
+        }).json['health_id']
+        self.as_role('doctor')
+        for i in range(3):
+            self.client.post('/doctor/add_record', json={
+                'health_id': hid, 'diagnosis': f'{self.tag} {i}', 'remarks': 'line,with "quotes"\nand newline'
+            })
+        self.as_role('admin')
+        self.today = date.today().isoformat()
+
+    def tearDown(self):
+        self.ctx.pop()
+
+    def as_role(self, role):
+        with self.client.session_transaction() as sess:
+            sess['user_id'] = 999
+            sess['role'] = role
+
+    def get(self, **params):
+        res = self.client.get('/admin/export', query_string={'from': self.today, 'to': self.today, **params})
+        self.assertEqual(res.status_code, 200)
+        return res
+
+    def mine(self, rows):
+        return [r for r in rows if str(r['diagnosis']).startswith(self.tag)]
+
+    def test_csv(self):
+        res = self.get(format='csv')
+        self.assertIn('records.csv', res.headers['Content-Disposition'])
+        rows = self.mine(list(csv.DictReader(io.StringIO(res.get_data(as_text=True)))))
+        self.assertEqual([r['diagnosis'] for r in rows], [f'{self.tag} {i}' for i in range(3)])
+        self.assertEqual(rows[0]['remarks'], 'line,with "quotes"\nand newline')
+
+    def test_jsonl_and_columnar_agree(self):
+        lines = self.get(format='jsonl').get_data(as_text=True).splitlines()
+        as_rows = self.mine([json.loads(l) for l in lines])
+
+        lines = self.get(format='columnar').get_data(as_text=True).splitlines()
+        header = json.loads(lines[0])
+        self.assertEqual(header['columns'], export.COLUMNS)
+        from_columns = []
+        for line in lines[1:]:
+            block = json.loads(line)
+            from_columns += [dict(zip(header['columns'], r)) for r in zip(*block['data'])]
+            self.assertEqual(block['rows'], len(block['data'][0]))
+        self.assertEqual(self.mine(from_columns), as_rows)
+        self.assertEqual(len(as_rows), 3)
+
+    def test_gzip(self):
+        res = self.get(format='jsonl', gzip='1')
+        self.assertEqual(res.mimetype, 'application/gzip')
+        rows = [json.loads(l) for l in gzip.decompress(res.get_data()).decode().splitlines()]
+        self.assertEqual(len(self.mine(rows)), 3)
+
+    def test_date_range(self):
+        tomorrow = (date.today() + timedelta(days=1)).isoformat()
+        res = self.get(format='jsonl', **{'from': tomorrow, 'to': tomorrow})
+        self.assertEqual(res.get_data(), b'')
+        self.assertEqual(self.client.get('/admin/export?from=yesterday').status_code, 400)
+        self.assertEqual(self.client.get('/admin/export?format=xml').status_code, 400)
+
+    def test_chunks_are_bounded_and_use_the_index(self):
+        chunks = list(export.iter_chunks(get_db(), self.today, self.today, chunk_size=2))
+        self.assertTrue(all(len(c) <= 2 for c in chunks))
+        plan = ' '.join(r[3] for r in get_db().execute(
+            "EXPLAIN QUERY PLAN SELECT id FROM medical_records WHERE created_at >= ? ORDER BY created_at, id",
+            (self.today,)))
+        self.assertIn('idx_records_created_id', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_admin_only(self):
+        self.as_role('doctor')
+        self.assertEqual(self.client.get('/admin/export').status_code, 403)
+
+if __name__ == '__main__':
+    unittest.main()
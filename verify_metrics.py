@@ -0,0 +1,80 @@
+
+import unittest
+import os
+import shutil
+import tempfile
+import uuid
+import metrics
+from app import app
+from database import get_db
+
+class MetricsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.ctx = app.app_context()
+        self.ctx.push()
+        self.client = app.test_client()
+
+    def tearDown(self):
+        self.ctx.pop()
+
+    def test_fingerprint(self):
+        self.assertEqual(
+            metrics.fingerprint("SELECT *  FROM users\n WHERE phone='123' AND id IN (?, ?, ?) LIMIT 10"),
+            "SELECT * FROM users WHERE phone=? AND id IN (?) LIMIT ?"
+        )
+
+    def test_request_and_query_metrics(self):
+        phone = str(uuid.uuid4())[:10]
+        # Signup checks the phone inside its writer transaction
+        signup_query = 'SELECT ? FROM users WHERE phone=?'
+        checks_before = metrics.query_seconds.count(signup_query)
+        self.client.post('/signup', json={'name': 'Metric Worker', 'phone': phone, 'role': 'worker'})
+        self.assertEqual(metrics.query_seconds.count(signup_query), checks_before + 1)
+        # /login looks the (now existing) user up, so its query returns a row
+        query = 'SELECT * FROM users WHERE phone=?'
+        rows_before = metrics.rows_returned.value(query)
+        self.assertEqual(self.client.post('/login', json={'phone': phone}).status_code, 200)
+        self.assertEqual(metrics.rows_returned.value(query), rows_before + 1)
+
+        before = metrics.request_seconds.count('/worker/dashboard', 'GET', 200)
+        self.client.get('/worker/dashboard')
+        self.assertEqual(metrics.request_seconds.count('/worker/dashboard', 'GET', 200), before + 1)
+
+        text = self.client.get('/metrics').data.decode()
+        self.assertIn('http_request_duration_seconds_bucket{endpoint="/worker/dashboard",method="GET",status="200",le="+Inf"}', text)
+        self.assertIn(f'db_query_duration_seconds_count{{query="{query}"}}', text)
+        self.assertIn(f'db_rows_returned_total{{query="{query}"}}', text)
+        self.assertIn('patient_cache{stat="hits"}', text)
+
+    def test_slow_query_logged(self):
+        old = metrics.SLOW_QUERY_SECONDS
+        metrics.SLOW_QUERY_SECONDS = 0
+        try:
+            with self.assertLogs('metrics', 'WARNING') as logs:
+                get_db().execute("SELECT 1 AS slow_probe").fetchall()
+        finally:
+            metrics.SLOW_QUERY_SECONDS = old
+        self.assertIn('slow_probe', logs.output[0])
+        self.assertGreaterEqual(metrics.slow_queries.value('SELECT ? AS slow_probe'), 1)
+
+    def test_profile_dump(self):
+        out = tempfile.mkdtemp()
+        app.config.update(PROFILE_ENABLED=True, PROFILE_DIR=out, PROFILE_INTERVAL=0.001)
+        try:
+            # Sampling is per request and only when asked for
+            res = self.client.get('/i18n/manifest.json')
+            self.assertNotIn('X-Profile-File', res.headers)
+
+            app.config['PROFILE_INTERVAL'] = 0.0001
+            res = self.client.post('/admin/qr_sheet', headers={'X-Profile': '1'}, json={})
+            name = res.headers['X-Profile-File']
+            with open(os.path.join(out, name)) as f:
+                for line in f:
+                    stack, count = line.rsplit(' ', 1)
+                    self.assertTrue(int(count) > 0)
+        finally:
+            app.config.update(PROFILE_ENABLED=False, PROFILE_DIR='profiles', PROFILE_INTERVAL=0.005)
+            shutil.rmtree(out)
+
+if __name__ == '__main__':
+    unittest.main()
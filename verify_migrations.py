@@ -0,0 +1,65 @@
+
+import unittest
+import os
+import sqlite3
+import tempfile
+import migrations
+from database import connect
+
+class MigrationsTestCase(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        self.db = connect(self.path)
+
+    def tearDown(self):
+        self.db.close()
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(self.path + suffix):
+                os.remove(self.path + suffix)
+
+    def index_names(self):
+        rows = self.db.execute("SELECT name FROM sqlite_master WHERE type='index'").fetchall()
+        return {r[0] for r in rows}
+
+    def test_fresh_database_reaches_current_version(self):
+        applied = migrations.migrate(self.db)
+        self.assertEqual(applied, [v for v, _ in migrations.MIGRATIONS])
+        self.assertEqual(migrations.current_version(self.db), migrations.SCHEMA_VERSION)
+        self.assertTrue({'idx_records_hid_created_id', 'idx_users_phone',
+                         'idx_health_ids_user', 'idx_notifications_user_read', 'idx_notifications_user_id'} <= self.index_names())
+
+        # Second run is a no-op
+        self.assertEqual(migrations.migrate(self.db), [])
+
+    def test_phone_is_unique(self):
+        migrations.migrate(self.db)
+        self.db.execute("INSERT INTO users (name, role, phone) VALUES ('A', 'worker', '555')")
+        with self.assertRaises(sqlite3.IntegrityError):
+            self.db.execute("INSERT INTO users (name, role, phone) VALUES ('B', 'worker', '555')")
+
+    def test_legacy_database_with_duplicate_phones(self):
+        # Pre-migration layout: report columns missing, duplicate phones present
+        self.db.execute("CREATE TABLE users (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT, role TEXT, phone TEXT, language TEXT)")
+        self.db.execute("CREATE TABLE medical_records (id INTEGER PRIMARY KEY AUTOINCREMENT, health_uuid TEXT, diagnosis TEXT, prescription TEXT, next_visit DATE, doctor_id INTEGER, created_at TEXT)")
+        self.db.execute("INSERT INTO users (phone) VALUES ('111')")
+        self.db.execute("INSERT INTO users (phone) VALUES ('111')")
+        self.db.commit()
+
+        migrations.migrate(self.db)
+        cols = {r[1] for r in self.db.execute("PRAGMA table_info(medical_records)")}
+        self.assertIn('allergies', cols)
+        self.assertIn('idx_users_phone', self.index_names())
+
+    def test_hot_lookups_use_indexes(self):
+        migrations.migrate(self.db)
+        plan = self.db.execute("""
+            EXPLAIN QUERY PLAN
+            SELECT * FROM medical_records WHERE health_uuid=? ORDER BY created_at DESC, id DESC LIMIT 10
+        """, ('HID-x',)).fetchall()
+        detail = " ".join(r[3] for r in plan)
+        self.assertIn('idx_records_hid_created_id', detail)
+        self.assertNotIn('TEMP B-TREE', detail)
+
+if __name__ == '__main__':
+    unittest.main()
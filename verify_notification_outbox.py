@@ -0,0 +1,114 @@
+
+import unittest
+import os
+import tempfile
+import time
+import uuid
+import migrations
+import outbox
+from app import app
+from database import DB, connect
+
+class FakeSMSSink:
+    """Local stand-in for an SMS gateway; can be told to fail or be slow."""
+    def __init__(self, failures=0, delay=0):
+        self.sent = []
+        self.failures = failures
+        self.delay = delay
+
+    def send(self, recipient, message):
+        time.sleep(self.delay)
+        if self.failures:
+            self.failures -= 1
+            raise IOError("gateway unavailable")
+        self.sent.append((recipient, message))
+
+class OutboxRouteTestCase(unittest.TestCase):
+    def setUp(self):
+        self.ctx = app.app_context()
+        self.ctx.push()
+        self.client = app.test_client()
+
+    def tearDown(self):
+        self.ctx.pop()
+
+    def test_add_record_queues_instead_of_sending(self):
+        phone = str(uuid.uuid4())[:10]
+        hid = self.client.post('/signup', json={
+            'name': 'SMS Worker', 'phone': phone, 'role': 'worker', 'language': 'hi'
+        }).json['health_id']
+        with self.client.session_transaction() as sess:
+            sess['user_id'] = 999
+            sess['role'] = 'doctor'
+
+        sink = FakeSMSSink(delay=0.5)
+        started = time.monotonic()
+        res = self.client.post('/doctor/add_record', json={'health_id': hid, 'next_visit': '2030-03-03'})
+        self.assertEqual(res.status_code, 200)
+        self.assertLess(time.monotonic() - started, 0.5) # slow gateway not on the request path
+        self.assertEqual(sink.sent, [])
+
+        sink.delay = 0
+        outbox.Dispatcher(DB, sink=sink).drain()
+        mine = [m for r, m in sink.sent if r == phone]
+        self.assertEqual(len(mine), 1)
+        self.assertIn('2030-03-03', mine[0])
+
+class DispatcherTestCase(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        self.db = connect(self.path)
+        migrations.migrate(self.db)
+
+    def tearDown(self):
+        self.db.close()
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(self.path + suffix):
+                os.remove(self.path + suffix)
+
+    def status(self):
+        return self.db.execute("SELECT status, attempts, next_attempt_at FROM notification_outbox").fetchone()
+
+    def test_retry_with_backoff_then_deliver(self):
+        outbox.enqueue(self.db, 1, 1, '555', 'hello')
+        self.db.commit()
+        sink = FakeSMSSink(failures=2)
+        d = outbox.Dispatcher(self.path, sink=sink, backoff=10)
+
+        now = time.time()
+        self.assertEqual(d.run_once(now), (0, 1))
+        status, attempts, due = self.status()
+        self.assertEqual((status, attempts), ('pending', 1))
+        self.assertAlmostEqual(due, now + 10, delta=1)
+
+        self.assertEqual(d.run_once(now + 5), (0, 0)) # not due yet
+        self.assertEqual(d.run_once(now + 11), (0, 1))
+        self.assertAlmostEqual(self.status()[2], now + 11 + 20, delta=1)
+        self.assertEqual(d.run_once(now + 40), (1, 0))
+        self.assertEqual(self.status()[:2], ('sent', 3))
+        self.assertEqual(sink.sent, [('555', 'hello')])
+
+    def test_gives_up_after_max_attempts(self):
+        outbox.enqueue(self.db, 1, 1, '555', 'hello')
+        self.db.commit()
+        d = outbox.Dispatcher(self.path, sink=FakeSMSSink(failures=99), max_attempts=2, backoff=0)
+        d.run_once()
+        d.run_once()
+        self.assertEqual(self.status()[:2], ('failed', 2))
+
+    def test_background_thread(self):
+        for i in range(3):
+            outbox.enqueue(self.db, i, 1, '555', f'msg {i}')
+        self.db.commit()
+        sink = FakeSMSSink()
+        d = outbox.Dispatcher(self.path, sink=sink, interval=0.01)
+        d.start()
+        deadline = time.monotonic() + 5
+        while len(sink.sent) < 3 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        d.stop()
+        self.assertEqual(len(sink.sent), 3)
+
+if __name__ == '__main__':
+    unittest.main()
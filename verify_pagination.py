@@ -0,0 +1,77 @@
+
+import unittest
+import uuid
+from app import app
+from pagination import encode_cursor
+
+class PaginationTestCase(unittest.TestCase):
+    def setUp(self):
+        self.ctx = app.app_context()
+        self.ctx.push()
+        self.client = app.test_client()
+
+        self.phone = str(uuid.uuid4())[:10]
+        self.hid = self.client.post('/signup', json={
+            'name': 'Long Term Worker', 'phone': self.phone, 'role': 'worker'
+        }).json['health_id']
+
+        self.as_doctor()
+        for i in range(5):
+            self.client.post('/doctor/add_record', json={
+                'health_id': self.hid,
+                'diagnosis': f'Visit {i}',
+                'next_visit': '2030-01-0%d' % (i + 1)
+            })
+
+    def tearDown(self):
+        self.ctx.pop()
+
+    def as_doctor(self):
+        with self.client.session_transaction() as sess:
+            sess['user_id'] = 999
+            sess['role'] = 'doctor'
+
+    def test_history_pages(self):
+        seen = []
+        cursor = None
+        while True:
+            res = self.client.post('/doctor/get_patient', json={
+                'health_id': self.hid, 'limit': 2, 'cursor': cursor
+            })
+            self.assertEqual(res.status_code, 200)
+            self.assertLessEqual(len(res.json['history']), 2)
+            seen += [h['diagnosis'] for h in res.json['history']]
+            cursor = res.json['next_cursor']
+            if not cursor:
+                break
+        self.assertEqual(seen, ['Visit 4', 'Visit 3', 'Visit 2', 'Visit 1', 'Visit 0'])
+
+        # Default page still returns everything that fits, with no cursor
+        res = self.client.post('/doctor/get_patient', json={'health_id': self.hid})
+        self.assertEqual(len(res.json['history']), 5)
+        self.assertIsNone(res.json['next_cursor'])
+
+    def test_notification_pages(self):
+        self.client.post('/login', json={'phone': self.phone})
+        res = self.client.get('/worker/dashboard?limit=3')
+        first = res.json['notifications']
+        self.assertEqual(len(first), 3)
+        self.assertIn('2030-01-05', first[0]['message'])
+
+        res = self.client.get('/worker/dashboard?limit=3&cursor=' + res.json['next_cursor'])
+        rest = res.json['notifications']
+        self.assertEqual(len(rest), 2)
+        self.assertIsNone(res.json['next_cursor'])
+        self.assertTrue(first[-1]['id'] > rest[0]['id'])
+
+    def test_bad_cursor(self):
+        res = self.client.post('/doctor/get_patient', json={'health_id': self.hid, 'cursor': 'garbage'})
+        self.assertEqual(res.status_code, 400)
+        # A notifications cursor can't be replayed against history
+        res = self.client.post('/doctor/get_patient', json={
+            'health_id': self.hid, 'cursor': encode_cursor('notifications', [1])
+        })
+        self.assertEqual(res.status_code, 400)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+
+import pickle
+import unittest
+import uuid
+import app as app_module
+from app import app
+from cache import CacheBackend, LocalCache
+
+class FakeBackend(CacheBackend):
+    """Stands in for an external cache; records every call."""
+    def __init__(self):
+        self.data = {}
+        self.calls = []
+
+    def get(self, key):
+        self.calls.append(('get', key))
+        return self.data.get(key)
+
+    def set(self, key, value):
+        self.calls.append(('set', key))
+        self.data[key] = value
+
+    def delete(self, key):
+        self.calls.append(('delete', key))
+        self.data.pop(key, None)
+
+class PatientCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.ctx = app.app_context()
+        self.ctx.push()
+        self.client = app.test_client()
+        self.original = app_module.patient_cache
+
+        phone = str(uuid.uuid4())[:10]
+        self.hid = self.client.post('/signup', json={
+            'name': 'Cached Patient', 'phone': phone, 'role': 'worker'
+        }).json['health_id']
+        with self.client.session_transaction() as sess:
+            sess['user_id'] = 999
+            sess['role'] = 'doctor'
+
+    def tearDown(self):
+        app_module.patient_cache = self.original
+        self.ctx.pop()
+
+    def fetch(self):
+        return self.client.post('/doctor/get_patient', json={'health_id': self.hid})
+
+    def test_hits_and_invalidation(self):
+        app_module.patient_cache = LocalCache()
+        self.fetch()
+        self.fetch()
+        stats = app_module.patient_cache.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+
+        self.client.post('/doctor/add_record', json={'health_id': self.hid, 'diagnosis': 'Flu'})
+        res = self.fetch()
+        self.assertEqual(res.json['history'][0]['diagnosis'], 'Flu')
+        self.assertEqual(app_module.patient_cache.stats()['invalidations'], 1)
+
+    def test_pluggable_backend(self):
+        fake = app_module.patient_cache = FakeBackend()
+        self.fetch()
+        self.fetch()
+        self.assertEqual(fake.calls, [('get', self.hid), ('set', self.hid), ('get', self.hid)])
+        self.client.post('/doctor/add_record', json={'health_id': self.hid})
+        self.assertIn(('delete', self.hid), fake.calls)
+        self.assertNotIn(self.hid, fake.data)
+
+    def test_cached_payload_pickles(self):
+        fake = app_module.patient_cache = FakeBackend()
+        self.client.post('/doctor/add_record', json={'health_id': self.hid, 'diagnosis': 'Flu'})
+        first = self.fetch().json
+        cached = pickle.loads(pickle.dumps(fake.data[self.hid]))
+        self.assertEqual(cached['history'][0]['diagnosis'], 'Flu')
+        self.assertEqual(self.fetch().json, first)
+
+    def test_unknown_patient_not_cached(self):
+        app_module.patient_cache = LocalCache()
+        res = self.client.post('/doctor/get_patient', json={'health_id': 'HID-unknown'})
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(app_module.patient_cache.stats()['size'], 0)
+
+class LocalCacheTestCase(unittest.TestCase):
+    def test_ttl_and_lru(self):
+        now = [0]
+        c = LocalCache(max_entries=2, ttl=10, clock=lambda: now[0])
+        c.set('a', 1)
+        c.set('b', 2)
+        c.get('a')
+        c.set('c', 3) # evicts b, the least recently used
+        self.assertIsNone(c.get('b'))
+        self.assertEqual(c.get('a'), 1)
+        now[0] = 11
+        self.assertIsNone(c.get('a'))
+        stats = c.stats()
+        self.assertEqual((stats['evictions'], stats['expirations']), (1, 1))
+
+    def test_load_racing_invalidation_is_not_stored(self):
+        c = LocalCache()
+        def stale_loader():
+            c.delete('k') # a write lands while we are reading
+            return 'old'
+        self.assertEqual(c.get_or_load('k', stale_loader), 'old')
+        self.assertIsNone(c.get('k'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+
+import unittest
+import shutil
+import tempfile
+import uuid
+import app as app_module
+from app import app
+
+class QRCodeTestCase(unittest.TestCase):
+    def setUp(self):
+        self.ctx = app.app_context()
+        self.ctx.push()
+        self.client = app.test_client()
+        self.cache_dir = tempfile.mkdtemp()
+        app_module.qr_cache.directory = self.cache_dir
+        app_module.qr_cache._entries.clear()
+
+        phone = str(uuid.uuid4())[:10]
+        self.hid = self.client.post('/signup', json={
+            'name': 'QR Worker', 'phone': phone, 'role': 'worker'
+        }).json['health_id']
+
+    def tearDown(self):
+        self.ctx.pop()
+        shutil.rmtree(self.cache_dir)
+
+    def test_create_app_applies_cache_settings(self):
+        saved = {k: app.config[k] for k in ('QR_CACHE_DIR', 'QR_CACHE_SIZE')}
+        try:
+            app_module.create_app({'QR_CACHE_DIR': self.cache_dir, 'QR_CACHE_SIZE': 7})
+            self.assertEqual((app_module.qr_cache.directory, app_module.qr_cache.max_entries), (self.cache_dir, 7))
+        finally:
+            app_module.create_app(saved)
+
+    def login(self, role, user_id=999):
+        with self.client.session_transaction() as sess:
+            sess['user_id'] = user_id
+            sess['role'] = role
+
+    def test_png_is_cached_and_conditional(self):
+        self.login('doctor')
+        res = self.client.get(f'/health_id/{self.hid}/qr.png')
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.mimetype, 'image/png')
+        self.assertTrue(res.data.startswith(b'\x89PNG'))
+        self.assertIn('immutable', res.headers['Cache-Control'])
+        etag = res.headers['ETag']
+
+        # Served from the disk cache after the memory cache is dropped
+        app_module.qr_cache._entries.clear()
+        self.assertEqual(app_module.qr_cache.lookup(self.hid), res.data)
+
+        res_304 = self.client.get(f'/health_id/{self.hid}/qr.png', headers={'If-None-Match': etag})
+        self.assertEqual(res_304.status_code, 304)
+        self.assertEqual(res_304.data, b'')
+
+    def test_svg(self):
+        self.login('admin', 1)
+        res = self.client.get(f'/health_id/{self.hid}/qr.svg')
+        self.assertEqual(res.status_code, 200)
+        self.assertIn(b'<svg', res.data)
+
+    def test_access_rules(self):
+        self.login('doctor')
+        self.assertEqual(self.client.get('/health_id/HID-missing/qr.png').status_code, 404)
+        self.assertEqual(self.client.get(f'/health_id/{self.hid}/qr.gif').status_code, 404)
+        # The worker who just signed up owns this code; another worker does not
+        self.login('worker', user_id=-1)
+        self.assertEqual(self.client.get(f'/health_id/{self.hid}/qr.png').status_code, 403)
+
+    def test_print_sheet(self):
+        phone = str(uuid.uuid4())[:10]
+        hid2 = self.client.post('/signup', json={
+            'name': 'QR Worker 2', 'phone': phone, 'role': 'worker'
+        }).json['health_id']
+        self.login('admin', 1)
+        res = self.client.post('/admin/qr_sheet', json={'health_ids': [self.hid, hid2]})
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(res.data.startswith(b'%PDF'))
+        self.assertIsNotNone(app_module.qr_cache.lookup(hid2))
+
+        res = self.client.post('/admin/qr_sheet', json={'health_ids': [self.hid, 'HID-nope']})
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(res.json['health_ids'], ['HID-nope'])
+
+        for bad in ([[1]], [self.hid, {'id': 1}], [7]):
+            self.assertEqual(self.client.post('/admin/qr_sheet', json={'health_ids': bad}).status_code, 400)
+
+if __name__ == '__main__':
+    unittest.main()
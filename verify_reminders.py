@@ -0,0 +1,81 @@
+
+import unittest
+import os
+import tempfile
+from datetime import date
+import migrations
+import reminders
+from app import get_reminder_message as get_message
+from database import connect
+
+TODAY = date(2030, 6, 10)
+
+class ReminderSweepTestCase(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        self.db = connect(self.path)
+        migrations.migrate(self.db)
+
+        # One worker per visit date, alternating languages
+        visits = ['2030-06-11', '2030-06-12', '2030-06-13', '2030-06-14', '2030-06-13', '']
+        for i, visit in enumerate(visits):
+            lang = ['en', 'ta'][i % 2]
+            uid = self.db.execute("INSERT INTO users (name, role, phone, language) VALUES (?, 'worker', ?, ?)",
+                                  (f'W{i}', f'900{i}', lang)).lastrowid
+            self.db.execute("INSERT INTO health_ids (user_id, health_uuid) VALUES (?, ?)", (uid, f'HID-{i}'))
+            self.db.execute("INSERT INTO medical_records (health_uuid, next_visit) VALUES (?, ?)", (f'HID-{i}', visit))
+        self.db.commit()
+
+    def tearDown(self):
+        self.db.close()
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(self.path + suffix):
+                os.remove(self.path + suffix)
+
+    def kinds(self):
+        return sorted(self.db.execute("SELECT record_id, kind FROM visit_reminders").fetchall(), key=tuple)
+
+    def test_windows(self):
+        self.assertEqual(list(reminders.windows(TODAY)), [
+            ('T-1', '2030-06-11', '2030-06-11'),
+            ('T-3', '2030-06-12', '2030-06-13'),
+        ])
+
+    def test_sweep_dedupes_and_batches(self):
+        created = reminders.sweep(self.db, get_message, TODAY, batch_size=1)
+        self.assertEqual(created, 4) # 06-11 (T-1), 06-12 and both 06-13 (T-3)
+        self.assertEqual([tuple(r) for r in self.kinds()], [(1, 'T-1'), (2, 'T-3'), (3, 'T-3'), (5, 'T-3')])
+
+        # Running again the same day sends nothing new
+        self.assertEqual(reminders.sweep(self.db, get_message, TODAY), 0)
+
+        # Two days later the 06-13 visits get their T-1 (T-3 is not repeated)
+        # and the 06-14 visit enters the T-3 window
+        created = reminders.sweep(self.db, get_message, date(2030, 6, 12))
+        self.assertEqual(created, 3)
+        self.assertIn((4, 'T-3'), [tuple(r) for r in self.kinds()])
+
+        queued = self.db.execute("SELECT COUNT(*) FROM notification_outbox").fetchone()[0]
+        self.assertEqual(queued, 7)
+
+    def test_superseded_visits_are_skipped(self):
+        # HID-0 came back and was rescheduled; HID-1 came back with no follow-up
+        self.db.execute("UPDATE medical_records SET created_at = '2030-05-01T09:00:00'")
+        self.db.executemany("INSERT INTO medical_records (health_uuid, next_visit, created_at) VALUES (?, ?, ?)",
+                            [('HID-0', '2030-07-01', '2030-06-08T09:00:00'), ('HID-1', '', '2030-06-09T09:00:00')])
+        self.db.commit()
+        self.assertEqual(reminders.sweep(self.db, get_message, TODAY), 2)
+        self.assertEqual([tuple(r) for r in self.kinds()], [(3, 'T-3'), (5, 'T-3')])
+
+    def test_localized_text(self):
+        reminders.sweep(self.db, get_message, TODAY)
+        msg = self.db.execute("""
+            SELECT message FROM notifications JOIN users ON users.id = notifications.user_id
+            WHERE users.phone = '9001'
+        """).fetchone()[0]
+        self.assertEqual(msg, get_message('ta', '2030-06-12', 2))
+        self.assertIn('2030-06-12', msg)
+
+if __name__ == '__main__':
+    unittest.main()
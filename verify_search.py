@@ -0,0 +1,92 @@
+import unittest
+import uuid
+from app import app
+from search import match_expression
+
+class SearchTestCase(unittest.TestCase):
+    def setUp(self):
+        self.ctx = app.app_context()
+        self.ctx.push()
+        self.client = app.test_client()
+        self.tag = 'zq' + uuid.uuid4().hex[:8]
+
+        self.hid = self.client.post('/signup', json={
+            'name': 'Search Worker', 'phone': str(uuid.uuid4())[:10], 'role': 'worker'
+        }).json['health_id']
+        self.as_role('doctor')
+
+    def tearDown(self):
+        self.ctx.pop()
+
+    def as_role(self, role):
+        with self.client.session_transaction() as sess:
+            sess['user_id'] = 999
+            sess['role'] = role
+
+    def add(self, **fields):
+        self.client.post('/doctor/add_record', json={'health_id': self.hid, **fields})
+
+    def find(self, q, **params):
+        res = self.client.get('/doctor/search', query_string={'q': q, **params})
+        self.assertEqual(res.status_code, 200)
+        return res.json
+
+    def test_prefix_and_ranking(self):
+        self.add(diagnosis='Cough', remarks=f'{self.tag}penicillin mentioned in passing')
+        self.add(diagnosis='Rash', allergies=f'{self.tag}penicillin')
+        res = self.find(f'{self.tag}peni')
+        self.assertEqual([r['diagnosis'] for r in res['results']], ['Rash', 'Cough'])
+        self.assertIn('[', res['results'][0]['snippet'])
+        self.assertEqual(res['results'][0]['health_uuid'], self.hid)
+
+        # All terms must match
+        self.assertEqual(len(self.find(f'{self.tag}peni rash')['results']), 1)
+
+    def test_tamil_and_hindi_words_stay_whole(self):
+        self.add(diagnosis=f'{self.tag} ஒவ்வாமை', allergies='பென்சிலின்')
+        self.add(diagnosis=f'{self.tag} बुखार', prescription='पेनिसिलिन')
+        self.assertEqual(len(self.find(f'{self.tag} பென்சி')['results']), 1)
+        self.assertEqual(len(self.find(f'{self.tag} पेनि')['results']), 1)
+        # A lone consonant must not match every word sharing it
+        self.assertEqual(len(self.find(f'{self.tag} ப')['results']), 1)
+        self.assertEqual(len(self.find(f'{self.tag} ல')['results']), 0)
+
+    def test_paging(self):
+        for i in range(5):
+            self.add(diagnosis=f'{self.tag} visit {i}')
+        seen, cursor = [], None
+        while True:
+            params = {'limit': 2}
+            if cursor:
+                params['cursor'] = cursor
+            res = self.find(self.tag, **params)
+            seen += [r['id'] for r in res['results']]
+            cursor = res['next_cursor']
+            if not cursor:
+                break
+        self.assertEqual(len(seen), 5)
+        self.assertEqual(len(set(seen)), 5)
+
+    def test_updates_reach_the_index(self):
+        from database import get_db
+        self.add(diagnosis=f'{self.tag}old')
+        db = get_db()
+        db.execute("UPDATE medical_records SET diagnosis=? WHERE diagnosis=?", (f'{self.tag}new', f'{self.tag}old'))
+        db.commit()
+        self.assertEqual(self.find(f'{self.tag}old')['results'], [])
+        self.assertEqual(len(self.find(f'{self.tag}new')['results']), 1)
+
+    def test_query_syntax_is_escaped(self):
+        self.assertEqual(match_expression('a" OR b*'), '"a"* "OR"* "b"*')
+        self.assertIsNone(match_expression('  "" * '))
+        self.assertEqual(self.find('"')['results'], [])
+        self.assertEqual(self.find('diagnosis:NEAR(')['results'], self.find('diagnosis NEAR')['results'])
+
+    def test_roles(self):
+        self.as_role('admin')
+        self.assertEqual(self.client.get('/doctor/search?q=x').status_code, 200)
+        self.as_role('worker')
+        self.assertEqual(self.client.get('/doctor/search?q=x').status_code, 403)
+
+if __name__ == '__main__':
+    unittest.main()
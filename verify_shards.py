@@ -0,0 +1,163 @@
+import csv
+import io
+import os
+import shutil
+import tempfile
+import unittest
+import app as app_module
+import archive
+import shards
+from app import app
+from database import connect
+
+class ShardMapTestCase(unittest.TestCase):
+    def test_single_database_owns_everything(self):
+        smap = shards.ShardMap('main.db', [])
+        self.assertEqual(smap.shard_for('HID-anything'), shards.MAIN)
+        self.assertEqual(smap.range(shards.MAIN), (0, shards.SPACE))
+
+    def test_ranges_route_by_hash(self):
+        smap = shards.ShardMap('/data/main.db', [(0, 'main', None), (1 << 31, 'b', 'shards/b.db')])
+        self.assertEqual(smap.paths['b'], '/data/shards/b.db')
+        hids = [f'HID-{i}' for i in range(200)]
+        groups = smap.group(hids)
+        self.assertEqual(sorted(groups), ['b', 'main'])
+        for hid in groups['b']:
+            self.assertGreaterEqual(shards.key_hash(hid), 1 << 31)
+        self.assertEqual(sum(map(len, groups.values())), len(hids))
+
+
+class SplitTestCase(unittest.TestCase):
+    WORKERS = 16
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.saved = {k: app.config[k] for k in ('DATABASE', 'ARCHIVE_DIR')}
+        self.path = os.path.join(self.tmp, 'main.db')
+        app_module.create_app({'DATABASE': self.path, 'ARCHIVE_DIR': os.path.join(self.tmp, 'archive')})
+        self.client = app.test_client()
+        self.hids = [self.client.post('/signup', json={
+            'name': f'Shard Worker {i}', 'phone': f'55500{i:03}', 'role': 'worker'
+        }).json['health_id'] for i in range(self.WORKERS)]
+        self.login(999, 'doctor')
+        for hid in self.hids:
+            res = self.client.post('/doctor/add_record', json={
+                'health_id': hid, 'diagnosis': 'Shardfever', 'next_visit': '2099-01-01'
+            })
+            self.assertEqual(res.status_code, 200)
+
+    def tearDown(self):
+        app_module.stop_background_jobs() # closes the temporary shards' writers
+        shards.reset()
+        app_module.create_app(self.saved)
+        shutil.rmtree(self.tmp)
+
+    def login(self, user_id, role):
+        with self.client.session_transaction() as sess:
+            sess['user_id'] = user_id
+            sess['role'] = role
+
+    def split(self):
+        moved = shards.split(self.path, 'main', 'north', os.path.join(self.tmp, 'shards', 'north.db'))
+        smap = shards.get_map(self.path)
+        self.moved = [h for h in self.hids if smap.shard_for(h) == 'north']
+        self.assertEqual(moved, len(self.moved))
+        self.assertTrue(0 < moved < self.WORKERS)
+        return smap
+
+    def count(self, path, sql, *params):
+        db = connect(path)
+        try:
+            return db.execute(sql, params).fetchone()[0]
+        finally:
+            db.close()
+
+    def test_split_moves_records_and_keeps_the_directory(self):
+        smap = self.split()
+        north = smap.paths['north']
+        self.assertEqual(self.count(north, 'SELECT COUNT(*) FROM medical_records'), len(self.moved))
+        self.assertEqual(self.count(north, 'SELECT COUNT(*) FROM notifications'), len(self.moved))
+        self.assertEqual(self.count(self.path, 'SELECT COUNT(*) FROM medical_records'),
+                         self.WORKERS - len(self.moved))
+        # Main still resolves every worker; login works for moved ones
+        self.assertEqual(self.count(self.path, 'SELECT COUNT(*) FROM health_ids'), self.WORKERS)
+        # Rollups were recounted on both sides
+        self.assertEqual(self.count(north, "SELECT count FROM analytics_counts WHERE metric='records'"),
+                         len(self.moved))
+
+    def test_split_keeps_archived_records_counted(self):
+        db = connect(self.path)
+        try:
+            db.executemany("INSERT INTO medical_records (health_uuid, diagnosis, doctor_id, created_at) VALUES (?, 'Old', 999, '2017-05-01')",
+                           [(hid,) for hid in self.hids])
+            db.commit()
+            archive.archive(db, os.path.join(self.tmp, 'archive'), '2019-01-01')
+        finally:
+            db.close()
+        shards.split(self.path, 'main', 'north', os.path.join(self.tmp, 'shards', 'north.db'),
+                     os.path.join(self.tmp, 'archive'))
+        smap = shards.get_map(self.path)
+        self.moved = [h for h in self.hids if smap.shard_for(h) == 'north']
+        counts = [self.count(smap.paths[name], "SELECT count FROM analytics_counts WHERE metric='records'")
+                  for name in ('main', 'north')]
+        self.assertEqual(counts, [2 * (self.WORKERS - len(self.moved)), 2 * len(self.moved)])
+        # Archived history is still found after the move
+        history = self.client.post('/doctor/get_patient', json={'health_id': self.moved[0], 'limit': 5}).json['history']
+        self.assertEqual([h['diagnosis'] for h in history], ['Shardfever', 'Old'])
+
+    def test_app_reads_and_writes_across_shards(self):
+        smap = self.split()
+        hid = self.moved[0]
+        res = self.client.post('/doctor/add_record', json={'health_id': hid, 'diagnosis': 'Shardfever again'})
+        self.assertEqual(res.status_code, 200)
+        history = self.client.post('/doctor/get_patient', json={'health_id': hid}).json['history']
+        self.assertEqual(history[0]['diagnosis'], 'Shardfever again')
+        res = self.client.post('/doctor/add_records', json={'records': [
+            {'health_id': h, 'diagnosis': 'Batch shardfever'} for h in self.hids[:6]
+        ]})
+        self.assertEqual({r['status'] for r in res.json['results']}, {'created'})
+        self.assertGreaterEqual(self.count(smap.paths['north'], 'SELECT MAX(id) FROM medical_records'),
+                                shards.ID_STRIDE)
+
+        batch = self.client.post('/doctor/get_patients', json={'health_ids': self.hids}).json['patients']
+        self.assertTrue(all(batch[h]['history'] for h in self.hids))
+
+        found = self.client.get('/doctor/search', query_string={'q': 'shardfever', 'limit': 100}).json
+        total = self.WORKERS + 1 + 6
+        self.assertEqual(len(found['results']), total)
+        ids = [r['id'] for r in found['results']]
+        self.assertEqual(len(set(ids)), total)
+
+        synced = self.client.get('/sync', query_string={'limit': 1000}).json
+        self.assertEqual(len(synced['records']['rows']), total)
+        idle = self.client.get('/sync', query_string={'since': synced['token']}).json
+        self.assertNotIn('records', idle)
+
+        self.login(998, 'admin')
+        self.assertEqual(self.client.get('/admin/analytics').json['records'], total)
+        rows = list(csv.reader(io.StringIO(self.client.get('/admin/export').get_data(as_text=True))))[1:]
+        self.assertEqual(len(rows), total)
+        self.assertEqual(rows, sorted(rows, key=lambda r: (r[-1], int(r[0]))))
+
+    def test_moved_worker_dashboard(self):
+        self.split()
+        user_id = self.count(self.path, 'SELECT user_id FROM health_ids WHERE health_uuid=?', self.moved[0])
+        self.login(user_id, 'worker')
+        res = self.client.get('/worker/dashboard').json
+        self.assertEqual(res['health_id'], self.moved[0])
+        self.assertEqual(res['medical_record']['diagnosis'], 'Shardfever')
+        self.assertEqual(len(res['notifications']), 1)
+
+    def test_new_workers_are_placed_on_their_shard(self):
+        smap = self.split()
+        self.login(998, 'admin')
+        hids = [self.client.post('/admin/register_worker', json={
+            'name': f'Late {i}', 'phone': f'55600{i:03}'
+        }).json['health_id'] for i in range(8)]
+        north = [h for h in hids if smap.shard_for(h) == 'north']
+        self.assertEqual(self.count(smap.paths['north'], 'SELECT COUNT(*) FROM health_ids WHERE health_uuid LIKE "HID-%"'),
+                         len(self.moved) + len(north))
+        self.assertEqual(shards.repair(self.path), self.WORKERS + len(hids))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+import unittest
+import uuid
+from app import app
+from database import get_db
+
+class DeltaSyncTestCase(unittest.TestCase):
+    def setUp(self):
+        self.ctx = app.app_context()
+        self.ctx.push()
+        self.client = app.test_client()
+
+        self.phone = str(uuid.uuid4())[:10]
+        self.hid = self.client.post('/signup', json={
+            'name': 'Sync Worker', 'phone': self.phone, 'role': 'worker'
+        }).json['health_id']
+        self.doctor = 800000 + uuid.uuid4().int % 100000
+
+    def tearDown(self):
+        self.ctx.pop()
+
+    def add_record(self, diagnosis, next_visit=None):
+        with self.client.session_transaction() as sess:
+            sess['user_id'] = self.doctor
+            sess['role'] = 'doctor'
+        self.client.post('/doctor/add_record', json={
+            'health_id': self.hid, 'diagnosis': diagnosis, 'next_visit': next_visit
+        })
+
+    def as_worker(self):
+        self.client.post('/login', json={'phone': self.phone})
+
+    def pull(self, token=None, **params):
+        if token:
+            params['since'] = token
+        res = self.client.get('/sync', query_string=params)
+        self.assertEqual(res.status_code, 200)
+        return res.json
+
+    def rows(self, payload, tbl, col):
+        table = payload.get(tbl)
+        if not table:
+            return []
+        i = table['cols'].index(col)
+        return [r[i] for r in table['rows']]
+
+    def test_worker_receives_only_new_changes(self):
+        self.add_record('First', '2030-04-01')
+        self.as_worker()
+        first = self.pull()
+        self.assertEqual(first['health_id'], self.hid)
+        self.assertEqual(self.rows(first, 'records', 'diagnosis'), ['First'])
+        self.assertEqual(len(self.rows(first, 'notifications', 'message')), 1)
+
+        # Nothing changed: just a token back
+        idle = self.pull(first['token'])
+        self.assertNotIn('records', idle)
+        self.assertNotIn('notifications', idle)
+        self.assertEqual(idle['token'], first['token'])
+
+        self.add_record('Second')
+        self.as_worker()
+        delta = self.pull(first['token'])
+        self.assertEqual(self.rows(delta, 'records', 'diagnosis'), ['Second'])
+        self.assertNotIn('notifications', delta)
+
+    def test_updates_and_deletes(self):
+        self.add_record('Visit', '2030-05-01')
+        self.as_worker()
+        token = self.pull()['token']
+
+        db = get_db()
+        db.execute("""
+            UPDATE notifications SET is_read=1
+            WHERE user_id=(SELECT id FROM users WHERE phone=?)
+        """, (self.phone,))
+        db.execute("DELETE FROM medical_records WHERE health_uuid=?", (self.hid,))
+        db.commit()
+
+        delta = self.pull(token)
+        self.assertEqual(self.rows(delta, 'notifications', 'is_read'), [1])
+        self.assertEqual(len(delta['deleted']['records']), 1)
+
+    def test_paging_and_scope(self):
+        for i in range(5):
+            self.add_record(f'Visit {i}')
+        # The doctor sees what they wrote
+        doc = self.pull()
+        self.assertGreaterEqual(len(self.rows(doc, 'records', 'id')), 5)
+
+        self.as_worker()
+        seen, token = [], None
+        while True:
+            page = self.pull(token, limit=2)
+            seen += self.rows(page, 'records', 'diagnosis')
+            token = page['token']
+            if not page['more']:
+                break
+        self.assertEqual(seen, [f'Visit {i}' for i in range(5)])
+
+    def test_bad_token(self):
+        self.as_worker()
+        res = self.client.get('/sync?since=garbage')
+        self.assertEqual(res.status_code, 400)
+
+if __name__ == '__main__':
+    unittest.main()